@@ -0,0 +1,142 @@
+# round trips and latency of the bookmark operations, comparing the legacy
+# users.bookmarks array layout with the per-bookmark collection in Backend
+#
+#   MONGODB_URI=mongodb://localhost:27017/ python benchmarks/bench_backend.py
+#   python benchmarks/bench_backend.py --mongomock   (needs mongomock-motor)
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.backend import Backend, MONGODB_URI  # type: ignore
+
+
+class CountingCollection:
+    # every awaited collection call is one round trip to mongod
+    def __init__(self, collection, counter: list[int]):
+        self.collection = collection
+        self.counter = counter
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.counter[0] += 1
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+class LegacyBackend:
+    # the users.bookmarks array layout Backend used before
+    def __init__(self, users):
+        self.users = users
+
+    async def add_new_user(self, user_id: int):
+        await self.users.update_one(
+            {"_id": user_id}, {"$setOnInsert": {"bookmarks": []}}, upsert=True
+        )
+
+    async def add_new_bookmark(self, user_id: int, manga_link: str, chapter: str):
+        await self.add_new_user(user_id)
+        await self.users.update_one(
+            {"_id": user_id, "bookmarks.link": {"$ne": manga_link}},
+            {"$push": {"bookmarks": {"link": manga_link, "chapter": chapter}}},
+        )
+        await self.users.update_one(
+            {"_id": user_id, "bookmarks.link": manga_link},
+            {"$set": {"bookmarks.$.chapter": chapter}},
+        )
+
+    async def get_bookmarks(self, user_id: int):
+        await self.add_new_user(user_id)
+        user = await self.users.find_one({"_id": user_id}, {"_id": 0, "bookmarks": 1})
+        return user.get("bookmarks", [])
+
+    async def find_bookmark_chapter(self, user_id: int, manga_link: str):
+        await self.add_new_user(user_id)
+        # $elemMatch instead of the original "bookmarks.$" projection,
+        # same result but mongomock only implements this one
+        user = await self.users.find_one(
+            {"_id": user_id, "bookmarks.link": manga_link},
+            {"_id": 0, "bookmarks": {"$elemMatch": {"link": manga_link}}},
+        )
+        if user is not None and len(user["bookmarks"]) != 0:
+            return user["bookmarks"][0]
+        return None
+
+    # the names the current Backend uses
+    find_bookmark = find_bookmark_chapter
+
+
+async def measure(name: str, backend, counter: list[int], users: int, links: int):
+    operations = {
+        "add_new_bookmark": lambda u, l: backend.add_new_bookmark(
+            u, f"/title/{l}", f"/title/{l}/c1"
+        ),
+        "find_bookmark": lambda u, l: backend.find_bookmark(u, f"/title/{l}"),
+        "get_bookmarks": lambda u, l: backend.get_bookmarks(u),
+    }
+    for operation, call in operations.items():
+        counter[0] = 0
+        latencies = []
+        for user_id in range(users):
+            for link in range(links):
+                start = time.perf_counter()
+                await call(user_id, link)
+                latencies.append(time.perf_counter() - start)
+        print(
+            f"{name:>7} {operation:<22}"
+            f" {counter[0] / len(latencies):4.1f} round trips/op"
+            f"  p50 {statistics.median(latencies) * 1000:7.3f} ms"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--bookmarks", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        client = AsyncMongoMockClient()
+    else:
+        import motor.motor_asyncio
+
+        client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
+
+    database = "bench_backend"
+    await client.drop_database(database)
+    try:
+        counter = [0]
+        legacy = LegacyBackend(CountingCollection(client[database]["users"], counter))
+        await measure("legacy", legacy, counter, args.users, args.bookmarks)
+
+        backend = Backend(client)
+        backend.db = client[database]
+        backend.users = backend.db["users"]
+        backend.bookmarks = backend.db["bookmarks"]
+
+        # migrate the legacy arrays written above, then time the new layout
+        start = time.perf_counter()
+        await backend.setup()
+        migrated = await backend.bookmarks.count_documents({})
+        print(f"migrated {migrated} bookmarks in {time.perf_counter() - start:.2f} s")
+
+        backend.bookmarks = CountingCollection(backend.bookmarks, counter)
+        await measure("current", backend, counter, args.users, args.bookmarks)
+    finally:
+        await client.drop_database(database)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+# throughput and peak python memory of downloading --chapters chapters to a .cbz
+# against a local stand-in for MangaPark and its image cdn, first with --fail of the
+# image requests failing, then again to show the second run only fetches what's missing
+#
+#   python benchmarks/bench_download.py [--chapters 5] [--page-height 12000] [--fail 0.1]
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+from aiohttp import web
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_images import generated_page  # type: ignore
+from bench_parsers import load_fixture  # type: ignore
+from utils import downloads, ratelimit, scraper  # type: ignore
+from utils import session as pooled  # type: ignore
+from utils.backend import Backend  # type: ignore
+
+CDN_HOST = "https://s01.mpfiles.org"
+
+
+async def start_stand_in_server(
+    image: bytes, fail: list[float]
+) -> tuple[web.AppRunner, str, list[int]]:
+    # fail[0] is the share of image requests answered with a 404, which isn't retried
+    served = [0]
+    pages: dict[str, str] = {}
+
+    async def html(request: web.Request) -> web.Response:
+        name = "chapter" if request.path.count("/") >= 3 else "manga"
+        if name not in pages:
+            pages[name] = load_fixture(name).replace(CDN_HOST, base_url)
+        return web.Response(text=pages[name], content_type="text/html")
+
+    async def media(request: web.Request) -> web.Response:
+        if random.random() < fail[0]:
+            raise web.HTTPNotFound()
+        served[0] += 1
+        return web.Response(body=image, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/media/{tail:.*}", media)
+    app.router.add_get("/{tail:.*}", html)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    return runner, base_url, served
+
+
+async def timed_download(chapters, archive: Path) -> tuple[float, int, bool]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await downloads.download_chapters(chapters, archive)
+        finished = True
+    except ratelimit.UpstreamError:
+        finished = False
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, finished
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chapters", type=int, default=5)
+    parser.add_argument("--page-height", type=int, default=12000)
+    parser.add_argument("--fail", type=float, default=0.1)
+    args = parser.parse_args()
+
+    random.seed(0)
+    image = generated_page(800, args.page_height)
+    Backend._Backend__instance = Backend(AsyncMongoMockClient())  # type: ignore
+    fail = [args.fail]
+    runner, base_url, served = await start_stand_in_server(image, fail)
+    scraper.MANGAPARK_BASE_URL = base_url
+    ratelimit.HOST_CONFIGS["127.0.0.1"] = ratelimit.HostConfig(
+        rate=10_000, burst=10_000, max_concurrency=64
+    )
+    await pooled.start_session()
+
+    try:
+        page = await scraper.get_manga_page("/title/bench")
+        chapters = list(enumerate(page.chapters[: args.chapters]))
+        with tempfile.TemporaryDirectory() as directory:
+            archive = Path(directory) / "bench.cbz"
+            print(f"page size {len(image) / 1024:.0f} KiB, {args.chapters} chapters\n")
+            print(
+                f"{'run':<10}{'pages':>7}{'seconds':>9}{'MB/s':>7}{'peak MiB':>10}  finished"
+            )
+            for run in ("first", "resumed"):
+                before = served[0]
+                elapsed, peak, finished = await timed_download(chapters, archive)
+                fetched = served[0] - before
+                print(
+                    f"{run:<10}{fetched:>7}{elapsed:>9.2f}"
+                    f"{fetched * len(image) / elapsed / 1e6:>7.1f}"
+                    f"{peak / 1024 / 1024:>10.1f}  {finished}"
+                )
+                fail[0] = 0.0
+            with zipfile.ZipFile(archive) as zip_file:
+                entries = zip_file.infolist()
+            size = sum(entry.file_size for entry in entries)
+            print(f"\narchive has {len(entries)} pages, {size / 1e6:.0f} MB")
+    finally:
+        await pooled.close_session()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
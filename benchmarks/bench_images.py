@@ -0,0 +1,68 @@
+# bytes saved and processing time per page for the image processing stage,
+# over the screenshots in assets/ plus a generated page and webtoon strip
+#
+#   python benchmarks/bench_images.py [--format jpeg] [--quality 80] [--max-width 1200]
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from utils.images import IMAGE_FORMAT, ImageSettings, process_image  # type: ignore
+
+
+def generated_page(width: int, height: int) -> bytes:
+    # line art on a light background, roughly what a scanned page looks like
+    image = Image.effect_noise((width, height), 24).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 40):
+        draw.line((0, y, width, y + 200), fill=(20, 20, 20), width=3)
+    for x in range(0, width, 120):
+        draw.rectangle((x, x, x + 80, x + 60), outline=(0, 0, 0), width=4)
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=95)
+    return output.getvalue()
+
+
+def samples() -> dict[str, bytes]:
+    images = {
+        path.name: path.read_bytes() for path in sorted(ROOT.glob("assets/*.png"))
+    }
+    images["page-2000x3000.jpg"] = generated_page(2000, 3000)
+    images["strip-800x12000.jpg"] = generated_page(800, 12000)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", default=IMAGE_FORMAT, choices=["webp", "jpeg"])
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--max-width", type=int, default=1200)
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    settings = ImageSettings(
+        max_width=args.max_width, format=args.format, quality=args.quality
+    )
+    total_before = total_after = 0
+    for name, data in samples().items():
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            processed, _ = process_image(data, settings)
+        per_page = (time.perf_counter() - start) / args.iterations
+        total_before += len(data)
+        total_after += len(processed)
+        print(
+            f"{name:<22} {len(data) / 1024:8.1f} KiB -> {len(processed) / 1024:8.1f} KiB"
+            f"  ({1 - len(processed) / len(data):6.1%} saved)  {per_page * 1000:7.1f} ms/page"
+        )
+    print(f"{'total':<22} {1 - total_after / total_before:.1%} saved")
+
+
+if __name__ == "__main__":
+    main()
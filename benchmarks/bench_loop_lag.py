@@ -0,0 +1,53 @@
+# event loop lag while long chapter lists are parsed, for each executor kind,
+# "inline" is the old behaviour of parsing on the event loop
+#
+#   python benchmarks/bench_loop_lag.py [--chapters 3000] [--parses 20]
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_parsers import load_fixture, pad_chapter_list  # type: ignore
+from utils.executor import CpuExecutor, LoopLagMonitor  # type: ignore
+from utils.scraper import parse_chapter_links  # type: ignore
+
+
+async def measure(kind: str, html: str, parses: int):
+    executor = CpuExecutor(kind=kind)
+    monitor = LoopLagMonitor(interval=0.01, warn_threshold=float("inf"))
+    monitor.start()
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(executor.run(parse_chapter_links, html) for _ in range(parses))
+        )
+        elapsed = time.perf_counter() - start
+        # let the monitor take one more sample after the last parse
+        await asyncio.sleep(monitor.interval * 2)
+    finally:
+        monitor.stop()
+        executor.shutdown()
+
+    stats = monitor.stats()
+    print(
+        f"{kind:>7}: {elapsed:6.2f} s total"
+        f"  lag max {stats['max_ms']:8.1f} ms  mean {stats['mean_ms']:7.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chapters", type=int, default=3000)
+    parser.add_argument("--parses", type=int, default=20)
+    args = parser.parse_args()
+
+    html = pad_chapter_list(load_fixture("manga"), args.chapters)
+    for kind in ("inline", "thread", "process"):
+        await measure(kind, html, args.parses)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
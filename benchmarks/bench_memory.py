@@ -0,0 +1,107 @@
+# memory held by a long series, once as scraped and once as loaded back from mongo,
+# with the old plain dataclasses next to the slotted ones shared by both lists,
+# plus the size of the chapter list in each storage format
+#
+#   python benchmarks/bench_memory.py [--chapters 10000]
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_parsers import load_fixture, pad_chapter_list  # type: ignore
+from utils import codec  # type: ignore
+from utils.chapter_store import ChapterList, to_documents  # type: ignore
+from utils.parsers import get_parser  # type: ignore
+from utils.scraper import Chapter  # type: ignore
+
+MANGA_LINK = "/title/1000-en-blue-lantern"
+
+
+@dataclass
+class LegacyChapter:
+    link: str
+    name: str
+
+
+def allocated(build: Callable[[], Any]) -> tuple[int, Any]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, kept
+
+
+def copy_strings(rows: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    # what the parser or the mongo driver hand back, fresh strings every time
+    return [("".join(link), "".join(name)) for link, name in rows]
+
+
+def legacy_series(rows: list[tuple[str, str]]) -> Any:
+    scraped = [LegacyChapter(link, name) for link, name in copy_strings(rows)]
+    chapters = ChapterList(
+        MANGA_LINK, [LegacyChapter(link, name) for link, name in copy_strings(rows)]
+    )
+    chapters.merge(scraped)  # type: ignore
+    return scraped, chapters
+
+
+def current_series(rows: list[tuple[str, str]]) -> Any:
+    scraped = tuple(Chapter(link, name) for link, name in copy_strings(rows))
+    chapters = ChapterList(
+        MANGA_LINK, [Chapter(link, name) for link, name in copy_strings(rows)]
+    )
+    chapters.merge(scraped)
+    # the chapters cache then holds chapters.source in place of the scraped tuple
+    return chapters.source, chapters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chapters", type=int, default=10000)
+    args = parser.parse_args()
+
+    html = pad_chapter_list(load_fixture("manga"), args.chapters)
+    rows = get_parser().parse_chapter_links(html)
+    print(f"{len(rows)} chapters\n")
+
+    legacy, _ = allocated(lambda: legacy_series(rows))
+    current, _ = allocated(lambda: current_series(rows))
+    print(f"{'chapter objects':<28}{'bytes':>12}{'per chapter':>14}")
+    print(f"{'dataclass, scraped + stored':<28}{legacy:>12}{legacy / len(rows):>14.0f}")
+    print(f"{'slotted, shared':<28}{current:>12}{current / len(rows):>14.0f}")
+    print(
+        f"{'one object':<28}{sys.getsizeof(LegacyChapter('', '')):>12}"
+        f"{sys.getsizeof(Chapter('', '')):>14} (dataclass / slotted)"
+    )
+
+    print(f"\n{'storage format':<28}{'bytes':>12}{'pack ms':>10}{'unpack ms':>11}")
+    print(f"{'raw html':<28}{len(html.encode()):>12}")
+    documents = to_documents([Chapter(link, name) for link, name in rows])
+    print(f"{'bson documents (approx)':<28}{len(codec.json.dumps(documents)):>12}")
+    for name in ("json", "msgpack"):
+        if name == "msgpack" and codec.msgpack is None:
+            continue
+        codec.CODEC = name
+        start = time.perf_counter()
+        packed = codec.pack_rows(rows, 2)
+        packed_at = time.perf_counter()
+        unpacked = codec.unpack_rows(packed)
+        unpacked_at = time.perf_counter()
+        assert unpacked == list(rows)
+        print(
+            f"{'packed rows, ' + name:<28}{len(packed):>12}"
+            f"{(packed_at - start) * 1000:>10.1f}{(unpacked_at - packed_at) * 1000:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# parse throughput of each available parser engine over the saved fixtures,
+# the chapter list fixture is padded to --chapters entries to mimic long series
+#
+#   python benchmarks/bench_parsers.py [--chapters 3000] [--iterations 20]
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.parsers import PARSERS  # type: ignore
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_fixture(name: str) -> str:
+    return (FIXTURES / f"{name}.html").read_text()
+
+
+def pad_chapter_list(html: str, chapters: int) -> str:
+    marker = '<div class="scrollable-panel">\n'
+    rows = "".join(
+        f'  <div class="px-2 py-2 flex"><a href="/title/1000-en-blue-lantern/{90000 + c}-ch-{c:04d}"'
+        f' class="link-hover"><span>Chapter {c}</span></a><time>2025-01-01</time></div>\n'
+        for c in range(chapters, 40, -1)
+    )
+    return html.replace(marker, marker + rows, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chapters", type=int, default=3000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    manga_html = pad_chapter_list(load_fixture("manga"), args.chapters)
+    cases = [
+        ("parse_chapter_links", manga_html),
+        ("parse_manga_description", manga_html),
+        ("parse_page_images", load_fixture("chapter")),
+        ("parse_cover_images", load_fixture("search")),
+    ]
+
+    results = {}
+    for engine_name, engine_class in PARSERS.items():
+        engine = engine_class()
+        for case, html in cases:
+            parse = getattr(engine, case)
+            results[engine_name, case] = parse(html)
+
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                parse(html)
+            per_parse = (time.perf_counter() - start) / args.iterations
+            print(
+                f"{engine_name:>5} {case:<24} {per_parse * 1000:8.2f} ms/parse"
+                f"  {len(html) / per_parse / 2**20:7.1f} MiB/s"
+            )
+
+    for case, _ in cases:
+        outputs = [results[engine, case] for engine in PARSERS]
+        assert all(output == outputs[0] for output in outputs), f"{case} mismatch"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# drives the upstream limiter against a local fault-injecting stand-in server
+# that answers a share of requests with 429/503 and slows down under load
+#
+#   python benchmarks/bench_ratelimit.py [--requests 300] [--error-rate 0.2]
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils import ratelimit  # type: ignore
+from utils import session as pooled  # type: ignore
+
+
+async def start_faulty_server(
+    error_rate: float, capacity: int
+) -> tuple[web.AppRunner, str]:
+    in_flight = 0
+
+    async def page(request: web.Request) -> web.Response:
+        nonlocal in_flight
+        in_flight += 1
+        try:
+            # latency climbs once more requests arrive than the server can handle
+            await asyncio.sleep(0.01 * max(1, in_flight / capacity) ** 2)
+            roll = random.random()
+            if roll < error_rate / 2:
+                return web.Response(status=429, headers={"Retry-After": "0.2"})
+            if roll < error_rate:
+                return web.Response(status=503)
+            return web.Response(text="<html></html>")
+        finally:
+            in_flight -= 1
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--capacity", type=int, default=4)
+    args = parser.parse_args()
+
+    ratelimit.HOST_CONFIGS["127.0.0.1"] = ratelimit.HostConfig(
+        rate=100, burst=20, max_concurrency=16, latency_target=0.05
+    )
+    runner, base_url = await start_faulty_server(args.error_rate, args.capacity)
+    await pooled.start_session()
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                ratelimit.limited_get(
+                    pooled.get_session(), f"{base_url}/{i}", lambda r: r.text()
+                )
+                for i in range(args.requests)
+            ),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        await pooled.close_session()
+        await runner.cleanup()
+
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"{args.requests - failed}/{args.requests} succeeded in {elapsed:.2f} s")
+    for name, value in ratelimit.LIMITERS["127.0.0.1"].stats().items():
+        print(
+            f"  {name}: {value:.1f}"
+            if isinstance(value, float)
+            else f"  {name}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
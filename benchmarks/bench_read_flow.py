@@ -0,0 +1,260 @@
+# replays the search -> select -> chapter list -> read N pages flow through the
+# real views with fake interactions, against the saved fixtures served by a
+# local stand-in for MangaPark, its covers and image cdn, and reports per stage latency
+#
+#   python benchmarks/bench_read_flow.py --mongomock [--users 50] [--pages 10] [--strip]
+#   MONGODB_URI=mongodb://localhost:27017/ python benchmarks/bench_read_flow.py
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_images import generated_page  # type: ignore
+from bench_parsers import load_fixture  # type: ignore
+from utils import attachments, image_store, ratelimit, scraper  # type: ignore
+from utils import session as pooled  # type: ignore
+from utils.backend import Backend, MONGODB_URI  # type: ignore
+from utils.metrics import STAGES  # type: ignore
+from cogs.manga_selector import MangaSelectorView  # type: ignore
+
+CDN_HOST = "https://s01.mpfiles.org"
+
+
+async def start_stand_in_server(latency: float) -> tuple[web.AppRunner, str]:
+    image = generated_page(800, 1200)
+    pages: dict[str, str] = {}
+
+    async def html(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        path = request.path
+        if path == "/search":
+            name = "search"
+        elif path.count("/") >= 3:
+            name = "chapter"
+        else:
+            name = "manga"
+        if name not in pages:
+            pages[name] = load_fixture(name).replace(CDN_HOST, base_url)
+        return web.Response(text=pages[name], content_type="text/html")
+
+    async def media(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.Response(body=image, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/media/{tail:.*}", media)
+    app.router.add_get("/thumb/{tail:.*}", media)
+    app.router.add_get("/{tail:.*}", html)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    return runner, base_url
+
+
+class FakeAttachment:
+    def __init__(self, url: str):
+        self.url = url
+
+
+class FakeMessage:
+    def __init__(self, kwargs: dict[str, Any]):
+        self.kwargs = kwargs
+        files = kwargs.get("files") or ([kwargs["file"]] if "file" in kwargs else [])
+        # discord hands back a signed cdn url for every uploaded file
+        self.attachments = [
+            FakeAttachment(f"https://cdn.example/{id(file)}?ex=7fffffff")
+            for file in files
+        ]
+
+
+class FakeChannel:
+    # the cache channel, pages are uploaded here once and linked after
+    async def send(self, **kwargs: Any) -> FakeMessage:
+        for file in kwargs["files"]:
+            file.fp.read()
+        return FakeMessage(kwargs)
+
+
+class FakeResponse:
+    async def defer(self):
+        pass
+
+    async def edit_message(self, **kwargs: Any):
+        pass
+
+
+class FakeFollowup:
+    async def send(self, *args: Any, **kwargs: Any):
+        pass
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeInteraction:
+    def __init__(self, user_id: int):
+        self.user = FakeUser(user_id)
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.last_edit: dict[str, Any] = {}
+
+    async def edit_original_response(self, **kwargs: Any) -> FakeMessage:
+        # a real edit uploads the files, the fake one just reads them
+        for file in kwargs.get("files") or [kwargs.get("file")]:
+            if file is not None:
+                file.fp.read()
+        self.last_edit = kwargs
+        return FakeMessage(kwargs)
+
+
+def button(view, label: str):
+    return next(item for item in view.children if getattr(item, "label", None) == label)
+
+
+class Timings:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def time(self, stage: str, awaitable):
+        start = time.perf_counter()
+        result = await awaitable
+        self.samples[stage].append(time.perf_counter() - start)
+        return result
+
+
+async def virtual_user(user_id: int, pages: int, strip: bool, timings: Timings):
+    interaction = FakeInteraction(user_id)
+
+    view = await timings.time(
+        "search", MangaSelectorView.new_manga_selector_view("blue lantern")
+    )
+    view.selector.selected_index = random.randrange(len(view.selector.search_results))
+    await timings.time("select_manga", view.selector.generate_embed())
+
+    await timings.time("chapter_list", button(view, "Confirm").callback(interaction))
+    chapter_view = interaction.last_edit["view"]
+    chapter_view.select_chapter(random.randrange(len(chapter_view.chapters)))
+
+    await timings.time("open_reader", chapter_view.confirm.callback(interaction))
+    reader = interaction.last_edit["view"]
+    if strip:
+        await timings.time(
+            "strip_mode", button(reader, "Long Strip").callback(interaction)
+        )
+    for _ in range(pages):
+        await timings.time("page_turn", button(reader, "➡️").callback(interaction))
+    await timings.time("bookmark", button(reader, "Bookmark").callback(interaction))
+    reader.cancel_prefetch()
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--mongomock", action="store_true")
+    # turn pages in long strip mode, ten pages a step
+    parser.add_argument("--strip", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        client = AsyncMongoMockClient()
+    else:
+        import motor.motor_asyncio
+
+        client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
+    await client.drop_database("db_bench_read_flow")
+    backend = Backend(client)
+    backend.db = client["db_bench_read_flow"]
+    backend.users = backend.db["users"]
+    backend.bookmarks = backend.db["bookmarks"]
+    backend.attachments = backend.db["attachments"]
+    backend.chapters = backend.db["chapters"]
+    backend.results = backend.db["results"]
+    backend.series = backend.db["series"]
+    backend.images = backend.db["images"]
+    backend.leases = backend.db["leases"]
+    await backend.setup()
+    # NOTE: Backend.get_instance() hands out this one from here on
+    Backend._Backend__instance = backend  # type: ignore
+
+    runner, base_url = await start_stand_in_server(args.latency)
+    scraper.MANGAPARK_BASE_URL = base_url
+    ratelimit.HOST_CONFIGS["127.0.0.1"] = ratelimit.HostConfig(
+        rate=10_000, burst=10_000, max_concurrency=64
+    )
+    await pooled.start_session()
+    attachments.CACHE_CHANNELS.append(FakeChannel())
+    # processed pages go to a throwaway image store
+    store_dir = tempfile.TemporaryDirectory()
+    image_store.IMAGE_STORE = image_store.ImageStore(
+        Path(store_dir.name), image_store.IMAGE_STORE_MAX_BYTES
+    )
+
+    timings = Timings()
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                virtual_user(user, args.pages, args.strip, timings)
+                for user in range(args.users)
+            ),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - start
+    finally:
+        await pooled.close_session()
+        await runner.cleanup()
+        await client.drop_database("db_bench_read_flow")
+        store_dir.cleanup()
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors[:3]:
+        traceback.print_exception(error)
+    print(
+        f"{args.users - len(errors)}/{args.users} users finished in {elapsed:.2f} s"
+        f" ({(args.users - len(errors)) / elapsed:.1f} flows/s)"
+    )
+    print(f"{'stage':<24}{'count':>7}{'p50':>10}{'p99':>10}")
+    for stage, samples in timings.samples.items():
+        print(
+            f"{stage:<24}{len(samples):>7}"
+            f"{statistics.median(samples) * 1000:>8.1f}ms"
+            f"{percentile(samples, 0.99) * 1000:>8.1f}ms"
+        )
+    print()
+    print(f"{'instrumented stage':<24}{'count':>7}{'mean':>10}")
+    for stage in STAGES.values():
+        if stage.latency.count:
+            mean = stage.latency.sum / stage.latency.count
+            print(f"{stage.name[:23]:<24}{stage.latency.count:>7}{mean * 1000:>8.1f}ms")
+
+    # timings of flows that broke half way mean nothing, fail the run
+    if len(errors) != 0:
+        sys.exit(f"{len(errors)}/{args.users} users failed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+# query latency of the local search index over --series generated names,
+# and how often an exact, prefix or misspelled query finds its series
+#
+#   python benchmarks/bench_search_index.py [--series 50000] [--queries 2000]
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils.scraper import Manga  # type: ignore
+from utils.search_index import SEARCH_MIN_SCORE, SearchIndex  # type: ignore
+
+# a few common title words between made up ones, like real series names
+COMMON_WORDS = "the of a no to in return level hero king demon academy".split()
+SYLLABLES = [c + v for c in "bdfghjklmnprstvwyz" for v in "aeiou"]
+
+
+def made_up_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def generated_names(count: int, rng: random.Random) -> list[str]:
+    names = set()
+    while len(names) < count:
+        words = [
+            rng.choice(COMMON_WORDS) if rng.random() < 0.3 else made_up_word(rng)
+            for _ in range(rng.randint(1, 5))
+        ]
+        names.add(" ".join(words).title())
+    return sorted(names)
+
+
+def misspelled(name: str, rng: random.Random) -> str:
+    # swaps two neighbouring letters, the most common typo
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2 :]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = generated_names(args.series, rng)
+    index = SearchIndex()
+    start = time.perf_counter()
+    for i, name in enumerate(names):
+        index.add(Manga(f"/title/{i}", name, f"/thumb/{i}.jpg"))
+    print(f"indexed {len(index)} series in {time.perf_counter() - start:.2f} s\n")
+
+    cases = {
+        "exact": lambda name: name,
+        "prefix": lambda name: name[: max(3, len(name) * 2 // 3)],
+        "typo": lambda name: misspelled(name, rng),
+    }
+    print(f"{'query':<8}{'ms/query':>10}{'found':>8}{'confident':>11}")
+    for case, make_query in cases.items():
+        sample = rng.sample(names, args.queries)
+        queries = [make_query(name) for name in sample]
+        start = time.perf_counter()
+        results = [index.search(query) for query in queries]
+        elapsed = time.perf_counter() - start
+        found = sum(
+            any(manga.name == name for _, manga in matches)
+            for name, matches in zip(sample, results)
+        )
+        confident = sum(
+            len(matches) != 0 and matches[0][0] >= SEARCH_MIN_SCORE
+            for matches in results
+        )
+        print(
+            f"{case:<8}{elapsed / len(queries) * 1000:>10.2f}"
+            f"{found / len(queries):>8.0%}{confident / len(queries):>11.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
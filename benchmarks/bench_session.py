@@ -0,0 +1,96 @@
+# compares per-request latency of the old per-call session setup against the
+# shared, pooled session, using a local stand-in for the upstream server
+#
+#   python benchmarks/bench_session.py [--requests 200] [--concurrency 8]
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from utils import session as pooled  # type: ignore
+
+PAGE = b"<html><body>" + b"x" * 32 * 1024 + b"</body></html>"
+
+
+async def start_stand_in_server() -> tuple[web.AppRunner, str]:
+    async def page(request: web.Request) -> web.Response:
+        return web.Response(body=PAGE, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def fetch_per_call(url: str):
+    async with ClientSession() as session:
+        async with session.get(url) as response:
+            await response.read()
+
+
+async def fetch_pooled(url: str):
+    async with pooled.get_session().get(url) as response:
+        await response.read()
+
+
+async def run(fetch, base_url: str, requests: int, concurrency: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await fetch(f"{base_url}/chapter/{i}")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def report(name: str, latencies: list[float], elapsed: float):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:>10}: {len(latencies) / elapsed:8.1f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.2f} ms"
+        f"  p99 {p99 * 1000:7.2f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    runner, base_url = await start_stand_in_server()
+    try:
+        start = time.perf_counter()
+        latencies = await run(fetch_per_call, base_url, args.requests, args.concurrency)
+        report("per-call", latencies, time.perf_counter() - start)
+
+        await pooled.start_session()
+        try:
+            start = time.perf_counter()
+            latencies = await run(
+                fetch_pooled, base_url, args.requests, args.concurrency
+            )
+            report("pooled", latencies, time.perf_counter() - start)
+        finally:
+            await pooled.close_session()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+# how many times --processes bot processes scrape the same --chapters chapters
+# when they all open them at once, against a local stand-in for MangaPark.
+# the fetch leases in mongo should keep it to once per chapter
+#
+#   MONGODB_URI=mongodb://localhost:27017/ python benchmarks/bench_shards.py [--processes 4]
+#   python benchmarks/bench_shards.py --mongomock
+#
+# mongomock can't be shared between processes, with it the processes are
+# simulated by concurrent callers that skip the in-process single flights
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_parsers import load_fixture  # type: ignore
+from utils import ratelimit, scraper  # type: ignore
+from utils import session as pooled  # type: ignore
+from utils.backend import Backend, MONGODB_URI  # type: ignore
+from utils.results import STATS  # type: ignore
+
+DATABASE = "db_bench_shards"
+
+
+async def start_stand_in_server(latency: float) -> tuple[web.AppRunner, str, Counter]:
+    scraped: Counter = Counter()
+    page = load_fixture("chapter")
+
+    async def chapter(request: web.Request) -> web.Response:
+        scraped[request.path] += 1
+        await asyncio.sleep(latency)
+        return web.Response(text=page, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", chapter)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}", scraped
+
+
+def use_backend(client):
+    backend = Backend(client)
+    backend.db = client[DATABASE]
+    for collection in ("results", "leases"):
+        setattr(backend, collection, backend.db[collection])
+    # NOTE: Backend.get_instance() hands out this one from here on
+    Backend._Backend__instance = backend  # type: ignore
+    return backend
+
+
+async def start_bot_process(base_url: str, client):
+    scraper.MANGAPARK_BASE_URL = base_url
+    ratelimit.HOST_CONFIGS["127.0.0.1"] = ratelimit.HostConfig(
+        rate=10_000, burst=10_000, max_concurrency=64
+    )
+    await use_backend(client).setup()
+    await pooled.start_session()
+
+
+def chapter_links(chapters: int) -> list[str]:
+    return [f"/title/bench/c{i}" for i in range(chapters)]
+
+
+def bot_process(base_url: str, chapters: int, ready, go):
+    async def run():
+        import motor.motor_asyncio
+
+        await start_bot_process(
+            base_url, motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
+        )
+        ready.set()
+        go.wait()
+        try:
+            await asyncio.gather(
+                *(
+                    scraper.get_manga_chapter_images(link)
+                    for link in chapter_links(chapters)
+                )
+            )
+        finally:
+            await pooled.close_session()
+
+    asyncio.run(run())
+
+
+async def run_processes(base_url: str, processes: int, chapters: int):
+    context = multiprocessing.get_context("spawn")
+    go = context.Event()
+    readies = [context.Event() for _ in range(processes)]
+    workers = [
+        context.Process(target=bot_process, args=(base_url, chapters, ready, go))
+        for ready in readies
+    ]
+    for worker in workers:
+        worker.start()
+    loop = asyncio.get_running_loop()
+    # the stand-in server runs on this loop, so wait off it
+    for ready in readies:
+        await loop.run_in_executor(None, ready.wait)
+    go.set()
+    for worker in workers:
+        await loop.run_in_executor(None, worker.join)
+
+
+class NoFlights:
+    # every caller on its own, like callers in different processes
+    async def do(self, key, func):
+        return await func()
+
+
+async def run_simulated(base_url: str, processes: int, chapters: int):
+    from mongomock_motor import AsyncMongoMockClient
+
+    await start_bot_process(base_url, AsyncMongoMockClient())
+    scraper.HTML_FLIGHTS = NoFlights()
+    try:
+        await asyncio.gather(
+            *(
+                scraper.load_chapter_images(link)
+                for _ in range(processes)
+                for link in chapter_links(chapters)
+            )
+        )
+    finally:
+        await pooled.close_session()
+    print(f"lease waits {STATS['lease_waits']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    runner, base_url, scraped = await start_stand_in_server(args.latency)
+    if not args.mongomock:
+        import motor.motor_asyncio
+
+        await motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI).drop_database(
+            DATABASE
+        )
+    try:
+        start = time.perf_counter()
+        if args.mongomock:
+            await run_simulated(base_url, args.processes, args.chapters)
+        else:
+            await run_processes(base_url, args.processes, args.chapters)
+        elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    total = sum(scraped.values())
+    print(
+        f"{args.processes} processes opened {args.chapters} chapters in {elapsed:.2f} s, "
+        f"{total} scrapes ({total / args.chapters:.2f} per chapter, 1.00 is ideal)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,22 +1,62 @@
-import discord
+import asyncio
 from os import getenv
 from dotenv import load_dotenv
+from utils.session import start_session, close_session  # type: ignore
+from utils.executor import LOOP_LAG, shutdown_executor  # type: ignore
+from utils.refresher import REFRESHER  # type: ignore
+from utils.image_store import IMAGE_STORE  # type: ignore
+from utils.attachments import open_cache_channels  # type: ignore
+from utils.metrics import METRICS_HOST, METRICS_PORT, start_metrics_server, stop_metrics_server  # type: ignore
+from utils.shards import SHARD_CONFIG, make_bot  # type: ignore
 
 load_dotenv()
 BOT_TOKEN = getenv("BOT_TOKEN")
 
 assert BOT_TOKEN is not None, "Bot token not found in environment variables."
 
-bot = discord.Bot()
+# an AutoShardedBot when launcher.py hands this process a range of shards
+bot = make_bot(SHARD_CONFIG)
 
 
 @bot.event
 async def on_ready():
-    print(f"Bot is online: {bot.user}")
-    await bot.sync_commands()
+    print(f"Bot is online: {bot.user} (shards {SHARD_CONFIG.shard_ids or 'all'})")
+    await open_cache_channels(bot)
+    # commands are global, one process registering them is enough
+    if SHARD_CONFIG.primary:
+        await bot.sync_commands()
 
 
 bot.load_extension("cogs.pingpong")
 bot.load_extension("cogs.manga")
 bot.load_extension("cogs.bookmarks")
-bot.run(BOT_TOKEN)
+bot.load_extension("cogs.download")
+bot.load_extension("cogs.stats")
+
+
+async def main():
+    # the shared http session lives for the whole lifetime of the bot
+    await start_session()
+    LOOP_LAG.start()
+    # every process would refresh the same bookmarked series,
+    # and the image store directory is shared, one evicting process is enough
+    if SHARD_CONFIG.primary:
+        REFRESHER.start()
+        IMAGE_STORE.start()
+    if METRICS_PORT is not None:
+        await start_metrics_server(
+            METRICS_HOST, METRICS_PORT + SHARD_CONFIG.process_index
+        )
+    try:
+        async with bot:
+            await bot.start(BOT_TOKEN)
+    finally:
+        await stop_metrics_server()
+        REFRESHER.stop()
+        IMAGE_STORE.stop()
+        LOOP_LAG.stop()
+        shutdown_executor()
+        await close_session()
+
+
+asyncio.run(main())
@@ -0,0 +1,74 @@
+import discord
+from os import getenv
+from utils.chapter_store import get_chapter_list  # type: ignore
+from utils.downloads import archive_filename, get_archive  # type: ignore
+from utils.search_index import search_manga  # type: ignore
+
+DOWNLOAD_MAX_CHAPTERS = int(getenv("DOWNLOAD_MAX_CHAPTERS", "20"))
+# the upload limit outside of servers, servers have their own
+UPLOAD_LIMIT = int(getenv("UPLOAD_LIMIT", str(25 * 1024 * 1024)))
+
+
+class Download(discord.ext.commands.Cog):
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+
+    @discord.command(
+        name="download", description="Download a range of chapters as a .cbz file."
+    )
+    async def download(
+        self,
+        ctx: discord.ApplicationContext,
+        to_search=discord.Option(str, description="The manga you want to download."),
+        first=discord.Option(
+            int, description="The first chapter, 1 is the oldest.", min_value=1
+        ),
+        last=discord.Option(
+            int,
+            description="The last chapter, the first if left out.",
+            min_value=1,
+            default=None,
+        ),
+    ):
+        await ctx.defer()
+        results = await search_manga(to_search)
+        if len(results) == 0:
+            await ctx.respond("No manga found.")
+            return
+        manga = results[0]
+        chapters = await get_chapter_list(manga.link)
+        last = first if last is None else last
+        if first > len(chapters):
+            await ctx.respond(f"{manga.name} has {len(chapters)} chapters.")
+            return
+        # 1 based and inclusive here, 0 based below
+        first, last = sorted((first, last))
+        first, last = first - 1, min(last, len(chapters)) - 1
+        if last - first + 1 > DOWNLOAD_MAX_CHAPTERS:
+            await ctx.respond(
+                f"At most {DOWNLOAD_MAX_CHAPTERS} chapters can be downloaded at once."
+            )
+            return
+
+        archive = await get_archive(manga.link, chapters, first, last)
+        size = archive.stat().st_size
+        limit = UPLOAD_LIMIT if ctx.guild is None else ctx.guild.filesize_limit
+        if size > limit:
+            # it can't be sent, kept it would only take up room until a sweep
+            archive.unlink(missing_ok=True)
+            await ctx.respond(
+                f"The download is {size / 1024 / 1024:.0f} MB, too big for discord. "
+                "Try fewer chapters."
+            )
+            return
+        # discord.File reads the archive from disk as it uploads
+        await ctx.respond(
+            f"{manga.name}, chapters {first + 1}-{last + 1}",
+            file=discord.File(
+                archive, filename=archive_filename(manga.name, first, last)
+            ),
+        )
+
+
+def setup(bot: discord.Bot):
+    bot.add_cog(Download(bot))
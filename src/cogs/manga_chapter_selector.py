@@ -1,7 +1,8 @@
 import discord
-import utils.scraper as scraper  # type: ignore
 import utils.bot_util as bot_util  # type: ignore
 from utils.backend import Backend  # type: ignore
+from utils.chapter_store import ChapterList, get_chapter_list  # type: ignore
+from utils.chapter_index import CHUNK_SIZE, get_chapter_index  # type: ignore
 from .manga_reader import MangaReaderView  # type: ignore
 
 
@@ -12,20 +13,56 @@ class MangaChapterSelectorConfirmButton(discord.ui.Button["MangaChapterSelectorV
     async def callback(self, interaction: discord.Interaction):
         assert self.view is not None
         await interaction.response.defer()
-        try:
-            assert type(self.view.selector.values[0]) is str
-            index = int(self.view.selector.values[0])
-        except TypeError:
-            index = self.view.bookmark_default
+        # a selection from another chunk is stale after paging or jumping,
+        # the highlighted default chapter wins then. values is None until
+        # the dropdown is used
+        values = [] if self.view.jumped else self.view.selector.values or []
+        current = [value for _, value in self.view.index.chunk(self.view.current_chunk)]
+        if len(values) != 0 and values[0] in current:
+            assert type(values[0]) is str
+            index = int(values[0])
+        else:
+            index = self.view.default_chapter
+        if index is None:
+            await interaction.followup.send("Select a chapter first.", ephemeral=True)
+            return
         assert interaction.user is not None
         user_id = interaction.user.id
         new_view = await MangaReaderView.new_manga_reader_view(
             self.view.manga_link, index, user_id, self.view.chapters
         )
         embed = await new_view.generate_embed()
-        await interaction.edit_original_response(
-            embed=embed, file=new_view.file, view=new_view
+        await new_view.send_embed(interaction, embed)
+
+
+class MangaChapterJumpModal(discord.ui.Modal):
+    def __init__(self, view: "MangaChapterSelectorView"):
+        super().__init__(title="Jump To Chapter")
+        self.selector_view = view
+        self.query = discord.ui.InputText(
+            label="Chapter number or name", placeholder="e.g. 42 or Chapter 42"
         )
+        self.add_item(self.query)
+
+    async def callback(self, interaction: discord.Interaction):
+        assert self.query.value is not None
+        index = self.selector_view.index.find(self.query.value)
+        if index is None:
+            await interaction.response.send_message(
+                f"No chapter matching *{self.query.value}*.", ephemeral=True
+            )
+            return
+        self.selector_view.select_chapter(index)
+        await interaction.response.edit_message(view=self.selector_view)
+
+
+class MangaChapterJumpButton(discord.ui.Button["MangaChapterSelectorView"]):
+    def __init__(self):
+        super().__init__(label="Jump To Chapter", row=3)
+
+    async def callback(self, interaction: discord.Interaction):
+        assert self.view is not None
+        await interaction.response.send_modal(MangaChapterJumpModal(self.view))
 
 
 class MangaChapterSelector(discord.ui.Select):
@@ -33,6 +70,9 @@ class MangaChapterSelector(discord.ui.Select):
         super().__init__(placeholder="Select a chapter", row=2)
 
     async def callback(self, interaction: discord.Interaction):
+        assert self.view is not None
+        # picked after a jump, so it's the one to open
+        self.view.jumped = False
         await interaction.response.defer()
 
 
@@ -41,21 +81,23 @@ class MangaChapterSelectorView(discord.ui.View):
     async def new_manga_chapter_selector_view(
         manga_link: str, user_id: int
     ) -> "MangaChapterSelectorView":
-        manga_chapters = await scraper.get_manga_chapters(manga_link)
+        manga_chapters = await get_chapter_list(manga_link)
         view = MangaChapterSelectorView(manga_chapters, manga_link)
         await view.handle_bookmark_jumper(user_id)
         return view
 
-    def __init__(self, chapters: list[scraper.Chapter], manga_link: str):
+    def __init__(self, chapters: ChapterList, manga_link: str):
         super().__init__(timeout=120)
         self.chapters = chapters
         self.manga_link = manga_link
         self.current_chunk = 0
+        self.bookmark_default: int | None = None
+        self.default_chapter: int | None = None
+        # the dropdown keeps its last value, a jump since then overrides it
+        self.jumped = False
 
-        self.chunks = [
-            [(i + j, chapters[i + j]) for j in range(min(25, len(chapters) - i))]
-            for i in range(0, len(chapters), 25)
-        ]
+        # shared with every other open view of this manga
+        self.index = get_chapter_index(manga_link, chapters)
 
         self.selector = MangaChapterSelector()
         self.initialize_selector()
@@ -64,13 +106,23 @@ class MangaChapterSelectorView(discord.ui.View):
         self.confirm = MangaChapterSelectorConfirmButton()
         self.add_item(self.confirm)
 
+        self.jump = MangaChapterJumpButton()
+        self.add_item(self.jump)
+
     def initialize_selector(self):
         selector_options = [
-            discord.SelectOption(label=chapter.name, value=str(i))
-            for i, chapter in self.chunks[self.current_chunk]
+            discord.SelectOption(label=label, value=value)
+            for label, value in self.index.chunk(self.current_chunk)
         ]
         self.selector.options = selector_options
 
+    def select_chapter(self, index: int):
+        self.default_chapter = index
+        self.jumped = True
+        self.current_chunk = self.index.chunk_of(index)
+        self.initialize_selector()
+        self.selector.options[index - self.current_chunk * CHUNK_SIZE].default = True
+
     async def send_updated_selector(self, interaction: discord.Interaction, chunk: int):
         self.current_chunk = chunk
         self.initialize_selector()
@@ -78,24 +130,19 @@ class MangaChapterSelectorView(discord.ui.View):
 
     async def handle_bookmark_jumper(self, user_id: int):
         backend = await Backend.get_instance()
-        self.bookmark_default = await backend.find_bookmark_chapter(
-            user_id, self.manga_link
-        )
+        bookmark = await backend.find_bookmark(user_id, self.manga_link)
+        self.bookmark_default = self.chapters.bookmark_index(bookmark)
         if self.bookmark_default is None:
             return
 
-        self.current_chunk = self.bookmark_default // 25
-        self.initialize_selector()
-        self.selector.options[
-            self.bookmark_default - self.current_chunk * 25
-        ].default = True
+        self.select_chapter(self.bookmark_default)
 
     @discord.ui.button(style=discord.ButtonStyle.gray, label="⬅️", row=0)
     async def cycle_left(
         self, button: discord.Button, interaction: discord.Interaction
     ):
         await self.send_updated_selector(
-            interaction, (self.current_chunk - 1) % len(self.chunks)
+            interaction, (self.current_chunk - 1) % self.index.chunk_count
         )
 
     @discord.ui.button(style=discord.ButtonStyle.gray, label="➡️", row=0)
@@ -103,5 +150,5 @@ class MangaChapterSelectorView(discord.ui.View):
         self, button: discord.Button, interaction: discord.Interaction
     ):
         await self.send_updated_selector(
-            interaction, (self.current_chunk + 1) % len(self.chunks)
+            interaction, (self.current_chunk + 1) % self.index.chunk_count
         )
@@ -1,7 +1,16 @@
 import discord
 import utils.scraper as scraper  # type: ignore
-import utils.bot_util as bot_util  # type: ignore
 from utils.backend import Backend  # type: ignore
+from utils.chapter_store import ChapterList, get_chapter_list  # type: ignore
+import utils.attachments as attachments  # type: ignore
+import utils.strips as strips  # type: ignore
+from utils.metrics import instrumented  # type: ignore
+from utils.prefetch import (  # type: ignore
+    PagePrefetcher,
+    PREFETCH_AHEAD,
+    PREFETCH_NEXT_CHAPTER,
+)
+import asyncio
 
 
 class BookmarkJumperButton(discord.ui.Button["MangaReaderView"]):
@@ -20,15 +29,15 @@ class MangaReaderView(discord.ui.View):
         manga_link: str,
         current_chapter: int,
         user_id: int,
-        chapters: list[scraper.Chapter] = [],
+        chapters: ChapterList | None = None,
     ) -> "MangaReaderView":
         view = MangaReaderView(manga_link, current_chapter, chapters)
-        await view.handle_bookmark_jumper(user_id)
         await view.get_chapter_data()
+        await view.handle_bookmark_jumper(user_id)
         return view
 
     def __init__(
-        self, manga_link: str, current_chapter: int, chapters: list[scraper.Chapter]
+        self, manga_link: str, current_chapter: int, chapters: ChapterList | None
     ):
         super().__init__(timeout=1000)
         self.manga_link = manga_link
@@ -38,12 +47,19 @@ class MangaReaderView(discord.ui.View):
         self.pages: list[str] = []
         self.current_page = 0
         self.button: BookmarkJumperButton | None = None
+        self.prefetcher = PagePrefetcher()
+        self.next_chapter_task: asyncio.Task | None = None
+        self.file: discord.File | None = None
+        # long strip mode shows STRIP_PAGES pages a step, stitched into a few images
+        self.strip_mode = False
+        self.strip_embeds: list[discord.Embed] = []
+        self.files: list[discord.File] = []
+        self.strip_task: asyncio.Task | None = None
 
     async def handle_bookmark_jumper(self, user_id: int):
         backend = await Backend.get_instance()
-        chapter: int | None = await backend.find_bookmark_chapter(
-            user_id, self.manga_link
-        )
+        bookmark = await backend.find_bookmark(user_id, self.manga_link)
+        chapter = self.chapters.bookmark_index(bookmark)
         if chapter is None:
             return
         if self.button is None:
@@ -53,47 +69,176 @@ class MangaReaderView(discord.ui.View):
             self.button.target_chapter = chapter
 
     async def get_chapter_data(self):
-        if len(self.chapters) == 0:
-            self.chapters = await scraper.get_manga_chapters(self.manga_link)
+        if self.chapters is None:
+            self.chapters = await get_chapter_list(self.manga_link)
         chapter = self.chapters[self.current_chapter]
         self.name = chapter.name
         self.pages = await scraper.get_manga_chapter_images(chapter.link)
         self.current_page = 0
 
+    @instrumented("reader_generate_embed")
     async def generate_embed(self) -> discord.Embed:
+        if self.strip_mode:
+            return await self.generate_strip_embed()
         embed = discord.Embed(title=self.name, color=discord.Colour.dark_grey())
-        self.file = await bot_util.url_to_image_file(self.pages[self.current_page])
-        embed.set_image(url=f"attachment://{self.file.filename}")
+        url = self.pages[self.current_page]
+        # pages someone already viewed are linked from discord's cdn, not uploaded,
+        # a new one goes to a cache channel first if there is one
+        cdn_url = await attachments.find_attachment_url(url)
+        if cdn_url is None and len(attachments.CACHE_CHANNELS) != 0:
+            uploaded = await attachments.upload(
+                [url], [await self.prefetcher.get_file(url)]
+            )
+            cdn_url = None if uploaded is None else uploaded[0]
+        if cdn_url is None:
+            # the next page turn deletes it, so it isn't linked by anyone else
+            self.file = await self.prefetcher.get_file(url)
+            embed.set_image(url=f"attachment://{self.file.filename}")
+        else:
+            self.file = None
+            embed.set_image(url=cdn_url)
+        self.schedule_prefetch()
         embed.set_footer(text=f"Page #{self.current_page + 1}")
 
         return embed
 
+    async def generate_strip_embed(self) -> discord.Embed:
+        chapter_link = self.chapters[self.current_chapter].link
+        batch = self.current_page // strips.STRIP_PAGES
+        image_urls, self.files, left_out = await strips.load_strip(
+            chapter_link, self.pages, batch
+        )
+
+        # one embed per stitched part, the first carries the title
+        embeds = [
+            discord.Embed(color=discord.Colour.dark_grey())
+            for _ in range(max(1, len(image_urls)))
+        ]
+        for embed, image_url in zip(embeds, image_urls):
+            embed.set_image(url=image_url)
+        embeds[0].title = self.name
+        last_page = min(len(self.pages), self.current_page + strips.STRIP_PAGES)
+        footer = f"Pages #{self.current_page + 1}-{last_page} of {len(self.pages)}"
+        if left_out != 0:
+            footer += " (too large to send whole, the single page mode shows the rest)"
+        embeds[-1].set_footer(text=footer)
+        self.strip_embeds = embeds[1:]
+        self.schedule_strip_prefetch(chapter_link, batch + 1)
+        return embeds[0]
+
+    def schedule_strip_prefetch(self, chapter_link: str, batch: int):
+        if batch >= strips.strip_count(self.pages) or self.strip_task is not None:
+            return
+        self.strip_task = asyncio.create_task(
+            strips.get_strip(chapter_link, self.pages, batch)
+        )
+        self.strip_task.add_done_callback(self.finish_strip_prefetch)
+
+    def finish_strip_prefetch(self, task: asyncio.Task):
+        if self.strip_task is task:
+            self.strip_task = None
+        # a failed prefetch isn't fatal, the strip is built again on demand
+        if not task.cancelled():
+            task.exception()
+
+    @instrumented("discord_edit")
+    async def send_embed(self, interaction: discord.Interaction, embed: discord.Embed):
+        if self.strip_mode:
+            await self.send_strip(interaction, embed)
+            return
+        if self.file is None:
+            # drop the previous page's upload, the image is linked instead
+            await interaction.edit_original_response(
+                embed=embed, attachments=[], view=self
+            )
+            return
+        await interaction.edit_original_response(embed=embed, file=self.file, view=self)
+
+    async def send_strip(self, interaction: discord.Interaction, embed: discord.Embed):
+        embeds = [embed, *self.strip_embeds]
+        if len(self.files) == 0:
+            await interaction.edit_original_response(
+                embeds=embeds, attachments=[], view=self
+            )
+            return
+        await interaction.edit_original_response(
+            embeds=embeds, files=self.files, view=self
+        )
+
+    def schedule_prefetch(self):
+        ahead = self.current_page + 1 + PREFETCH_AHEAD
+        self.prefetcher.prefetch(
+            [
+                url
+                for url in self.pages[self.current_page + 1 : ahead]
+                if attachments.known_attachment_url(url) is None
+            ]
+        )
+
+        if ahead >= len(self.pages) and self.next_chapter_task is None:
+            self.next_chapter_task = asyncio.create_task(
+                self.prefetch_next_chapter(self.current_chapter + 1)
+            )
+
+    async def prefetch_next_chapter(self, chapter_number: int):
+        if chapter_number >= len(self.chapters):
+            return
+        try:
+            chapter = self.chapters[chapter_number]
+            pages = await scraper.get_manga_chapter_images(chapter.link)
+        except Exception:
+            return
+        self.prefetcher.prefetch(pages[:PREFETCH_NEXT_CHAPTER])
+
+    def cancel_prefetch(self):
+        self.prefetcher.cancel()
+        if self.strip_task is not None:
+            self.strip_task.cancel()
+            self.strip_task = None
+        if self.next_chapter_task is not None:
+            self.next_chapter_task.cancel()
+            self.next_chapter_task = None
+
+    async def on_timeout(self):
+        self.cancel_prefetch()
+        self.prefetcher.close()
+        await super().on_timeout()
+
+    @instrumented("update_page")
     async def update_page(self, interaction: discord.Interaction, page_number: int):
         await interaction.response.defer()
         self.current_page = page_number
         embed = await self.generate_embed()
-        await interaction.edit_original_response(embed=embed, file=self.file, view=self)
+        await self.send_embed(interaction, embed)
 
+    @instrumented("update_chapter")
     async def update_chapter(
         self, interaction: discord.Interaction, chapter_number: int
     ):
         await interaction.response.defer()
         self.current_chapter = chapter_number
+        self.cancel_prefetch()
         await self.get_chapter_data()
         embed = await self.generate_embed()
-        await interaction.edit_original_response(embed=embed, file=self.file, view=self)
+        await self.send_embed(interaction, embed)
+
+    def step(self, direction: int) -> int:
+        # the first page of the next or previous page, or strip in long strip mode
+        size = strips.STRIP_PAGES if self.strip_mode else 1
+        count = -(-len(self.pages) // size)
+        return (self.current_page // size + direction) % count * size
 
     @discord.ui.button(style=discord.ButtonStyle.gray, label="⬅️", row=0)
     async def cycle_left(
         self, button: discord.Button, interaction: discord.Interaction
     ):
-        await self.update_page(interaction, (self.current_page - 1) % len(self.pages))
+        await self.update_page(interaction, self.step(-1))
 
     @discord.ui.button(style=discord.ButtonStyle.gray, label="➡️", row=0)
     async def cycle_right(
         self, button: discord.Button, interaction: discord.Interaction
     ):
-        await self.update_page(interaction, (self.current_page + 1) % len(self.pages))
+        await self.update_page(interaction, self.step(1))
 
     @discord.ui.button(style=discord.ButtonStyle.gray, label="Previous Chapter", row=0)
     async def cycle_prev_chapter(
@@ -111,12 +256,23 @@ class MangaReaderView(discord.ui.View):
             interaction, (self.current_chapter + 1) % len(self.chapters)
         )
 
+    @discord.ui.button(style=discord.ButtonStyle.gray, label="Long Strip", row=1)
+    async def toggle_strip_mode(
+        self, button: discord.Button, interaction: discord.Interaction
+    ):
+        self.strip_mode = not self.strip_mode
+        button.label = "Single Page" if self.strip_mode else "Long Strip"
+        self.cancel_prefetch()
+        await self.update_page(interaction, self.step(0))
+
     @discord.ui.button(style=discord.ButtonStyle.gray, label="Bookmark", row=1)
     async def bookmark(self, button: discord.Button, interaction: discord.Interaction):
         await interaction.response.defer()
         backend = await Backend.get_instance()
         assert interaction.user is not None
         user_id = interaction.user.id
-        await backend.add_new_bookmark(user_id, self.manga_link, self.current_chapter)
+        await backend.add_new_bookmark(
+            user_id, self.manga_link, self.chapters[self.current_chapter].link
+        )
 
         await self.handle_bookmark_jumper(user_id)
@@ -1,15 +1,22 @@
+import asyncio
 import discord
 import utils.scraper as scraper  # type: ignore
 import utils.bot_util as bot_util  # type: ignore
 from utils.backend import Backend  # type: ignore
+from utils.ratelimit import BACKGROUND, wait_turn  # type: ignore
+from utils.search_index import SEARCH_LIMIT, index_mangas, search_manga  # type: ignore
 from .manga_chapter_selector import MangaChapterSelectorView  # type: ignore
+from utils.metrics import instrumented, timed  # type: ignore
 from typing import Optional
 
+# how many of the other results have their cover and description loaded at once
+SELECTOR_PREFETCH_CONCURRENCY = 3
+
 
 class MangaSelector(discord.ui.Select["MangaSelectorView"]):
     @staticmethod
     async def new_manga_selector(to_search: str) -> "MangaSelector":
-        top_searches = (await scraper.search_manga_links(to_search))[:10]
+        top_searches = await search_manga(to_search)
         return MangaSelector(top_searches, to_search)
 
     @staticmethod
@@ -22,6 +29,7 @@ class MangaSelector(discord.ui.Select["MangaSelectorView"]):
         self.to_search = to_search
         self.search_results = search_results
         self.selected_index: int = 0
+        self.prefetch_tasks: list[asyncio.Task] = []
 
         options = [
             discord.SelectOption(label=manga.name, value=str(i), default=i == 0)
@@ -30,6 +38,7 @@ class MangaSelector(discord.ui.Select["MangaSelectorView"]):
 
         super().__init__(options=options, row=0)
 
+    @instrumented("selector_generate_embed")
     async def generate_embed(self) -> discord.Embed:
         manga = self.search_results[self.selected_index]
         embed = discord.Embed(
@@ -44,14 +53,58 @@ class MangaSelector(discord.ui.Select["MangaSelectorView"]):
             value=f"[{manga.name}]({scraper.MANGAPARK_BASE_URL}{manga.link})",
             inline=False,
         )
-        self.file = await bot_util.url_to_image_file(
-            f"{scraper.MANGAPARK_BASE_URL}{manga.cover}"
+        # the cover and the description don't depend on each other
+        self.file, description = await asyncio.gather(
+            bot_util.url_to_image_file(f"{scraper.MANGAPARK_BASE_URL}{manga.cover}"),
+            scraper.get_manga_description(manga.link),
         )
-        description = await scraper.get_manga_description(manga.link)
         embed.set_image(url=f"attachment://{self.file.filename}")
         embed.description = description
+        self.prefetch()
         return embed
 
+    def prefetch(self):
+        # discord doesn't tell us when the dropdown is opened, so once the first
+        # result is shown warm the image and description caches for the others.
+        # a bookmark list can be long, only the first SEARCH_LIMIT are warmed
+        if len(self.prefetch_tasks) != 0:
+            return
+        semaphore = asyncio.Semaphore(SELECTOR_PREFETCH_CONCURRENCY)
+        for i, manga in enumerate(self.search_results[:SEARCH_LIMIT]):
+            if i == self.selected_index:
+                continue
+            task = asyncio.create_task(self.prefetch_manga(manga, semaphore))
+            task.add_done_callback(self.finish_prefetch)
+            self.prefetch_tasks.append(task)
+
+    async def prefetch_manga(self, manga: scraper.Manga, semaphore: asyncio.Semaphore):
+        # each task has its own context, the user's own requests keep their priority
+        BACKGROUND.set(True)
+        cover_url = f"{scraper.MANGAPARK_BASE_URL}{manga.cover}"
+
+        async def prefetch_cover():
+            await wait_turn(cover_url)
+            await bot_util.fetch_image_path(cover_url)
+
+        async def prefetch_description():
+            await wait_turn(f"{scraper.MANGAPARK_BASE_URL}{manga.link}")
+            await scraper.get_manga_description(manga.link)
+
+        async with semaphore:
+            await asyncio.gather(prefetch_cover(), prefetch_description())
+
+    def finish_prefetch(self, task: asyncio.Task):
+        # a failed prefetch isn't fatal, the result is fetched again when selected
+        if not task.cancelled():
+            task.exception()
+
+    def cancel_prefetch(self):
+        # downloads already started finish into the shared caches,
+        # the results still waiting for a slot are dropped
+        for task in self.prefetch_tasks:
+            task.cancel()
+
+    @instrumented("select_manga")
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
         assert type(self.values[0]) is str
@@ -62,9 +115,10 @@ class MangaSelector(discord.ui.Select["MangaSelectorView"]):
                 option.default = False
                 break
         self.options[self.selected_index].default = True
-        await interaction.edit_original_response(
-            embed=embed, view=self.view, file=self.file
-        )
+        with timed("discord_edit"):
+            await interaction.edit_original_response(
+                embed=embed, view=self.view, file=self.file
+            )
 
 
 class MangaSelectorView(discord.ui.View):
@@ -82,7 +136,12 @@ class MangaSelectorView(discord.ui.View):
         bookmarks = await backend.get_bookmarks(user_id)
         if len(bookmarks) == 0:
             return None
-        manga_objects = await scraper.convert_manga_links_to_manga_objects(bookmarks)
+        manga_objects = await scraper.convert_manga_links_to_manga_objects(
+            bookmarks, backend.update_manga_metadata
+        )
+        if len(manga_objects) == 0:
+            return None
+        await index_mangas(manga_objects)
         view = MangaSelectorView()
         await view.set_mangas(manga_objects)
         return view
@@ -90,6 +149,10 @@ class MangaSelectorView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=120)
 
+    async def on_timeout(self):
+        self.selector.cancel_prefetch()
+        await super().on_timeout()
+
     async def set_search(self, to_search: str):
         self.selector = await MangaSelector.new_manga_selector(to_search)
         self.add_item(self.selector)
@@ -104,6 +167,7 @@ class MangaSelectorView(discord.ui.View):
         link = self.selector.search_results[self.selector.selected_index].link
         assert interaction.user is not None
         user_id = interaction.user.id
+        self.selector.cancel_prefetch()
         new_view = await MangaChapterSelectorView.new_manga_chapter_selector_view(
             link, user_id
         )
@@ -0,0 +1,77 @@
+import discord
+from discord.ext import commands
+from utils.metrics import COLLECTORS, STAGES, hit_ratio  # type: ignore
+
+
+def format_stages() -> str:
+    lines = [f"{'stage':<24}{'count':>7}{'p50':>8}{'p99':>8}{'busy':>5}"]
+    for stage in sorted(STAGES.values(), key=lambda s: s.name):
+        latency = stage.latency
+        lines.append(
+            f"{stage.name[:23]:<24}{latency.count:>7}"
+            f"{latency.quantile(0.5) * 1000:>6.0f}ms"
+            f"{latency.quantile(0.99) * 1000:>6.0f}ms{stage.in_flight:>5}"
+        )
+    return "\n".join(lines)
+
+
+def format_caches() -> str:
+    lines = [f"{'cache':<16}{'size':>7}{'hit ratio':>11}"]
+    for name, stats in COLLECTORS["cache"]().items():
+        ratio = hit_ratio(stats)
+        shown = "-" if ratio is None else f"{ratio:.0%}"
+        lines.append(f"{name[:15]:<16}{stats['size']:>7}{shown:>11}")
+    return "\n".join(lines)
+
+
+def format_upstream() -> str:
+    lines = [f"{'host':<22}{'queue':>6}{'busy':>5}{'limit':>6}{'retries':>8}"]
+    for host, stats in COLLECTORS["upstream"]().items():
+        lines.append(
+            f"{host[:21]:<22}{stats['queue_depth']:>6}{stats['in_flight']:>5}"
+            f"{stats['concurrency_limit']:>6}{stats['retries']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def format_image_store() -> str:
+    stats = COLLECTORS["image_store"]()["disk"]
+    ratio = hit_ratio(stats)
+    shown = "-" if ratio is None else f"{ratio:.0%}"
+    return (
+        f"{stats['files']} files, {stats['size_bytes'] / 1024 / 1024:.0f} of "
+        f"{stats['max_bytes'] / 1024 / 1024:.0f} MiB, hit ratio {shown}, "
+        f"{stats['evictions']} evicted"
+    )
+
+
+def code_block(text: str) -> str:
+    # embed field values are capped at 1024 characters
+    return f"```\n{text[:1000]}\n```"
+
+
+class Stats(commands.Cog):
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+
+    @discord.command(name="stats", description="Show hot path latency and cache stats.")
+    @discord.default_permissions(administrator=True)
+    async def stats(self, ctx: discord.ApplicationContext):
+        embed = discord.Embed(title="Stats", color=discord.Colour.dark_grey())
+        embed.add_field(name="Stages", value=code_block(format_stages()), inline=False)
+        embed.add_field(name="Caches", value=code_block(format_caches()), inline=False)
+        embed.add_field(
+            name="Upstream", value=code_block(format_upstream()), inline=False
+        )
+        embed.add_field(
+            name="Image store", value=code_block(format_image_store()), inline=False
+        )
+        lag = COLLECTORS["loop_lag"]()["event_loop"]
+        embed.set_footer(
+            text=f"Event loop lag: {lag['last_ms']:.0f} ms now, {lag['max_ms']:.0f} ms max"
+        )
+        await ctx.respond(embed=embed, ephemeral=True)
+
+
+def setup(bot: discord.Bot):
+    bot.add_cog(Stats(bot))
@@ -0,0 +1,98 @@
+# runs the bot as several processes, each connecting its own range of shards,
+# and restarts the ones that exit. run it from src/ in place of bot.py:
+#
+#   python launcher.py --processes 4 [--shards 16] [--dry-run]
+#
+# the processes share mongo and the image store, see utils/results.py for
+# how they keep from scraping the same page at the same time
+import argparse
+import asyncio
+import aiohttp
+import os
+import signal
+import sys
+from os import getenv
+from dotenv import load_dotenv
+from utils.shards import split_shards  # type: ignore
+
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+# a process that keeps crashing is restarted no faster than this
+RESTART_DELAY = 5
+
+
+async def recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            GATEWAY_URL, headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def process_env(index: int, process_count: int, shard_count: int, shard_ids: list[int]):
+    env = dict(os.environ)
+    env.update(
+        PROCESS_INDEX=str(index),
+        PROCESS_COUNT=str(process_count),
+        SHARD_COUNT=str(shard_count),
+        SHARD_IDS=f"{shard_ids[0]}-{shard_ids[-1]}",
+    )
+    return env
+
+
+async def run_process(env: dict[str, str], stopping: asyncio.Event):
+    while not stopping.is_set():
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "bot.py", env=env
+        )
+        stop = asyncio.ensure_future(stopping.wait())
+        exited = asyncio.ensure_future(process.wait())
+        await asyncio.wait([stop, exited], return_when=asyncio.FIRST_COMPLETED)
+        if stopping.is_set():
+            process.terminate()
+            await exited
+            return
+        stop.cancel()
+        print(
+            f"Process {env['PROCESS_INDEX']} exited with {process.returncode}, "
+            f"restarting in {RESTART_DELAY} s"
+        )
+        await asyncio.sleep(RESTART_DELAY)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    # asks discord for the recommended count if left out
+    parser.add_argument("--shards", type=int)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    shard_count = args.shards
+    if shard_count is None:
+        token = getenv("BOT_TOKEN")
+        assert token is not None, "Bot token not found in environment variables."
+        shard_count = await recommended_shards(token)
+    # a process without shards would have nothing to do
+    process_count = min(args.processes, shard_count)
+    envs = [
+        process_env(index, process_count, shard_count, shard_ids)
+        for index, shard_ids in enumerate(split_shards(shard_count, process_count))
+    ]
+    for env in envs:
+        print(
+            f"Process {env['PROCESS_INDEX']}: shards {env['SHARD_IDS']} of {shard_count}"
+        )
+    if args.dry_run:
+        return
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stopping.set)
+    await asyncio.gather(*(run_process(env, stopping) for env in envs))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
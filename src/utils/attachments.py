@@ -0,0 +1,122 @@
+import discord
+import zlib
+from datetime import datetime, timedelta, timezone
+from os import getenv
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+from utils.backend import Backend  # type: ignore
+from utils.cache import TTLCache  # type: ignore
+from utils.images import DEFAULT_SETTINGS, ImageSettings  # type: ignore
+from utils.scraper import SingleFlight  # type: ignore
+
+# source image url -> (discord cdn url, expiry), in front of the mongo index
+ATTACHMENT_CACHE = TTLCache("attachments", maxsize=8192, ttl=None)
+# pages that aren't uploaded yet are only looked up in mongo once a minute
+MISSING_TTL = 60
+# signed cdn urls stop working at their "ex" timestamp, drop them a bit before
+EXPIRY_MARGIN = timedelta(hours=1)
+DEFAULT_LIFETIME = timedelta(hours=24)
+# channels only the bot posts to, comma separated. their messages are never
+# edited, so pages uploaded there stay up for later readers to link, unlike
+# the reader's own message, whose attachments the next page turn deletes.
+# discord limits sends per channel, the uploads are spread over all of them
+CACHE_CHANNEL_IDS = [
+    int(channel_id)
+    for channel_id in getenv("CACHE_CHANNEL_IDS", "").split(",")
+    if channel_id
+]
+CACHE_CHANNELS: list[discord.abc.Messageable] = []
+UPLOAD_FLIGHTS = SingleFlight("upload")
+
+
+def attachment_key(url: str, settings: ImageSettings = DEFAULT_SETTINGS) -> str:
+    # the same page processed with other settings is a different upload
+    return f"{settings.format}:{settings.quality}:{settings.max_width}x{settings.max_height}:{url}"
+
+
+def cdn_url_expiry(cdn_url: str) -> datetime:
+    expiry = parse_qs(urlparse(cdn_url).query).get("ex")
+    if expiry:
+        try:
+            return datetime.fromtimestamp(int(expiry[0], 16), timezone.utc)
+        except ValueError:
+            pass
+    return datetime.now(timezone.utc) + DEFAULT_LIFETIME
+
+
+def usable(expires_at: datetime) -> bool:
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at - EXPIRY_MARGIN > datetime.now(timezone.utc)
+
+
+def known_attachment_url(url: str) -> Optional[str]:
+    # memory only, for callers that can't wait on mongo
+    entry = ATTACHMENT_CACHE.get(attachment_key(url), count=False)
+    if entry is not None and entry[0] is not None and usable(entry[1]):
+        return entry[0]
+    return None
+
+
+async def find_attachment_url(url: str) -> Optional[str]:
+    key = attachment_key(url)
+    entry = ATTACHMENT_CACHE.get(key)
+    if entry is not None:
+        cdn_url, expires_at = entry
+        if cdn_url is None or usable(expires_at):
+            return cdn_url
+
+    backend = await Backend.get_instance()
+    attachment = await backend.find_attachment(key)
+    if attachment is not None and usable(attachment["expires_at"]):
+        ATTACHMENT_CACHE.set(key, (attachment["url"], attachment["expires_at"]))
+        return attachment["url"]
+
+    ATTACHMENT_CACHE.set(key, (None, None), ttl=MISSING_TTL)
+    return None
+
+
+async def save_attachment_url(url: str, cdn_url: str):
+    key = attachment_key(url)
+    expires_at = cdn_url_expiry(cdn_url)
+    ATTACHMENT_CACHE.set(key, (cdn_url, expires_at))
+    backend = await Backend.get_instance()
+    await backend.save_attachment(key, cdn_url, expires_at)
+
+
+async def open_cache_channels(client: discord.Client):
+    if len(CACHE_CHANNELS) != 0:
+        return
+    for channel_id in CACHE_CHANNEL_IDS:
+        channel = client.get_channel(channel_id)
+        if channel is None:
+            # the guild may be on another process's shards
+            channel = await client.fetch_channel(channel_id)
+        CACHE_CHANNELS.append(channel)
+
+
+async def upload_files(urls: list[str], files: list[discord.File]) -> list[str]:
+    # one message, so the parts of a strip expire together
+    channel = CACHE_CHANNELS[zlib.crc32(urls[0].encode()) % len(CACHE_CHANNELS)]
+    message = await channel.send(files=files)
+    cdn_urls = [attachment.url for attachment in message.attachments]
+    for url, cdn_url in zip(urls, cdn_urls):
+        await save_attachment_url(url, cdn_url)
+    return cdn_urls
+
+
+async def upload(urls: list[str], files: list[discord.File]) -> Optional[list[str]]:
+    # the cdn urls of the files uploaded to a cache channel, None without one.
+    # files of a caller that joined an upload already running aren't sent
+    if len(CACHE_CHANNELS) == 0:
+        return None
+    try:
+        return await UPLOAD_FLIGHTS.do(
+            attachment_key(urls[0]), lambda: upload_files(urls, files)
+        )
+    except discord.HTTPException as error:
+        print(f"Failed to upload to the cache channel: {error!r}")
+        return None
+    finally:
+        for file in files:
+            file.close()
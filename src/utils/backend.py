@@ -1,70 +1,281 @@
 import motor
 import motor.motor_asyncio
 from dataclasses import dataclass
-from typing import Optional, Mapping
-from .scraper import Manga  # type: ignore
+from datetime import datetime, timezone
+from os import getenv
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import TYPE_CHECKING, Any, Optional, Mapping
+from .cache import TTLCache  # type: ignore
+from .metrics import instrumented  # type: ignore
+from .shards import SHARD_CONFIG  # type: ignore
 import asyncio
 
+if TYPE_CHECKING:
+    # NOTE: only for the annotation, the scraper imports the backend
+    from .scraper import Manga  # type: ignore
+
+MONGODB_URI = getenv("MONGODB_URI", "mongodb://localhost:27017/")
+# how many users' bookmarks are kept in memory
+BOOKMARK_CACHE_SIZE = 4096
+# with several processes the others write bookmarks too, so cached ones expire
+SHARED_BOOKMARK_CACHE_TTL = 60
+
 
 class Backend:
     __instance: Optional["Backend"] = None
     __lock = asyncio.Lock()
 
-    def __init__(self):
+    def __init__(self, client: Optional[Any] = None):
         assert self.__instance is None, "Backend instance already exists."
-        self.client = motor.motor_asyncio.AsyncIOMotorClient(
-            "mongodb://localhost:27017/"
-        )
+        if client is None:
+            client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
+        self.client = client
         self.db = self.client["db"]
+        # NOTE: users only holds the legacy bookmarks array, every bookmark
+        # is now its own document keyed by (user_id, link)
         self.users = self.db["users"]
+        self.bookmarks = self.db["bookmarks"]
+        self.attachments = self.db["attachments"]
+        # manga_link -> every chapter ever seen for it, oldest first
+        self.chapters = self.db["chapters"]
+        # "operation:url" -> parsed and packed scrape result, see utils/results.py
+        self.results = self.db["results"]
+        # manga_link -> name and cover of every series the bot has seen,
+        # the search index is built from it (see utils/search_index.py)
+        self.series = self.db["series"]
+        # attachment key -> name and size of the processed page in the image store
+        self.images = self.db["images"]
+        # "operation:url" -> the process scraping it right now, see utils/results.py
+        self.leases = self.db["leases"]
+        # user_id -> {link: bookmark}, holding every bookmark of the user,
+        # so a missing link is a definite miss
+        self.bookmark_cache = TTLCache(
+            "bookmarks",
+            BOOKMARK_CACHE_SIZE,
+            ttl=None if SHARD_CONFIG.process_count == 1 else SHARED_BOOKMARK_CACHE_TTL,
+        )
+        # bumped on every write, a read that raced with a write isn't cached
+        self.bookmark_writes = 0
 
     @classmethod
     async def get_instance(cls) -> "Backend":
         async with cls.__lock:
             if cls.__instance is None:
-                cls.__instance = Backend()
+                instance = Backend()
+                await instance.setup()
+                cls.__instance = instance
             return cls.__instance
 
-    async def add_new_user(self, user_id: int):
-        # we only add a new user if the user doesn't exist
-        await self.users.update_one(
-            {"_id": user_id}, {"$setOnInsert": {"bookmarks": []}}, upsert=True
+    async def setup(self):
+        await self.bookmarks.create_index(
+            [("user_id", ASCENDING), ("link", ASCENDING)], unique=True
         )
+        await self.bookmarks.create_index("link")
+        # expired cdn urls are removed by mongo itself
+        await self.attachments.create_index("expires_at", expireAfterSeconds=0)
+        await self.results.create_index("expires_at", expireAfterSeconds=0)
+        await self.leases.create_index("expires_at", expireAfterSeconds=0)
+        await self.migrate_user_bookmarks()
 
-    async def add_new_bookmark(
-        self, user_id: int, manga_link: int, chapter_number: int
-    ):
-        await self.add_new_user(user_id)
+    async def migrate_user_bookmarks(self):
+        # moves bookmarks out of the old users.bookmarks arrays,
+        # existing bookmark documents win over the legacy entries
+        async for user in self.users.find({"bookmarks.0": {"$exists": True}}):
+            try:
+                await self.bookmarks.insert_many(
+                    [
+                        {**bookmark, "user_id": user["_id"]}
+                        for bookmark in user["bookmarks"]
+                    ],
+                    ordered=False,
+                )
+            except BulkWriteError as error:
+                # duplicate keys are bookmarks that were already migrated
+                if any(e["code"] != 11000 for e in error.details["writeErrors"]):
+                    raise
+            await self.users.update_one(
+                {"_id": user["_id"]}, {"$unset": {"bookmarks": ""}}
+            )
+            self.bookmark_cache.pop(user["_id"])
 
-        # if the manga link isn't already registered with the user,
-        # then we push it
-        await self.users.update_one(
-            {"_id": user_id, "bookmarks.link": {"$ne": manga_link}},
-            {"$push": {"bookmarks": {"link": manga_link, "chapter": chapter_number}}},
-        )
+    async def load_bookmarks(self, user_id: int) -> dict[str, dict[str, Any]]:
+        cached = self.bookmark_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        writes = self.bookmark_writes
+        # _id is an ObjectId, so sorting on it keeps the order bookmarks were added in
+        cursor = self.bookmarks.find(
+            {"user_id": user_id}, {"_id": 0, "user_id": 0}
+        ).sort("_id", ASCENDING)
+        bookmarks = {
+            bookmark["link"]: bookmark for bookmark in await cursor.to_list(length=None)
+        }
+        if writes == self.bookmark_writes:
+            self.bookmark_cache.set(user_id, bookmarks)
+        return bookmarks
 
-        # if the manga link is registered with the user,
-        # we update the bookmark
-        await self.users.update_one(
-            {"_id": user_id, "bookmarks.link": manga_link},
-            {"$set": {"bookmarks.$.chapter": chapter_number}},
+    @instrumented("backend.add_new_bookmark")
+    async def add_new_bookmark(self, user_id: int, manga_link: str, chapter_link: str):
+        # the chapter is stored by link, positions shift when chapters are added
+        self.bookmark_writes += 1
+        await self.bookmarks.update_one(
+            {"user_id": user_id, "link": manga_link},
+            {"$set": {"chapter_link": chapter_link}, "$unset": {"chapter": ""}},
+            upsert=True,
         )
 
-    async def get_bookmarks(self, user_id: int) -> list[Mapping[str, str]]:
-        await self.add_new_user(user_id)
-        user = await self.users.find_one({"_id": user_id}, {"_id": 0, "bookmarks": 1})
-        return user.get("bookmarks", [])
+        cached = self.bookmark_cache.get(user_id, count=False)
+        if cached is not None:
+            bookmark = cached.setdefault(manga_link, {"link": manga_link})
+            bookmark["chapter_link"] = chapter_link
+            bookmark.pop("chapter", None)
 
-    async def find_bookmark_chapter(
-        self, user_id: int, manga_link: str
-    ) -> Optional[int]:
-        await self.add_new_user(user_id)
+    @instrumented("backend.update_manga_metadata")
+    async def update_manga_metadata(self, manga: "Manga"):
+        # the name and cover are stored on every bookmark of that manga,
+        # so /bookmarks can render without scraping
+        metadata = {
+            "name": manga.name,
+            "cover": manga.cover,
+            "refreshed_at": datetime.now(timezone.utc),
+        }
+        self.bookmark_writes += 1
+        await self.bookmarks.update_many({"link": manga.link}, {"$set": metadata})
+
+        for bookmarks in self.bookmark_cache.values():
+            if manga.link in bookmarks:
+                bookmarks[manga.link].update(metadata)
 
-        user = await self.users.find_one(
-            {"_id": user_id, "bookmarks.link": manga_link}, {"_id": 0, "bookmarks.$": 1}
+    def cache_stats(self) -> dict[str, int]:
+        return self.bookmark_cache.stats()
+
+    @instrumented("backend.get_bookmarks")
+    async def get_bookmarks(self, user_id: int) -> list[Mapping[str, Any]]:
+        bookmarks = await self.load_bookmarks(user_id)
+        return [dict(bookmark) for bookmark in bookmarks.values()]
+
+    @instrumented("backend.get_bookmarked_series")
+    async def get_bookmarked_series(self) -> list[tuple[str, int]]:
+        # every bookmarked manga with how many users bookmarked it, most popular first
+        cursor = self.bookmarks.aggregate(
+            [
+                {"$group": {"_id": "$link", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+            ]
         )
+        return [(series["_id"], series["count"]) async for series in cursor]
+
+    @instrumented("backend.find_bookmark")
+    async def find_bookmark(
+        self, user_id: int, manga_link: str
+    ) -> Optional[Mapping[str, Any]]:
+        bookmarks = await self.load_bookmarks(user_id)
+        bookmark = bookmarks.get(manga_link)
 
-        if len(user["bookmarks"]) != 0:
-            return int(user["bookmarks"][0]["chapter"])
+        if bookmark is not None:
+            return dict(bookmark)
 
         return None
+
+    @instrumented("backend.load_chapters")
+    async def load_chapters(self, manga_link: str) -> list[Mapping[str, str]]:
+        series = await self.chapters.find_one({"_id": manga_link})
+        return [] if series is None else series["chapters"]
+
+    @instrumented("backend.append_chapters")
+    async def append_chapters(self, manga_link: str, chapters: list[Mapping[str, str]]):
+        # $addToSet keeps the order and skips chapters another writer already added
+        await self.chapters.update_one(
+            {"_id": manga_link},
+            {"$addToSet": {"chapters": {"$each": chapters}}},
+            upsert=True,
+        )
+
+    @instrumented("backend.find_attachment")
+    async def find_attachment(self, key: str) -> Optional[Mapping[str, Any]]:
+        return await self.attachments.find_one({"_id": key})
+
+    @instrumented("backend.save_attachment")
+    async def save_attachment(self, key: str, url: str, expires_at: datetime):
+        await self.attachments.update_one(
+            {"_id": key}, {"$set": {"url": url, "expires_at": expires_at}}, upsert=True
+        )
+
+    @instrumented("backend.find_result")
+    async def find_result(self, key: str) -> Optional[Mapping[str, Any]]:
+        return await self.results.find_one({"_id": key})
+
+    @instrumented("backend.save_result")
+    async def save_result(self, key: str, data: bytes, expires_at: datetime):
+        await self.results.update_one(
+            {"_id": key},
+            {"$set": {"data": data, "expires_at": expires_at}},
+            upsert=True,
+        )
+
+    @instrumented("backend.find_result_expiries")
+    async def find_result_expiries(self, keys: list[str]) -> dict[str, datetime]:
+        # only the expiry, the packed results can be large
+        cursor = self.results.find({"_id": {"$in": keys}}, {"expires_at": 1})
+        return {document["_id"]: document["expires_at"] async for document in cursor}
+
+    @instrumented("backend.find_image")
+    async def find_image(self, key: str) -> Optional[Mapping[str, Any]]:
+        return await self.images.find_one({"_id": key})
+
+    @instrumented("backend.save_image")
+    async def save_image(self, key: str, name: str, size: int):
+        await self.images.update_one(
+            {"_id": key}, {"$set": {"name": name, "size": size}}, upsert=True
+        )
+
+    @instrumented("backend.acquire_lease")
+    async def acquire_lease(self, key: str, owner: str, expires_at: datetime) -> bool:
+        # takes the lease if nobody holds it or the holder's has run out,
+        # a live one makes the upsert collide on _id
+        try:
+            await self.leases.update_one(
+                {"_id": key, "expires_at": {"$lt": datetime.now(timezone.utc)}},
+                {"$set": {"owner": owner, "expires_at": expires_at}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    @instrumented("backend.renew_lease")
+    async def renew_lease(self, key: str, owner: str, expires_at: datetime) -> bool:
+        result = await self.leases.update_one(
+            {"_id": key, "owner": owner}, {"$set": {"expires_at": expires_at}}
+        )
+        return result.matched_count == 1
+
+    @instrumented("backend.release_lease")
+    async def release_lease(self, key: str, owner: str):
+        await self.leases.delete_one({"_id": key, "owner": owner})
+
+    @instrumented("backend.load_series")
+    async def load_series(self) -> list[Mapping[str, Any]]:
+        return await self.series.find({}).to_list(None)
+
+    @instrumented("backend.save_series")
+    async def save_series(self, mangas: list["Manga"]):
+        seen_at = datetime.now(timezone.utc)
+        await asyncio.gather(
+            *(
+                self.series.update_one(
+                    {"_id": manga.link},
+                    {
+                        "$set": {
+                            "name": manga.name,
+                            "cover": manga.cover,
+                            "seen_at": seen_at,
+                        }
+                    },
+                    upsert=True,
+                )
+                for manga in mangas
+            )
+        )
@@ -1,30 +1,50 @@
-from aiohttp_client_cache import CachedSession, MongoDBBackend
-from datetime import timedelta
-from io import BytesIO
+from pathlib import Path
 import discord
 from utils.backend import Backend  # type: ignore
+from utils.session import get_session  # type: ignore
+from utils.executor import run_cpu  # type: ignore
+from utils.ratelimit import limited_get  # type: ignore
+from utils.metrics import instrumented  # type: ignore
+from utils.images import DEFAULT_SETTINGS, ImageSettings, process_image  # type: ignore
+from utils.attachments import attachment_key  # type: ignore
+import utils.image_store as image_store  # type: ignore
+import utils.scraper as scraper  # type: ignore
 
 
-async def url_to_image_file(url: str) -> discord.File:
-    cache = MongoDBBackend(expire_after=timedelta(days=1))
-    async with CachedSession(cache=cache) as session:
-        async with session.get(url) as response:
-            assert response.status == 200, "Response status not 200."
+async def fetch_image_path(
+    url: str, settings: ImageSettings = DEFAULT_SETTINGS
+) -> Path:
+    # processed pages live in the on disk image store, see utils/image_store.py
+    key = attachment_key(url, settings)
+    path = await image_store.find_image(key)
+    if path is None:
+        path = await scraper.IMAGE_FLIGHTS.do(
+            key, lambda: download_image(url, settings)
+        )
+    return path
+
+
+@instrumented("download_image")
+async def download_image(url: str, settings: ImageSettings) -> Path:
+    session = get_session()
+    # the image store keeps the processed page, see utils/image_store.py
+    data = await limited_get(session, url, lambda response: response.read())
 
-            data = await response.read()
-            buffer = BytesIO(data)
-            buffer.seek(0)
+    data, file_ext = await run_cpu(process_image, data, settings)
+    return await image_store.save_image(attachment_key(url, settings), data, file_ext)
 
-            file_ext = url.split(".")[-1].split("?")[0]
-            assert file_ext in [
-                "png",
-                "jpg",
-                "jpeg",
-                "gif",
-            ], "Invalid image file extension."
 
-            filename = f"image.{file_ext}"
+def image_filename(path: Path) -> str:
+    return f"image{path.suffix}"
 
-            file = discord.File(buffer, filename=filename)
 
-            return file
+def path_to_image_file(path: Path) -> discord.File:
+    # opened right away, so the upload streams from disk even if the file
+    # is evicted in the meantime
+    return discord.File(path, filename=image_filename(path))
+
+
+@instrumented("url_to_image_file")
+async def url_to_image_file(url: str) -> discord.File:
+    path = await fetch_image_path(url)
+    return path_to_image_file(path)
@@ -0,0 +1,106 @@
+import functools
+import time
+from .metrics import register_collector  # type: ignore
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# every named cache registers itself here so its counters can be reported
+CACHES: dict[str, "TTLCache"] = {}
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: Optional[float],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at >= self.clock():
+                if count:
+                    self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+            del self.entries[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = float("inf") if ttl is None else self.clock() + ttl
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def replace(self, key: Hashable, value: Any) -> bool:
+        # swaps the value of a live entry without extending its lifetime
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < self.clock():
+            return False
+        self.entries[key] = (entry[0], value)
+        return True
+
+    def values(self) -> list[Any]:
+        # NOTE: doesn't check expiry or touch the lru order
+        return [value for _, value in self.entries.values()]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+register_collector("cache", lambda: {name: c.stats() for name, c in CACHES.items()})
+
+
+def cached(cache: TTLCache):
+    # caches the result of an async function keyed by its positional arguments
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args):
+            value = cache.get(args, _MISSING)
+            if value is _MISSING:
+                value = await func(*args)
+                cache.set(args, value)
+            return value
+
+        wrapper.cache = cache  # type: ignore
+        return wrapper
+
+    return decorator
@@ -0,0 +1,102 @@
+import re
+import weakref
+from typing import Optional
+from .chapter_store import ChapterList  # type: ignore
+
+# discord caps select menus at 25 options and option labels at 100 characters
+CHUNK_SIZE = 25
+MAX_LABEL_LENGTH = 100
+
+CHAPTER_NUMBER = re.compile(r"ch(?:apter)?\.?\s*(\d+(?:\.\d+)?)", re.IGNORECASE)
+ANY_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def chapter_number(name: str) -> Optional[float]:
+    match = CHAPTER_NUMBER.search(name)
+    if match is not None:
+        return float(match.group(1))
+    match = ANY_NUMBER.search(name)
+    if match is not None:
+        return float(match.group(0))
+    return None
+
+
+class ChapterIndex:
+    # one per manga, shared by every open selector view of it,
+    # everything past the chapter list itself is built on first use
+    def __init__(self, manga_link: str, chapters: ChapterList):
+        self.manga_link = manga_link
+        self.chapters = chapters
+        self.version = chapters.version
+        self.chunk_labels: dict[int, list[tuple[str, str]]] = {}
+        self.numbers: Optional[dict[float, int]] = None
+        self.names: Optional[list[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.chapters)
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-len(self.chapters) // CHUNK_SIZE))
+
+    def chunk_of(self, chapter_index: int) -> int:
+        return chapter_index // CHUNK_SIZE
+
+    def chunk(self, chunk: int) -> list[tuple[str, str]]:
+        # (label, value) pairs for one select menu page
+        labels = self.chunk_labels.get(chunk)
+        if labels is None:
+            start = chunk * CHUNK_SIZE
+            labels = [
+                (chapter.name[:MAX_LABEL_LENGTH], str(start + i))
+                for i, chapter in enumerate(self.chapters[start : start + CHUNK_SIZE])
+            ]
+            self.chunk_labels[chunk] = labels
+        return labels
+
+    def find(self, query: str) -> Optional[int]:
+        # by chapter number first ("12", "12.5"), then by name
+        query = query.strip()
+        if query == "":
+            return None
+
+        try:
+            number: Optional[float] = float(query)
+        except ValueError:
+            number = chapter_number(query)
+        if number is not None:
+            if self.numbers is None:
+                self.numbers = {}
+                for i, chapter in enumerate(self.chapters):
+                    found = chapter_number(chapter.name)
+                    if found is not None:
+                        self.numbers.setdefault(found, i)
+            if number in self.numbers:
+                return self.numbers[number]
+
+        if self.names is None:
+            self.names = [chapter.name.casefold() for chapter in self.chapters]
+        query = query.casefold()
+        for i, name in enumerate(self.names):
+            if query in name:
+                return i
+        return None
+
+
+_indexes: "weakref.WeakValueDictionary[str, ChapterIndex]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def get_chapter_index(manga_link: str, chapters: ChapterList) -> ChapterIndex:
+    # views keep the index alive, it goes away with the last one,
+    # a chapter list that gained chapters gets a new index
+    index = _indexes.get(manga_link)
+    if (
+        index is None
+        or index.chapters is not chapters
+        or index.version != chapters.version
+    ):
+        index = ChapterIndex(manga_link, chapters)
+        _indexes[manga_link] = index
+    return index
@@ -0,0 +1,101 @@
+from collections.abc import Sequence
+from typing import Any, Mapping, Optional
+import utils.scraper as scraper  # type: ignore
+from utils.backend import Backend  # type: ignore
+from utils.cache import TTLCache  # type: ignore
+from utils.search_index import index_mangas  # type: ignore
+
+Chapter = scraper.Chapter
+
+# merged chapter lists per series, the full history lives in mongo
+CHAPTER_LISTS = TTLCache("chapter_lists", maxsize=256, ttl=None)
+CHAPTER_LIST_FLIGHTS = scraper.SingleFlight("chapter_list")
+
+
+class ChapterList(Sequence):
+    # oldest chapter first, new releases are only ever appended,
+    # so a chapter keeps its index for as long as the series is stored.
+    # one instance per series is shared by every view, which only read it
+    def __init__(self, manga_link: str, chapters: Sequence[Chapter]):
+        self.manga_link = manga_link
+        self.chapters: list[Chapter] = []
+        self.positions: dict[str, int] = {}
+        # bumped on every merge that added chapters
+        self.version = 0
+        # the scraped list last merged in, to skip merging the same one twice
+        self.source: Optional[Sequence[Chapter]] = None
+        self.append(chapters)
+
+    def __getitem__(self, index):
+        return self.chapters[index]
+
+    def __len__(self) -> int:
+        return len(self.chapters)
+
+    def index_of(self, chapter_link: str) -> Optional[int]:
+        return self.positions.get(chapter_link)
+
+    def append(self, chapters: Sequence[Chapter]):
+        for chapter in chapters:
+            if chapter.link not in self.positions:
+                self.positions[chapter.link] = len(self.chapters)
+                self.chapters.append(chapter)
+
+    def merge(self, scraped: Sequence[Chapter]) -> list[Chapter]:
+        new_chapters = [
+            chapter for chapter in scraped if chapter.link not in self.positions
+        ]
+        self.append(new_chapters)
+        if len(new_chapters) != 0:
+            self.version += 1
+        # the scraped list again, made of the objects held here,
+        # so a series is kept in memory once however many lists show it
+        self.source = tuple(self.chapters[self.positions[c.link]] for c in scraped)
+        return new_chapters
+
+    def bookmark_index(self, bookmark: Optional[Mapping[str, Any]]) -> Optional[int]:
+        if bookmark is None:
+            return None
+        if "chapter_link" in bookmark:
+            return self.index_of(bookmark["chapter_link"])
+        # bookmarks from before chapter links were stored hold a position
+        if "chapter" in bookmark and 0 <= int(bookmark["chapter"]) < len(self):
+            return int(bookmark["chapter"])
+        return None
+
+
+def to_documents(chapters: list[Chapter]) -> list[dict[str, str]]:
+    return [{"link": chapter.link, "name": chapter.name} for chapter in chapters]
+
+
+async def load_chapter_list(manga_link: str) -> ChapterList:
+    chapter_list = CHAPTER_LISTS.get(manga_link)
+    if chapter_list is None:
+        backend = await Backend.get_instance()
+        stored = await backend.load_chapters(manga_link)
+        chapter_list = ChapterList(
+            manga_link, [Chapter(c["link"], c["name"]) for c in stored]
+        )
+        CHAPTER_LISTS.set(manga_link, chapter_list)
+
+    scraped = await scraper.get_manga_chapters(manga_link)
+    if scraped is not chapter_list.source:
+        new_chapters = chapter_list.merge(scraped)
+        scraper.CHAPTERS_CACHE.replace((manga_link,), chapter_list.source)
+        if len(new_chapters) != 0:
+            backend = await Backend.get_instance()
+            await backend.append_chapters(manga_link, to_documents(new_chapters))
+    return chapter_list
+
+
+async def get_chapter_list(manga_link: str) -> ChapterList:
+    return await CHAPTER_LIST_FLIGHTS.do(
+        manga_link, lambda: load_chapter_list(manga_link)
+    )
+
+
+async def refresh_chapter_list(manga_link: str):
+    page = await scraper.refresh_manga(manga_link)
+    await get_chapter_list(manga_link)
+    if page.cover != "":
+        await index_mangas([scraper.Manga(manga_link, page.name, page.cover)])
@@ -0,0 +1,67 @@
+import json
+from os import getenv
+from typing import Any, Mapping, Sequence
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None  # type: ignore
+
+# parsed results are stored column wise, every column as one shared prefix plus
+# the suffix of each value, e.g. all chapter links of a series start with its link
+#   {"v": 1, "n": rows, "c": [[prefix, [suffix, ...]], ...]}
+FORMAT_VERSION = 1
+
+# "msgpack", or "json" to store plain utf-8 text
+CODEC = getenv("RESULT_CODEC", "msgpack" if msgpack is not None else "json")
+assert CODEC in ("msgpack", "json"), f"Unknown or unavailable codec: {CODEC}"
+assert CODEC != "msgpack" or msgpack is not None, "msgpack is not installed"
+
+
+def dumps(value: Any) -> bytes:
+    if CODEC == "msgpack":
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: bytes) -> Any:
+    # json text always starts with an ascii character, msgpack maps never do
+    if data[:1] in (b"{", b"[", b'"'):
+        return json.loads(data)
+    assert msgpack is not None, "msgpack is needed to read this value"
+    return msgpack.unpackb(data, raw=False)
+
+
+def common_prefix(values: Sequence[str]) -> str:
+    if len(values) == 0:
+        return ""
+    low, high = min(values), max(values)
+    i = 0
+    while i < len(low) and low[i] == high[i]:
+        i += 1
+    return low[:i]
+
+
+def to_columns(rows: Sequence[tuple[str, ...]], width: int) -> dict[str, Any]:
+    columns = []
+    for column in range(width):
+        values = [row[column] for row in rows]
+        prefix = common_prefix(values)
+        columns.append([prefix, [value[len(prefix) :] for value in values]])
+    return {"v": FORMAT_VERSION, "n": len(rows), "c": columns}
+
+
+def from_columns(packed: Mapping[str, Any]) -> list[tuple[str, ...]]:
+    assert packed["v"] == FORMAT_VERSION, f"Unknown format version: {packed['v']}"
+    columns = [
+        [prefix + suffix for suffix in suffixes] for prefix, suffixes in packed["c"]
+    ]
+    return list(zip(*columns)) if columns else [() for _ in range(packed["n"])]
+
+
+def pack_rows(rows: Sequence[tuple[str, ...]], width: int) -> bytes:
+    return dumps(to_columns(rows, width))
+
+
+def unpack_rows(data: bytes) -> list[tuple[str, ...]]:
+    return from_columns(loads(data))
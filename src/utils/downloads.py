@@ -0,0 +1,191 @@
+import aiohttp
+import asyncio
+import hashlib
+import re
+import shutil
+import time
+import zipfile
+from os import getenv
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+from urllib.parse import urlparse
+import utils.scraper as scraper  # type: ignore
+from utils.session import get_session  # type: ignore
+from utils.executor import run_cpu  # type: ignore
+from utils.ratelimit import limited_get  # type: ignore
+from utils.metrics import instrumented  # type: ignore
+
+DOWNLOAD_DIR = Path(getenv("DOWNLOAD_DIR", "downloads"))
+DOWNLOAD_CONCURRENCY = int(getenv("DOWNLOAD_CONCURRENCY", "4"))
+# finished archives are served again until they are this old
+DOWNLOAD_MAX_AGE = 24 * 60 * 60
+# the oldest archives are removed once the directory is bigger than this
+DOWNLOAD_MAX_BYTES = int(getenv("DOWNLOAD_MAX_BYTES", str(2 * 1024**3)))
+# images are written to disk as they arrive, never held whole in memory
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_FLIGHTS = scraper.SingleFlight("download")
+
+Chapter = scraper.Chapter
+
+
+def safe_name(text: str) -> str:
+    return re.sub(r"[^\w.()-]+", " ", text).strip()[:80] or "untitled"
+
+
+def archive_filename(manga_name: str, first: int, last: int) -> str:
+    return f"{safe_name(manga_name)} {first + 1:04d}-{last + 1:04d}.cbz"
+
+
+def archive_path(manga_link: str, first: int, last: int) -> Path:
+    # keyed by the link, different series can share a name
+    digest = hashlib.sha1(manga_link.encode()).hexdigest()[:16]
+    return DOWNLOAD_DIR / f"{digest} {first + 1:04d}-{last + 1:04d}.cbz"
+
+
+def page_path(stage: Path, page: int, url: str) -> Path:
+    suffix = Path(urlparse(url).path).suffix.lower() or ".jpg"
+    return stage / f"{page + 1:03d}{suffix}"
+
+
+def path_size(path: Path) -> int:
+    try:
+        if path.is_dir():
+            return sum(
+                file.stat().st_size for file in path.rglob("*") if file.is_file()
+            )
+        return path.stat().st_size
+    except FileNotFoundError:
+        # removed while scanning
+        return 0
+
+
+def remove_path(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def sweep_archives(
+    max_age: float = DOWNLOAD_MAX_AGE, max_bytes: int = DOWNLOAD_MAX_BYTES
+):
+    # also the staged pages and half written archives failed downloads left,
+    # unless that download is running again
+    cutoff = time.time() - max_age
+    kept: list[tuple[float, Path]] = []
+    for path in DOWNLOAD_DIR.glob("*.cbz*"):
+        archive = path.with_name(path.name.split(".cbz")[0] + ".cbz")
+        if archive in DOWNLOAD_FLIGHTS.calls:
+            continue
+        try:
+            modified = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if modified < cutoff:
+            remove_path(path)
+        else:
+            kept.append((modified, path))
+
+    # then the oldest, until what's left fits the cap. running downloads
+    # aren't counted, they can't be removed anyway
+    kept.sort()
+    sizes = [path_size(path) for _, path in kept]
+    size = sum(sizes)
+    for (_, path), path_bytes in zip(kept, sizes):
+        if size <= max_bytes:
+            break
+        remove_path(path)
+        size -= path_bytes
+
+
+async def stream_page(url: str, path: Path):
+    # pages finished by an earlier, failed download are kept
+    if path.exists():
+        return
+    partial = path.with_name(path.name + ".part")
+
+    async def read(response: aiohttp.ClientResponse):
+        with partial.open("wb") as file:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                file.write(chunk)
+
+    await limited_get(get_session(), url, read)
+    partial.replace(path)
+
+
+def write_archive(archive: Path, entries: list[tuple[Path, str]]):
+    # images are already compressed, storing them keeps this to a file copy
+    partial = archive.with_name(archive.name + ".part")
+    with zipfile.ZipFile(partial, "w", zipfile.ZIP_STORED) as zip_file:
+        for path, name in entries:
+            zip_file.write(path, name)
+    partial.replace(archive)
+
+
+@instrumented("download_chapters")
+async def download_chapters(
+    chapters: Sequence[tuple[int, Chapter]],
+    archive: Path,
+    concurrency: int = DOWNLOAD_CONCURRENCY,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Path:
+    # pages are staged next to the archive, one directory per chapter,
+    # so a download that failed part way picks up where it stopped
+    stage = archive.with_name(archive.name + ".parts")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def list_pages(chapter: Chapter) -> list[str]:
+        async with semaphore:
+            return await scraper.get_manga_chapter_images(chapter.link)
+
+    chapter_pages = await asyncio.gather(
+        *(list_pages(chapter) for _, chapter in chapters)
+    )
+    jobs: list[tuple[str, Path]] = []
+    entries: list[tuple[Path, str]] = []
+    for (number, chapter), pages in zip(chapters, chapter_pages):
+        chapter_stage = stage / f"{number + 1:04d}"
+        chapter_stage.mkdir(parents=True, exist_ok=True)
+        for page, url in enumerate(pages):
+            path = page_path(chapter_stage, page, url)
+            jobs.append((url, path))
+            entries.append(
+                (path, f"{number + 1:04d} {safe_name(chapter.name)}/{path.name}")
+            )
+
+    done = 0
+
+    async def fetch(url: str, path: Path):
+        nonlocal done
+        async with semaphore:
+            await stream_page(url, path)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(jobs))
+
+    # every page gets its chance before a failure is raised, so a retry has less left
+    results = await asyncio.gather(
+        *(fetch(url, path) for url, path in jobs), return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if len(errors) != 0:
+        raise errors[0]
+
+    await run_cpu(write_archive, archive, entries)
+    shutil.rmtree(stage, ignore_errors=True)
+    return archive
+
+
+async def get_archive(
+    manga_link: str, chapters: Sequence[Chapter], first: int, last: int
+) -> Path:
+    # chapter positions never change, so a range maps to one archive
+    archive = archive_path(manga_link, first, last)
+    if archive.exists():
+        return archive
+    DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    sweep_archives()
+    selected = [(number, chapters[number]) for number in range(first, last + 1)]
+    return await DOWNLOAD_FLIGHTS.do(
+        archive, lambda: download_chapters(selected, archive)
+    )
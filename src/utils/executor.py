@@ -0,0 +1,139 @@
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from os import getenv
+from typing import Any, Callable, Optional
+from .metrics import register_collector  # type: ignore
+
+# "thread", "process", or "inline" to run on the event loop like before
+EXECUTOR_KIND = getenv("EXECUTOR_KIND", "thread")
+EXECUTOR_WORKERS = int(getenv("EXECUTOR_WORKERS", "4"))
+# at most this many jobs are submitted to the pool at once,
+# any further callers wait on the event loop until a slot frees up
+EXECUTOR_QUEUE_SIZE = int(getenv("EXECUTOR_QUEUE_SIZE", "32"))
+
+
+class CpuExecutor:
+    def __init__(
+        self,
+        kind: str = EXECUTOR_KIND,
+        workers: int = EXECUTOR_WORKERS,
+        queue_size: int = EXECUTOR_QUEUE_SIZE,
+    ):
+        assert kind in ("thread", "process", "inline"), f"Unknown executor: {kind}"
+        self.kind = kind
+        self.pool: Optional[Executor] = None
+        if kind == "thread":
+            self.pool = ThreadPoolExecutor(workers, thread_name_prefix="cpu")
+        elif kind == "process":
+            self.pool = ProcessPoolExecutor(workers)
+        self.slots = asyncio.Semaphore(queue_size)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pool is None:
+            self.completed += 1
+            return func(*args)
+
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, functools.partial(func, *args))
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.slots.release()
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+        }
+
+
+_executor: Optional[CpuExecutor] = None
+
+
+def get_executor() -> CpuExecutor:
+    global _executor
+    if _executor is None:
+        _executor = CpuExecutor()
+    return _executor
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any) -> Any:
+    # NOTE: with the process pool, func and its arguments have to be picklable,
+    # so pass module level functions
+    return await get_executor().run(func, *args)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+class LoopLagMonitor:
+    # measures how late the event loop wakes up a sleeping task,
+    # which is how long gateway heartbeats and button acks are held up
+    def __init__(self, interval: float = 0.25, warn_threshold: float = 0.1):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.task: Optional[asyncio.Task] = None
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.total += lag
+            self.samples += 1
+            if lag > self.warn_threshold:
+                print(
+                    f"Event loop lagged {lag * 1000:.0f} ms ({EXECUTOR_KIND} executor)"
+                )
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "last_ms": self.last * 1000,
+            "max_ms": self.max * 1000,
+            "mean_ms": self.total / self.samples * 1000 if self.samples else 0.0,
+        }
+
+
+LOOP_LAG = LoopLagMonitor()
+register_collector("loop_lag", lambda: {"event_loop": LOOP_LAG.stats()})
+register_collector(
+    "executor", lambda: {} if _executor is None else {"cpu": _executor.stats()}
+)
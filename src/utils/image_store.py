@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from os import getenv
+from pathlib import Path
+from typing import Optional
+from utils.backend import Backend  # type: ignore
+from utils.cache import TTLCache  # type: ignore
+from utils.metrics import register_collector  # type: ignore
+
+# processed pages on disk, named by the hash of their bytes, so pages that
+# are the same image behind different urls are stored once
+IMAGE_STORE_DIR = Path(getenv("IMAGE_STORE_DIR", "image_store"))
+IMAGE_STORE_MAX_BYTES = int(getenv("IMAGE_STORE_MAX_BYTES", str(2 * 1024**3)))
+# the store may go over its cap by what is written between two sweeps
+IMAGE_STORE_SWEEP_INTERVAL = 60
+# leftovers of writes that died half way are removed once this old
+PARTIAL_MAX_AGE = 60 * 60
+# attachment key -> stored file name, in front of the mongo index
+IMAGE_INDEX = TTLCache("image_index", maxsize=8192, ttl=None)
+
+
+def scan_store(root: Path) -> list[tuple[float, str, int]]:
+    # (modification time, name, size) of every stored file
+    root.mkdir(parents=True, exist_ok=True)
+    found = []
+    cutoff = time.time() - PARTIAL_MAX_AGE
+    for path in root.glob("*/*"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # evicted or renamed while scanning
+            continue
+        if path.suffix == ".part":
+            if stat.st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+            continue
+        found.append((stat.st_mtime, path.name, stat.st_size))
+    return found
+
+
+def touch(path: Path) -> Optional[int]:
+    # marks the file as used, its size or None if it's gone
+    try:
+        os.utime(path)
+        return path.stat().st_size
+    except FileNotFoundError:
+        return None
+
+
+def write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # NOTE: written aside and renamed, so readers never see half a file.
+    # the name is unique, the same page can be put twice at once
+    descriptor, partial = tempfile.mkstemp(
+        dir=path.parent, prefix=f"{path.name}.", suffix=".part"
+    )
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(data)
+    os.replace(partial, path)
+
+
+def hash_name(data: bytes, extension: str) -> str:
+    return f"{hashlib.sha256(data).hexdigest()}.{extension}"
+
+
+def evict_oldest(root: Path, max_bytes: int) -> tuple[int, int, int]:
+    # least recently used first, until the whole directory fits the cap again.
+    # the newest file is kept even if it alone is over the cap, and files
+    # already opened for an upload stay readable once unlinked
+    found = sorted(scan_store(root))
+    size = sum(file_size for _, _, file_size in found)
+    evicted = 0
+    while size > max_bytes and len(found) - evicted > 1:
+        _, name, file_size = found[evicted]
+        (root / name[:2] / name).unlink(missing_ok=True)
+        size -= file_size
+        evicted += 1
+    return len(found) - evicted, size, evicted
+
+
+class ImageStore:
+    # every process of the bot shares the directory, so the files are the only
+    # state: a hit bumps the modification time, and one process sweeps out the
+    # least recently used once the directory as a whole is over the cap
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int,
+        sweep_interval: float = IMAGE_STORE_SWEEP_INTERVAL,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.task: Optional[asyncio.Task] = None
+        # as of the last sweep
+        self.files = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def path(self, name: str) -> Path:
+        return self.root / name[:2] / name
+
+    async def get(self, name: str) -> Optional[Path]:
+        path = self.path(name)
+        if await asyncio.to_thread(touch, path) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    async def put(self, data: bytes, extension: str) -> Path:
+        name = await asyncio.to_thread(hash_name, data, extension)
+        path = self.path(name)
+        # NOTE: checked on disk, another process may have evicted it
+        if await asyncio.to_thread(touch, path) is None:
+            await asyncio.to_thread(write_file, path, data)
+            self.writes += 1
+        return path
+
+    async def sweep(self):
+        self.files, self.size, evicted = await asyncio.to_thread(
+            evict_oldest, self.root, self.max_bytes
+        )
+        self.evictions += evicted
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as error:
+                print(f"Image store sweep failed: {error!r}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "files": self.files,
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
+
+
+IMAGE_STORE = ImageStore(IMAGE_STORE_DIR, IMAGE_STORE_MAX_BYTES)
+register_collector("image_store", lambda: {"disk": IMAGE_STORE.stats()})
+
+
+async def find_image(key: str) -> Optional[Path]:
+    name = IMAGE_INDEX.get(key)
+    if name is None:
+        backend = await Backend.get_instance()
+        document = await backend.find_image(key)
+        if document is None:
+            return None
+        name = document["name"]
+        IMAGE_INDEX.set(key, name)
+    path = await IMAGE_STORE.get(name)
+    if path is None:
+        # evicted, the caller stores it again under the same key
+        IMAGE_INDEX.pop(key)
+    return path
+
+
+async def save_image(key: str, data: bytes, extension: str) -> Path:
+    path = await IMAGE_STORE.put(data, extension)
+    IMAGE_INDEX.set(key, path.name)
+    backend = await Backend.get_instance()
+    await backend.save_image(key, path.name, len(data))
+    return path
@@ -0,0 +1,119 @@
+from PIL import Image
+from dataclasses import dataclass
+from io import BytesIO
+from os import getenv
+from pathlib import Path
+
+# webtoon strips are long and narrow, so the width and height caps differ,
+# 16383 is the largest side webp can encode
+IMAGE_MAX_WIDTH = int(getenv("IMAGE_MAX_WIDTH", "1200"))
+IMAGE_MAX_HEIGHT = int(getenv("IMAGE_MAX_HEIGHT", "16383"))
+# webp is smaller, but takes about ten times longer to encode a long page
+IMAGE_FORMAT = getenv("IMAGE_FORMAT", "jpeg")
+IMAGE_QUALITY = int(getenv("IMAGE_QUALITY", "80"))
+# stitched strips are cut at this height, discord shrinks taller ones to a sliver
+STRIP_MAX_HEIGHT = int(getenv("STRIP_MAX_HEIGHT", "6000"))
+# webp takes about 30 times longer than jpeg to encode a strip of that size
+STRIP_FORMAT = getenv("STRIP_FORMAT", "jpeg")
+
+EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "WEBP": "webp"}
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+    max_width: int = IMAGE_MAX_WIDTH
+    max_height: int = IMAGE_MAX_HEIGHT
+    format: str = IMAGE_FORMAT
+    quality: int = IMAGE_QUALITY
+
+
+DEFAULT_SETTINGS = ImageSettings()
+STRIP_SETTINGS = ImageSettings(format=STRIP_FORMAT)
+
+
+def sniff_extension(data: bytes) -> str:
+    # only reads the header, the pixels aren't decoded
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image_format = image.format
+    except Exception:
+        image_format = None
+    assert image_format in EXTENSIONS, "Response is not a supported image."
+    return EXTENSIONS[image_format]
+
+
+def process_image(
+    data: bytes, settings: ImageSettings = DEFAULT_SETTINGS
+) -> tuple[bytes, str]:
+    extension = sniff_extension(data)
+    # gifs may be animated, re-encoding would drop the frames
+    if extension == "gif":
+        return data, extension
+
+    image = Image.open(BytesIO(data))
+    width, height = image.size
+    scale = min(1.0, settings.max_width / width, settings.max_height / height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if scale < 1.0:
+        # lets the jpeg decoder skip straight to a smaller size
+        image.draft("RGB", size)
+
+    if settings.format == "jpeg" or image.mode not in ("RGB", "RGBA"):
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert(
+            "RGBA" if has_alpha and settings.format == "webp" else "RGB"
+        )
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    image.save(output, format=settings.format.upper(), quality=settings.quality)
+    processed = output.getvalue()
+
+    # small pages can come out bigger after re-encoding, keep the original then
+    if scale == 1.0 and len(processed) >= len(data):
+        return data, extension
+    return processed, "jpg" if settings.format == "jpeg" else settings.format
+
+
+def stitch_images(
+    pages: list[bytes | Path],
+    settings: ImageSettings = STRIP_SETTINGS,
+    max_height: int = STRIP_MAX_HEIGHT,
+) -> list[tuple[bytes, str]]:
+    # stacks consecutive pages into as few images as fit under max_height,
+    # a page taller than that gets an image of its own
+    images = [
+        Image.open(page if isinstance(page, Path) else BytesIO(page)) for page in pages
+    ]
+    width = min(settings.max_width, max(image.width for image in images))
+    max_height = min(max_height, settings.max_height)
+
+    groups: list[list[tuple[Image.Image, tuple[int, int]]]] = [[]]
+    height = 0
+    for image in images:
+        scale = min(1.0, width / image.width)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        if len(groups[-1]) != 0 and height + size[1] > max_height:
+            groups.append([])
+            height = 0
+        groups[-1].append((image, size))
+        height += size[1]
+
+    strips = []
+    for group in groups:
+        strip = Image.new("RGB", (width, sum(size[1] for _, size in group)), "white")
+        top = 0
+        for image, size in group:
+            # gifs only keep their first frame here
+            page = image.convert("RGBA")
+            if page.size != size:
+                page = page.resize(size, Image.Resampling.LANCZOS)
+            strip.paste(page, ((width - size[0]) // 2, top), page)
+            top += size[1]
+        output = BytesIO()
+        strip.save(output, format=settings.format.upper(), quality=settings.quality)
+        strips.append(
+            (output.getvalue(), "jpg" if settings.format == "jpeg" else settings.format)
+        )
+    return strips
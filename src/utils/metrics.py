@@ -0,0 +1,167 @@
+import bisect
+import functools
+import time
+from aiohttp import web
+from contextlib import contextmanager
+from os import getenv
+from typing import Any, Callable, Iterator, Optional
+
+METRICS_HOST = getenv("METRICS_HOST", "127.0.0.1")
+# the /metrics endpoint is only served when a port is set
+METRICS_PORT = int(getenv("METRICS_PORT", "0")) or None
+
+# seconds, from a memory cache hit up to a slow upstream fetch with retries
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the q-th observation
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = Histogram()
+        self.in_flight = 0
+        self.errors = 0
+
+
+STAGES: dict[str, Stage] = {}
+# name -> function returning {label: {metric: value}}, read on every scrape
+COLLECTORS: dict[str, Callable[[], dict[str, dict[str, Any]]]] = {}
+
+
+def get_stage(name: str) -> Stage:
+    stage = STAGES.get(name)
+    if stage is None:
+        stage = STAGES[name] = Stage(name)
+    return stage
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    stage = get_stage(name)
+    stage.in_flight += 1
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage.errors += 1
+        raise
+    finally:
+        stage.in_flight -= 1
+        stage.latency.observe(time.perf_counter() - start)
+
+
+def instrumented(name: str):
+    # times every call of an async function as a stage
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def register_collector(name: str, collect: Callable[[], dict[str, dict[str, Any]]]):
+    COLLECTORS[name] = collect
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# TYPE manga_bot_stage_seconds histogram",
+    ]
+    for stage in STAGES.values():
+        label = f'stage="{escape(stage.name)}"'
+        cumulative = 0
+        for bound, count in zip(stage.latency.buckets, stage.latency.counts):
+            cumulative += count
+            lines.append(
+                f'manga_bot_stage_seconds_bucket{{{label},le="{bound}"}} {cumulative}'
+            )
+        lines.append(
+            f'manga_bot_stage_seconds_bucket{{{label},le="+Inf"}} {stage.latency.count}'
+        )
+        lines.append(f"manga_bot_stage_seconds_sum{{{label}}} {stage.latency.sum}")
+        lines.append(f"manga_bot_stage_seconds_count{{{label}}} {stage.latency.count}")
+    lines.append("# TYPE manga_bot_stage_in_flight gauge")
+    for stage in STAGES.values():
+        lines.append(
+            f'manga_bot_stage_in_flight{{stage="{escape(stage.name)}"}} {stage.in_flight}'
+        )
+    lines.append("# TYPE manga_bot_stage_errors_total counter")
+    for stage in STAGES.values():
+        lines.append(
+            f'manga_bot_stage_errors_total{{stage="{escape(stage.name)}"}} {stage.errors}'
+        )
+
+    for collector, collect in COLLECTORS.items():
+        for label, values in collect().items():
+            for metric, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(
+                    f'manga_bot_{collector}_{metric}{{name="{escape(str(label))}"}} {value}'
+                )
+    return "\n".join(lines) + "\n"
+
+
+def hit_ratio(stats: dict[str, Any]) -> Optional[float]:
+    lookups = stats.get("hits", 0) + stats.get("misses", 0)
+    return stats["hits"] / lookups if lookups else None
+
+
+_runner: Optional[web.AppRunner] = None
+
+
+async def start_metrics_server(host: str, port: int):
+    # metrics aren't worth keeping the bot from starting, a port in use is logged
+    global _runner
+
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    try:
+        await web.TCPSite(_runner, host, port).start()
+    except OSError as error:
+        print(f"Failed to serve metrics on {host}:{port}: {error!r}")
+        await stop_metrics_server()
+
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
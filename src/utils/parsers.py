@@ -0,0 +1,146 @@
+from bs4 import BeautifulSoup
+from os import getenv
+from typing import Optional
+
+try:
+    import lxml.html
+except ImportError:  # pragma: no cover
+    lxml = None  # type: ignore
+
+# the parsers return plain tuples, the scraper turns them into Chapter/Manga
+
+
+class Bs4Parser:
+    name = "bs4"
+
+    def document(self, html: str) -> BeautifulSoup:
+        return BeautifulSoup(html, "html.parser")
+
+    def parse_chapter_links(self, html: str) -> list[tuple[str, str]]:
+        return self.chapter_links(self.document(html))
+
+    def chapter_links(self, soup: BeautifulSoup) -> list[tuple[str, str]]:
+        chapter_list = soup.find(lambda x: x.get("data-name", None) == "chapter-list")
+        assert chapter_list is not None
+        link_items = chapter_list.find_all(lambda x: x.name == "a")  # type: ignore
+        assert link_items is not None
+
+        return [(tag["href"], tag.get_text()) for tag in link_items]
+
+    def parse_page_images(self, html: str) -> list[str]:
+        soup = self.document(html)
+        image_items = soup.find_all(lambda x: x.get("data-name", None) == "image-item")
+        assert image_items is not None
+
+        return [tag.find(lambda x: x.name == "img")["src"] for tag in image_items]  # type: ignore
+
+    def parse_cover_images(self, html: str) -> list[tuple[str, str, str]]:
+        return self.cover_images(self.document(html))
+
+    def cover_images(self, soup: BeautifulSoup) -> list[tuple[str, str, str]]:
+        cover_items = soup.find_all(lambda x: x.name == "img" and "thumb" in x["src"])
+        assert cover_items is not None
+
+        return [(tag.parent.get("href", None), tag["title"], tag["src"]) for tag in cover_items]  # type: ignore
+
+    def parse_manga_description(self, html: str) -> str:
+        return self.manga_description(self.document(html))
+
+    def manga_description(self, soup: BeautifulSoup) -> str:
+        description_tag = soup.find(
+            lambda x: x.name == "div" and x.get("class", None) == ["limit-html-p"]
+        )
+        assert description_tag is not None
+
+        return description_tag.get_text()
+
+    def parse_manga_page(
+        self, html: str
+    ) -> tuple[list[tuple[str, str]], str, list[tuple[str, str, str]]]:
+        # a series page holds the chapter list, description and cover, parsed once
+        soup = self.document(html)
+        return (
+            self.chapter_links(soup),
+            self.manga_description(soup),
+            self.cover_images(soup),
+        )
+
+
+class LxmlParser:
+    # libxml2 builds the tree in C and the xpath queries only walk
+    # the subtrees each function needs
+    name = "lxml"
+
+    def document(self, html: str):
+        return lxml.html.document_fromstring(html)
+
+    def parse_chapter_links(self, html: str) -> list[tuple[str, str]]:
+        return self.chapter_links(self.document(html))
+
+    def chapter_links(self, document) -> list[tuple[str, str]]:
+        chapter_list = document.xpath("(//*[@data-name='chapter-list'])[1]")
+        assert len(chapter_list) != 0
+
+        return [
+            (tag.get("href"), tag.text_content())
+            for tag in chapter_list[0].iterdescendants("a")
+        ]
+
+    def parse_page_images(self, html: str) -> list[str]:
+        image_items = self.document(html).xpath("//*[@data-name='image-item']")
+
+        return [tag.xpath(".//img[1]/@src")[0] for tag in image_items]
+
+    def parse_cover_images(self, html: str) -> list[tuple[str, str, str]]:
+        return self.cover_images(self.document(html))
+
+    def cover_images(self, document) -> list[tuple[str, str, str]]:
+        cover_items = document.xpath("//img[contains(@src, 'thumb')]")
+
+        return [
+            (tag.getparent().get("href"), tag.get("title"), tag.get("src"))
+            for tag in cover_items
+        ]
+
+    def parse_manga_description(self, html: str) -> str:
+        return self.manga_description(self.document(html))
+
+    def manga_description(self, document) -> str:
+        description_tag = document.xpath(
+            "(//div[normalize-space(@class)='limit-html-p'])[1]"
+        )
+        assert len(description_tag) != 0
+
+        return description_tag[0].text_content()
+
+    def parse_manga_page(
+        self, html: str
+    ) -> tuple[list[tuple[str, str]], str, list[tuple[str, str, str]]]:
+        document = self.document(html)
+        return (
+            self.chapter_links(document),
+            self.manga_description(document),
+            self.cover_images(document),
+        )
+
+
+PARSERS = {"bs4": Bs4Parser}
+if lxml is not None:
+    PARSERS["lxml"] = LxmlParser
+
+DEFAULT_PARSER = "lxml" if lxml is not None else "bs4"
+
+_parser: Optional[Bs4Parser | LxmlParser] = None
+
+
+def set_parser(name: str):
+    global _parser
+    assert name in PARSERS, f"Unknown or unavailable parser engine: {name}"
+    _parser = PARSERS[name]()
+
+
+def get_parser() -> Bs4Parser | LxmlParser:
+    if _parser is None:
+        set_parser(getenv("PARSER_ENGINE", DEFAULT_PARSER))
+    assert _parser is not None
+    return _parser
@@ -0,0 +1,97 @@
+import asyncio
+import discord
+from collections import OrderedDict
+from pathlib import Path
+import utils.bot_util as bot_util  # type: ignore
+from utils.metrics import instrumented  # type: ignore
+
+# how many pages ahead of the current one we download
+PREFETCH_AHEAD = 3
+# how many pages of the next chapter we download once the reader nears the end
+PREFETCH_NEXT_CHAPTER = 2
+# the buffer only holds paths into the image store
+PREFETCH_BUFFER_SIZE = 8
+PREFETCH_CONCURRENCY = 2
+
+
+class PagePrefetcher:
+    def __init__(
+        self,
+        buffer_size: int = PREFETCH_BUFFER_SIZE,
+        concurrency: int = PREFETCH_CONCURRENCY,
+    ):
+        self.buffer_size = buffer_size
+        self.buffer: OrderedDict[str, Path] = OrderedDict()
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, url: str, path: Path):
+        self.buffer[url] = path
+        self.buffer.move_to_end(url)
+        while len(self.buffer) > self.buffer_size:
+            self.buffer.popitem(last=False)
+
+    async def download(self, url: str):
+        async with self.semaphore:
+            path = await bot_util.fetch_image_path(url)
+        self.store(url, path)
+
+    def prefetch(self, urls: list[str]):
+        for url in urls:
+            if url in self.buffer or url in self.tasks:
+                continue
+            task = asyncio.create_task(self.download(url))
+            self.tasks[url] = task
+            task.add_done_callback(lambda t, url=url: self.finish(url, t))
+
+    def finish(self, url: str, task: asyncio.Task):
+        if self.tasks.get(url) is task:
+            del self.tasks[url]
+        # a failed prefetch isn't fatal, the page is fetched again on demand
+        if not task.cancelled():
+            task.exception()
+
+    @instrumented("page_image")
+    async def get_path(self, url: str) -> Path:
+        if url in self.buffer:
+            self.hits += 1
+            self.buffer.move_to_end(url)
+            return self.buffer[url]
+
+        self.misses += 1
+        task = self.tasks.get(url)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            except Exception:
+                pass
+            if url in self.buffer:
+                return self.buffer[url]
+
+        path = await bot_util.fetch_image_path(url)
+        self.store(url, path)
+        return path
+
+    async def get_file(self, url: str) -> discord.File:
+        path = await self.get_path(url)
+        try:
+            return bot_util.path_to_image_file(path)
+        except FileNotFoundError:
+            # evicted from the image store since it was buffered
+            self.buffer.pop(url, None)
+            return bot_util.path_to_image_file(await self.get_path(url))
+
+    def cancel(self):
+        # buffered pages are kept, only the in flight downloads are dropped
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+
+    def close(self):
+        self.cancel()
+        self.buffer.clear()
@@ -0,0 +1,258 @@
+import aiohttp
+import asyncio
+import contextvars
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+from urllib.parse import urlparse
+from .metrics import register_collector  # type: ignore
+
+T = TypeVar("T")
+
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    def __init__(self, url: str, status: Optional[int], message: str = ""):
+        super().__init__(f"{url} failed with status {status}. {message}".strip())
+        self.url = url
+        self.status = status
+
+
+@dataclass(frozen=True)
+class HostConfig:
+    rate: float  # requests per second
+    burst: int
+    min_concurrency: int = 1
+    max_concurrency: int = 16
+    # requests slower than this count as a sign of upstream overload
+    latency_target: float = 2.0
+    # background requests leave this many tokens for the ones a user waits on
+    background_reserve: int = 0
+
+
+HOST_CONFIGS = {
+    "mangapark.com": HostConfig(
+        rate=5, burst=10, max_concurrency=8, background_reserve=5
+    ),
+}
+DEFAULT_HOST_CONFIG = HostConfig(rate=20, burst=40)
+# set in tasks that warm caches ahead of the user, their requests only
+# take the tokens the others leave over
+BACKGROUND = contextvars.ContextVar("background", default=False)
+
+
+class TokenBucket:
+    def __init__(
+        self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+        self.spare_lock = asyncio.Lock()
+
+    def fill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # the lock makes waiters take tokens in arrival order
+        async with self.lock:
+            self.fill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.fill()
+            self.tokens -= 1
+
+    async def wait_spare(self, reserve: int):
+        # waits outside the lock, so it never holds up a regular waiter,
+        # until nobody else is queued and a token above the reserve is left
+        async with self.spare_lock:
+            while True:
+                if not self.lock.locked():
+                    self.fill()
+                    if self.tokens >= 1 + reserve:
+                        return
+                await asyncio.sleep(max(1.0, 1 + reserve - self.tokens) / self.rate)
+
+    async def acquire_spare(self, reserve: int):
+        await self.wait_spare(reserve)
+        self.tokens -= 1
+
+
+class AdaptiveLimiter:
+    # additive increase, multiplicative decrease on the number of requests in flight
+    def __init__(self, config: HostConfig):
+        self.config = config
+        self.limit = float(config.max_concurrency)
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record(self, ok: bool, latency: float):
+        if ok and latency <= self.config.latency_target:
+            self.limit = min(self.config.max_concurrency, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.config.min_concurrency, self.limit / 2)
+
+
+class HostLimiter:
+    def __init__(self, host: str, config: HostConfig):
+        self.host = host
+        self.bucket = TokenBucket(config.rate, config.burst)
+        self.background_reserve = config.background_reserve
+        self.concurrency = AdaptiveLimiter(config)
+        self.waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            if BACKGROUND.get():
+                await self.bucket.acquire_spare(self.background_reserve)
+            else:
+                await self.bucket.acquire()
+            await self.concurrency.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        self.requests += 1
+        try:
+            yield
+        finally:
+            await self.concurrency.release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.concurrency.in_flight,
+            "concurrency_limit": int(self.concurrency.limit),
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "mean_wait_ms": (
+                self.wait_time / self.requests * 1000 if self.requests else 0.0
+            ),
+            "max_wait_ms": self.max_wait_time * 1000,
+        }
+
+
+LIMITERS: dict[str, HostLimiter] = {}
+register_collector(
+    "upstream", lambda: {host: l.stats() for host, l in LIMITERS.items()}
+)
+
+
+def get_limiter(url: str) -> HostLimiter:
+    host = urlparse(url).hostname or ""
+    limiter = LIMITERS.get(host)
+    if limiter is None:
+        config = next(
+            (
+                config
+                for suffix, config in HOST_CONFIGS.items()
+                if host == suffix or host.endswith(f".{suffix}")
+            ),
+            DEFAULT_HOST_CONFIG,
+        )
+        limiter = LIMITERS[host] = HostLimiter(host, config)
+    return limiter
+
+
+async def wait_turn(url: str):
+    # a flight runs at the priority of whoever waits on it (see SingleFlight),
+    # so background work waits for a spare token of the host before joining one
+    if BACKGROUND.get():
+        limiter = get_limiter(url)
+        await limiter.bucket.wait_spare(limiter.background_reserve)
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either a number of seconds or an http date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff(attempt: int) -> float:
+    # full jitter, so clients that failed together don't retry together
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+
+async def limited_get(
+    session: aiohttp.ClientSession,
+    url: str,
+    read: Callable[[aiohttp.ClientResponse], Awaitable[T]],
+    **kwargs: Any,
+) -> T:
+    limiter = get_limiter(url)
+    error: Optional[BaseException] = None
+    status: Optional[int] = None
+    for attempt in range(RETRY_ATTEMPTS):
+        delay: Optional[float] = None
+        error = None
+        async with limiter.slot():
+            start = time.monotonic()
+            try:
+                async with session.get(url, **kwargs) as response:
+                    status = response.status
+                    if status == 200:
+                        result = await read(response)
+                        limiter.concurrency.record(True, time.monotonic() - start)
+                        return result
+                    if status not in RETRY_STATUSES:
+                        limiter.failures += 1
+                        raise UpstreamError(url, status)
+                    delay = retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            limiter.concurrency.record(False, time.monotonic() - start)
+
+        if attempt + 1 < RETRY_ATTEMPTS:
+            limiter.retries += 1
+            if delay is None:
+                delay = backoff(attempt)
+            await asyncio.sleep(min(RETRY_MAX_DELAY, delay))
+
+    limiter.failures += 1
+    raise UpstreamError(
+        url, status, f"Gave up after {RETRY_ATTEMPTS} attempts."
+    ) from error
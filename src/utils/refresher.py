@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional
+from utils.backend import Backend  # type: ignore
+from utils.chapter_store import refresh_chapter_list  # type: ignore
+import utils.scraper as scraper  # type: ignore
+from utils.metrics import register_collector  # type: ignore
+from utils.ratelimit import BACKGROUND, wait_turn  # type: ignore
+
+# how often the bookmarked series are checked for ones that need a refresh
+REFRESH_SCAN_INTERVAL = 15 * 60
+# refresh a series this long before its stored result expires
+REFRESH_AHEAD = 4 * 60 * 60
+# at most this many refreshes per second go upstream
+REFRESH_RATE = 0.5
+# spread every wait by up to this fraction, so refreshes don't line up
+REFRESH_JITTER = 0.25
+REFRESH_BATCH_SIZE = 100
+
+
+async def bookmarked_series() -> list[tuple[str, int]]:
+    backend = await Backend.get_instance()
+    return await backend.get_bookmarked_series()
+
+
+async def stored_expiries(manga_links: list[str]) -> dict[str, float]:
+    # unix times, like the clock
+    expiries = await scraper.manga_page_expiries(manga_links)
+    return {link: expires_at.timestamp() for link, expires_at in expiries.items()}
+
+
+class RefreshScheduler:
+    def __init__(
+        self,
+        refresh: Callable[[str], Awaitable[None]] = refresh_chapter_list,
+        get_series: Callable[[], Awaitable[list[tuple[str, int]]]] = bookmarked_series,
+        get_expiries: Callable[
+            [list[str]], Awaitable[dict[str, float]]
+        ] = stored_expiries,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.refresh = refresh
+        self.get_series = get_series
+        self.get_expiries = get_expiries
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng
+        self.task: Optional[asyncio.Task] = None
+        self.due_count = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    def jitter(self, seconds: float) -> float:
+        return seconds * (1 + REFRESH_JITTER * (2 * self.rng() - 1))
+
+    async def due(self, series: list[tuple[str, int]]) -> list[str]:
+        # most bookmarked first, so the busiest series are never cold.
+        # the expiries are stored with the results, so a restart doesn't
+        # refresh everything again, and a series a reader scraped waits longer
+        links = [link for link, _ in sorted(series, key=lambda s: s[1], reverse=True)]
+        expiries = await self.get_expiries(links)
+        now = self.clock()
+        return [
+            link
+            for link in links
+            if expiries.get(link, float("-inf")) - now <= REFRESH_AHEAD
+        ][:REFRESH_BATCH_SIZE]
+
+    async def run_once(self):
+        due = await self.due(await self.get_series())
+        self.due_count = len(due)
+        for link in due:
+            try:
+                await wait_turn(f"{scraper.MANGAPARK_BASE_URL}{link}")
+                await self.refresh(link)
+                self.refreshed += 1
+            except Exception as error:
+                # keeps its old expiry, so it's tried again on the next scan
+                self.failed += 1
+                print(f"Failed to refresh {link}: {error!r}")
+            await self.sleep(self.jitter(1 / REFRESH_RATE))
+
+    async def run(self):
+        # the task has its own context, so only the refreshes leave the
+        # reserved tokens to the readers
+        BACKGROUND.set(True)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as error:
+                print(f"Refresh scan failed: {error!r}")
+            await self.sleep(self.jitter(REFRESH_SCAN_INTERVAL))
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "due": self.due_count,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
+
+
+REFRESHER = RefreshScheduler()
+register_collector("refresher", lambda: {"bookmarks": REFRESHER.stats()})
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+from .backend import Backend  # type: ignore
+from .codec import dumps, loads  # type: ignore
+from .metrics import register_collector  # type: ignore
+from .shards import PROCESS_ID  # type: ignore
+
+# parsed scrape results in mongo, in place of the raw html,
+# a hit is one small document read and no parse
+RESULT_TTLS = {
+    "search": timedelta(hours=1),
+    "manga": timedelta(days=1),
+    "pages": timedelta(days=1),
+}
+# a process that dies mid scrape holds up the others this long at most,
+# a live one renews its lease a few times per ttl for as long as the scrape runs
+LEASE_TTL = timedelta(seconds=30)
+LEASE_RENEWALS = 3
+LEASE_POLL_INTERVAL = 0.1
+STATS = {"hits": 0, "misses": 0, "writes": 0, "lease_waits": 0}
+register_collector("result_cache", lambda: {"mongo": dict(STATS)})
+
+
+def result_key(operation: str, url: str) -> str:
+    return f"{operation}:{url}"
+
+
+def as_utc(moment: datetime) -> datetime:
+    # mongo hands back naive datetimes, in utc
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+async def load_result(operation: str, url: str) -> Optional[Any]:
+    backend = await Backend.get_instance()
+    document = await backend.find_result(result_key(operation, url))
+    # mongo only sweeps expired documents once a minute
+    if document is not None:
+        if as_utc(document["expires_at"]) > datetime.now(timezone.utc):
+            STATS["hits"] += 1
+            return loads(document["data"])
+    STATS["misses"] += 1
+    return None
+
+
+async def result_expiries(operation: str, urls: list[str]) -> dict[str, datetime]:
+    # url -> when its stored result expires, urls without one are left out
+    backend = await Backend.get_instance()
+    keys = {result_key(operation, url): url for url in urls}
+    expiries = await backend.find_result_expiries(list(keys))
+    return {keys[key]: as_utc(expires_at) for key, expires_at in expiries.items()}
+
+
+async def store_result(operation: str, url: str, value: Any):
+    backend = await Backend.get_instance()
+    expires_at = datetime.now(timezone.utc) + RESULT_TTLS[operation]
+    STATS["writes"] += 1
+    await backend.save_result(result_key(operation, url), dumps(value), expires_at)
+
+
+async def keep_lease(key: str):
+    # the limiter's retries can take a scrape past the ttl, another process
+    # must not take the lease over while it still runs
+    backend = await Backend.get_instance()
+    while True:
+        await asyncio.sleep(LEASE_TTL.total_seconds() / LEASE_RENEWALS)
+        try:
+            await backend.renew_lease(
+                key, PROCESS_ID, datetime.now(timezone.utc) + LEASE_TTL
+            )
+        except Exception as error:
+            print(f"Failed to renew the lease of {key}: {error!r}")
+
+
+async def shared_result(
+    operation: str,
+    url: str,
+    scrape: Callable[[], Awaitable[Any]],
+    refresh: bool = False,
+) -> Any:
+    # the single flights keep it to one scrape per process, the lease to one
+    # across processes, the others wait for the result it stores
+    if not refresh:
+        stored = await load_result(operation, url)
+        if stored is not None:
+            return stored
+
+    backend = await Backend.get_instance()
+    key = result_key(operation, url)
+    waited = False
+    while not await backend.acquire_lease(
+        key, PROCESS_ID, datetime.now(timezone.utc) + LEASE_TTL
+    ):
+        waited = True
+        STATS["lease_waits"] += 1
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+    renewal = asyncio.create_task(keep_lease(key))
+    try:
+        # the holder stored its result, fresh even for a refresh, before letting go
+        stored = await load_result(operation, url) if waited else None
+        if stored is None:
+            stored = await scrape()
+            await store_result(operation, url, stored)
+        return stored
+    finally:
+        renewal.cancel()
+        await backend.release_lease(key, PROCESS_ID)
@@ -1,142 +1,423 @@
+import argparse
 import asyncio
+import sys
 from urllib.parse import urlencode
-from bs4 import BeautifulSoup
-from datetime import timedelta
-from aiohttp_client_cache import CachedSession, MongoDBBackend
 from dataclasses import dataclass
-from typing import Mapping
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Hashable, Mapping
+
+from .session import get_session, start_session, close_session  # type: ignore
+from .cache import TTLCache, cached  # type: ignore
+from .parsers import get_parser  # type: ignore
+from .executor import run_cpu  # type: ignore
+from .ratelimit import BACKGROUND, limited_get  # type: ignore
+from .metrics import instrumented, register_collector, timed  # type: ignore
+from .codec import from_columns, to_columns  # type: ignore
+from .results import result_expiries, shared_result  # type: ignore
 
 MANGAPARK_BASE_URL = "https://mangapark.com"
 
-
-@dataclass
+# NOTE: the cookies are crucial for retrieving the image files
+HEADERS = {
+    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "accept-language": "en-US,en;q=0.9",
+    "cache-control": "max-age=0",
+    "dnt": "1",
+    "priority": "u=0, i",
+    "sec-ch-ua": '"Google Chrome";v="137", "Chromium";v="137", "Not/A)Brand";v="24"',
+    "sec-ch-ua-mobile": "?1",
+    "sec-ch-ua-platform": '"Android"',
+    "sec-fetch-dest": "document",
+    "sec-fetch-mode": "navigate",
+    "sec-fetch-site": "none",
+    "sec-fetch-user": "?1",
+    "upgrade-insecure-requests": "1",
+    "user-agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Mobile Safari/537.36",
+}
+COOKIES = {
+    "theme": "mdark",
+    "tfv": "1750232773570",
+    "Hm_lvt_a7025e25c8500c732b8f48cc46e21467": "1750273651,1750275977,1750299608,1750311668",
+    "Hm_lpvt_a7025e25c8500c732b8f48cc46e21467": "1750311668",
+    "HMACCOUNT": "A6016F638E220909",
+    "wd": "553x1087",
+}
+
+# in-process caches for parsed results, in front of the mongo result cache
+SEARCH_CACHE = TTLCache("search", maxsize=256, ttl=60 * 60)
+CHAPTERS_CACHE = TTLCache("chapters", maxsize=128, ttl=15 * 60)
+PAGES_CACHE = TTLCache("pages", maxsize=512, ttl=24 * 60 * 60)
+DESCRIPTION_CACHE = TTLCache("description", maxsize=512, ttl=24 * 60 * 60)
+MANGA_INFO_CACHE = TTLCache("manga_info", maxsize=1024, ttl=24 * 60 * 60)
+
+# how many bookmarked pages are scraped at once while hydrating /bookmarks
+BOOKMARK_CONCURRENCY = 8
+# stored bookmark names and covers older than this are refreshed in the background
+METADATA_MAX_AGE = timedelta(days=7)
+BACKGROUND_TASKS: set[asyncio.Task] = set()
+
+
+class SingleFlight:
+    # concurrent calls for the same key share one in flight task,
+    # its result or exception is handed to every waiter
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: dict[Hashable, asyncio.Task] = {}
+        self.requests = 0
+        self.coalesced = 0
+        FLIGHTS[name] = self
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        self.requests += 1
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.run(func))
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self.finish(key, t))
+        else:
+            self.coalesced += 1
+        # NOTE: shield so a cancelled waiter doesn't cancel the other waiters
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def run(func: Callable[[], Awaitable[Any]]) -> Any:
+        # the task copies the context of the caller that started it, a user
+        # joining a flight a prefetch started must not wait at its priority
+        BACKGROUND.set(False)
+        return await func()
+
+    def finish(self, key: Hashable, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.calls),
+        }
+
+
+FLIGHTS: dict[str, SingleFlight] = {}
+register_collector(
+    "singleflight", lambda: {name: f.stats() for name, f in FLIGHTS.items()}
+)
+HTML_FLIGHTS = SingleFlight("html")
+# keyed by (operation, url), so concurrent misses share one lookup, fetch and store
+RESULT_FLIGHTS = SingleFlight("result")
+IMAGE_FLIGHTS = SingleFlight("image")
+
+
+# frozen and slotted, a long series holds thousands of these and the same
+# objects are shared by every view and cache showing it
+@dataclass(frozen=True, slots=True)
 class Chapter:
     link: str
     name: str
 
+    def __post_init__(self):
+        # links are the keys of chapter positions, bookmarks and prefetches,
+        # interned they are stored once and compare by identity
+        object.__setattr__(self, "link", sys.intern(self.link))
+
+    def __reduce__(self):
+        # rebuilt through __init__ when coming back from the process pool,
+        # so the strings get interned on this side too
+        return (Chapter, (self.link, self.name))
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Manga:
     link: str
     name: str
     cover: str
 
+    def __post_init__(self):
+        object.__setattr__(self, "link", sys.intern(self.link))
 
-def parse_chapter_links(html: str) -> list[Chapter]:
-    soup = BeautifulSoup(html, "html.parser")
-    chapter_list = soup.find(lambda x: x.get("data-name", None) == "chapter-list")
-    assert chapter_list is not None
-    link_items = chapter_list.find_all(lambda x: x.name == "a")  # type: ignore
-    assert link_items is not None
+    def __reduce__(self):
+        return (Manga, (self.link, self.name, self.cover))
 
-    return [Chapter(tag["href"], tag.get_text()) for tag in link_items]
 
+@dataclass(frozen=True, slots=True)
+class MangaPage:
+    # everything read off a series page, the chapters oldest first
+    chapters: tuple[Chapter, ...]
+    description: str
+    name: str
+    cover: str
 
-def parse_page_images(html: str) -> list[str]:
-    soup = BeautifulSoup(html, "html.parser")
-    image_items = soup.find_all(lambda x: x.get("data-name", None) == "image-item")
-    assert image_items is not None
 
-    return [tag.find(lambda x: x.name == "img")["src"] for tag in image_items]  # type: ignore
+def parse_chapter_links(html: str) -> list[Chapter]:
+    chapter_links = get_parser().parse_chapter_links(html)
+    return [Chapter(link, name) for link, name in chapter_links]
 
 
-def parse_cover_images(html: str) -> list[Manga]:
-    soup = BeautifulSoup(html, "html.parser")
-    cover_items = soup.find_all(lambda x: x.name == "img" and "thumb" in x["src"])
-    assert cover_items is not None
+def parse_page_images(html: str) -> list[str]:
+    return get_parser().parse_page_images(html)
 
-    return [Manga(tag.parent.get("href", None), tag["title"], tag["src"]) for tag in cover_items]  # type: ignore
+
+def parse_cover_images(html: str) -> list[Manga]:
+    cover_items = get_parser().parse_cover_images(html)
+    # a thumbnail outside a link isn't a search result
+    return [
+        Manga(link, name, cover)
+        for link, name, cover in cover_items
+        if link is not None
+    ]
 
 
 def parse_manga_description(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
-    description_tag = soup.find(lambda x: x.name == "div" and x.get("class", None) == ["limit-html-p"])
-    assert description_tag is not None
+    return get_parser().parse_manga_description(html)
 
-    return description_tag.get_text()
 
+def parse_manga_page(html: str) -> MangaPage:
+    chapter_links, description, covers = get_parser().parse_manga_page(html)
+    _, name, cover = covers[0] if len(covers) != 0 else (None, "", "")
+    return MangaPage(
+        tuple(Chapter(link, name) for link, name in reversed(chapter_links)),
+        description,
+        name,
+        cover,
+    )
 
-async def get_html_raw(url: str) -> str:
-    # NOTE: the cookies are crucial for retrieving the image files
-    cache = MongoDBBackend(expire_after=timedelta(days=1))
-    HEADERS = {
-        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "accept-language": "en-US,en;q=0.9",
-        "cache-control": "max-age=0",
-        "dnt": "1",
-        "priority": "u=0, i",
-        "sec-ch-ua": '"Google Chrome";v="137", "Chromium";v="137", "Not/A)Brand";v="24"',
-        "sec-ch-ua-mobile": "?1",
-        "sec-ch-ua-platform": '"Android"',
-        "sec-fetch-dest": "document",
-        "sec-fetch-mode": "navigate",
-        "sec-fetch-site": "none",
-        "sec-fetch-user": "?1",
-        "upgrade-insecure-requests": "1",
-        "user-agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Mobile Safari/537.36",
-    }
-    COOKIES = {
-        "theme": "mdark",
-        "tfv": "1750232773570",
-        "Hm_lvt_a7025e25c8500c732b8f48cc46e21467": "1750273651,1750275977,1750299608,1750311668",
-        "Hm_lpvt_a7025e25c8500c732b8f48cc46e21467": "1750311668",
-        "HMACCOUNT": "A6016F638E220909",
-        "wd": "553x1087",
-    }
-    async with CachedSession(headers=HEADERS, cookies=COOKIES, cache=cache) as session:
-        async with session.get(url) as response:
-            assert response.status == 200, "Response status not 200."
 
-            output = await response.text()
-            return output
+async def parse(parser: Callable[[str], Any], html_data: str) -> Any:
+    with timed(parser.__name__):
+        return await run_cpu(parser, html_data)
+
+
+@instrumented("fetch_html")
+async def fetch_html(url: str) -> str:
+    # the parsed results are stored instead of the html (see utils/results.py),
+    # so this always goes upstream
+    return await limited_get(
+        get_session(),
+        url,
+        lambda response: response.text(),
+        headers=HEADERS,
+        cookies=COOKIES,
+    )
+
+
+async def get_html_raw(url: str) -> str:
+    with timed("get_html_raw"):
+        return await HTML_FLIGHTS.do(url, lambda: fetch_html(url))
 
 
+@cached(SEARCH_CACHE)
 async def search_manga_links(input_search: str) -> list[Manga]:
     search = urlencode({"word": input_search})
     search_url = f"{MANGAPARK_BASE_URL}/search?{search}"
+    return await RESULT_FLIGHTS.do(
+        ("search", search_url), lambda: load_search_results(search_url)
+    )
+
+
+async def load_search_results(search_url: str) -> list[Manga]:
+    stored = await shared_result(
+        "search", search_url, lambda: scrape_search_results(search_url)
+    )
+    return [Manga(link, name, cover) for link, name, cover in from_columns(stored)]
+
+
+async def scrape_search_results(search_url: str) -> dict[str, Any]:
     html_data = await get_html_raw(search_url)
-    manga_covers = parse_cover_images(html_data)
-    return manga_covers
+    manga_covers = await parse(parse_cover_images, html_data)
+    rows = [(manga.link, manga.name, manga.cover) for manga in manga_covers]
+    return to_columns(rows, 3)
+
+
+async def load_manga_page(manga_link: str, refresh: bool) -> MangaPage:
+    url = f"{MANGAPARK_BASE_URL}{manga_link}"
+    stored = await shared_result("manga", url, lambda: scrape_manga_page(url), refresh)
+    page = MangaPage(
+        tuple(Chapter(link, name) for link, name in from_columns(stored["chapters"])),
+        stored["description"],
+        stored["name"],
+        stored["cover"],
+    )
+
+    # the chapter list and description come from the same page,
+    # whichever is asked for first fills the cache of the other
+    CHAPTERS_CACHE.set((manga_link,), page.chapters)
+    DESCRIPTION_CACHE.set((manga_link,), page.description)
+    return page
+
+
+async def manga_page_expiries(manga_links: list[str]) -> dict[str, datetime]:
+    # manga link -> when its stored page expires, series never scraped are left out
+    urls = {f"{MANGAPARK_BASE_URL}{link}": link for link in manga_links}
+    expiries = await result_expiries("manga", list(urls))
+    return {urls[url]: expires_at for url, expires_at in expiries.items()}
+
+
+async def scrape_manga_page(url: str) -> dict[str, Any]:
+    html_data = await get_html_raw(url)
+    page = await parse(parse_manga_page, html_data)
+    rows = [(chapter.link, chapter.name) for chapter in page.chapters]
+    return {
+        "chapters": to_columns(rows, 2),
+        "description": page.description,
+        "name": page.name,
+        "cover": page.cover,
+    }
 
 
-async def get_manga_chapters(manga_link: str) -> list[Chapter]:
-    html_data = await get_html_raw(f"{MANGAPARK_BASE_URL}{manga_link}")
-    chapter_links = parse_chapter_links(html_data)
-    chapter_links = list(reversed(chapter_links))
-    return chapter_links
+async def get_manga_page(manga_link: str, refresh: bool = False) -> MangaPage:
+    key = ("refresh" if refresh else "manga", manga_link)
+    return await RESULT_FLIGHTS.do(key, lambda: load_manga_page(manga_link, refresh))
 
 
+@cached(CHAPTERS_CACHE)
+async def get_manga_chapters(manga_link: str) -> tuple[Chapter, ...]:
+    # a tuple, the cached list is handed to every caller
+    return (await get_manga_page(manga_link)).chapters
+
+
+@cached(PAGES_CACHE)
 async def get_manga_chapter_images(chapter_link: str) -> list[str]:
-    html_data = await get_html_raw(f"{MANGAPARK_BASE_URL}{chapter_link}")
-    images = parse_page_images(html_data)
+    return await RESULT_FLIGHTS.do(
+        ("pages", chapter_link), lambda: load_chapter_images(chapter_link)
+    )
+
+
+async def load_chapter_images(chapter_link: str) -> list[str]:
+    url = f"{MANGAPARK_BASE_URL}{chapter_link}"
+    stored = await shared_result("pages", url, lambda: scrape_chapter_images(url))
+    return [image for image, in from_columns(stored)]
+
 
-    return images
+async def scrape_chapter_images(url: str) -> dict[str, Any]:
+    html_data = await get_html_raw(url)
+    images = await parse(parse_page_images, html_data)
+    return to_columns([(image,) for image in images], 1)
 
 
-async def get_manga_description(chapter_link: str) -> str:
-    # NOTE: we might use this html data later in get_manga_chapters,
-    # but all of the requests are cached 
-    html_data = await get_html_raw(f"{MANGAPARK_BASE_URL}{chapter_link}")
-    description = parse_manga_description(html_data)
+@cached(DESCRIPTION_CACHE)
+async def get_manga_description(manga_link: str) -> str:
+    return (await get_manga_page(manga_link)).description
 
-    return description
+
+@cached(MANGA_INFO_CACHE)
+async def get_manga_info(manga_link: str) -> Manga:
+    page = await get_manga_page(manga_link)
+    assert page.cover != "", f"No cover found for {manga_link}"
+    return Manga(manga_link, page.name, page.cover)
+
+
+async def get_manga_infos(manga_links: list[str]) -> list[Manga | BaseException]:
+    semaphore = asyncio.Semaphore(BOOKMARK_CONCURRENCY)
+
+    async def get_one(manga_link: str) -> Manga:
+        async with semaphore:
+            return await get_manga_info(manga_link)
+
+    # a failing bookmark shows up as an exception in its slot,
+    # it doesn't take down the rest
+    return await asyncio.gather(
+        *(get_one(link) for link in manga_links), return_exceptions=True
+    )
+
+
+async def refresh_manga_infos(
+    manga_links: list[str], on_update: Callable[[Manga], Awaitable[None]]
+):
+    for result in await get_manga_infos(manga_links):
+        if isinstance(result, Manga):
+            await on_update(result)
 
 
 async def convert_manga_links_to_manga_objects(
-    manga_links: list[Mapping[str, str]],
+    manga_links: list[Mapping[str, Any]],
+    on_update: Callable[[Manga], Awaitable[None]] | None = None,
 ) -> list[Manga]:
-    manga_objects = []
+    # bookmarks that carry their own name and cover don't need a scrape,
+    # they are only refreshed in the background once they get stale
+    now = datetime.now(timezone.utc)
+    stored: dict[str, Manga] = {}
+    missing: list[str] = []
+    stale: list[str] = []
     for bookmark in manga_links:
         link = bookmark["link"]
-        search_url = f"{MANGAPARK_BASE_URL}{link}"
-        html_data = await get_html_raw(search_url)
-        covers = parse_cover_images(html_data)
-        manga_objects.append(Manga(link, covers[0].name, covers[0].cover))
-    return manga_objects
-
-
-# proof of concept cli to show the scraper works
+        if bookmark.get("name") and bookmark.get("cover"):
+            stored[link] = Manga(link, bookmark["name"], bookmark["cover"])
+            refreshed_at = bookmark.get("refreshed_at")
+            if refreshed_at is not None and refreshed_at.tzinfo is None:
+                refreshed_at = refreshed_at.replace(tzinfo=timezone.utc)
+            if refreshed_at is None or now - refreshed_at > METADATA_MAX_AGE:
+                stale.append(link)
+        else:
+            missing.append(link)
+
+    for link, result in zip(missing, await get_manga_infos(missing)):
+        if isinstance(result, BaseException):
+            print(f"Failed to load bookmark {link}: {result!r}")
+            continue
+        stored[link] = result
+        if on_update is not None:
+            await on_update(result)
+
+    if on_update is not None and len(stale) != 0:
+        task = asyncio.create_task(refresh_manga_infos(stale, on_update))
+        BACKGROUND_TASKS.add(task)
+        task.add_done_callback(BACKGROUND_TASKS.discard)
+
+    return [
+        stored[bookmark["link"]]
+        for bookmark in manga_links
+        if bookmark["link"] in stored
+    ]
+
+
+async def refresh_manga(manga_link: str) -> MangaPage:
+    # re-scrapes a series past every cache layer and puts the fresh results back
+    return await get_manga_page(manga_link, refresh=True)
+
+
+# proof of concept cli to show the scraper works,
+# run it from src/ with `python -m utils.scraper`, or
+# `python -m utils.scraper download <manga link> <first> [last]` to save
+# chapters, numbered as the interactive mode lists them, to a .cbz file
 async def main():
+    parser = argparse.ArgumentParser(prog="python -m utils.scraper")
+    commands = parser.add_subparsers(dest="command")
+    download = commands.add_parser("download")
+    download.add_argument("manga_link")
+    download.add_argument("first", type=int)
+    download.add_argument("last", type=int, nargs="?")
+    args = parser.parse_args()
+
+    await start_session()
+    try:
+        if args.command == "download":
+            await run_download(args.manga_link, args.first, args.last)
+        else:
+            await run_cli()
+    finally:
+        await close_session()
+
+
+async def run_download(manga_link: str, first: int, last: int | None):
+    # NOTE: imported here, downloads is built on top of this module
+    from .downloads import DOWNLOAD_DIR, archive_filename, download_chapters  # type: ignore
+
+    page = await get_manga_page(manga_link)
+    last = first if last is None else min(last, len(page.chapters) - 1)
+    archive = DOWNLOAD_DIR / archive_filename(page.name, first, last)
+    archive.parent.mkdir(parents=True, exist_ok=True)
+
+    def on_progress(done: int, total: int):
+        print(f"\r{done}/{total} pages", end="", flush=True)
+
+    chapters = [(i, page.chapters[i]) for i in range(first, last + 1)]
+    await download_chapters(chapters, archive, on_progress=on_progress)
+    print(f"\nSaved {archive}")
+
+
+async def run_cli():
     input_search = input("Enter manga name: ")
 
     manga_links = await search_manga_links(input_search)
@@ -162,5 +443,6 @@ async def main():
     for i, link in enumerate(images):
         print(f"{i}: {link}")
 
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Optional
+import utils.scraper as scraper  # type: ignore
+from utils.backend import Backend  # type: ignore
+from utils.metrics import instrumented, register_collector  # type: ignore
+from utils.ratelimit import UpstreamError  # type: ignore
+
+Manga = scraper.Manga
+
+# /read answers from the index when its best match scores at least this,
+# anything less goes upstream and the results are added to the index
+SEARCH_MIN_SCORE = 0.75
+# matches below this aren't shown next to a confident one
+SEARCH_RESULT_SCORE = 0.3
+SEARCH_LIMIT = 10
+
+NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    # "Kimetsu no Yaiba: Tokubetsu" and "kimetsu no yaiba tokubetsu" are the same
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(NON_WORD.sub(" ", text).split())
+
+
+def trigrams(text: str) -> set[str]:
+    # padded, so word starts weigh more and short names still have trigrams
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    # trigram index over the names of every series the bot has seen
+    def __init__(self):
+        self.mangas: dict[str, Manga] = {}
+        self.names: dict[str, str] = {}
+        self.gram_counts: dict[str, int] = {}
+        self.postings: dict[str, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.mangas)
+
+    def add(self, manga: Manga) -> bool:
+        # returns whether anything changed, unchanged series aren't written back
+        known = self.mangas.get(manga.link)
+        if known == manga:
+            return False
+        if known is not None:
+            self.remove(manga.link)
+        name = normalize(manga.name)
+        grams = trigrams(name)
+        self.mangas[manga.link] = manga
+        self.names[manga.link] = name
+        self.gram_counts[manga.link] = len(grams)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(manga.link)
+        return True
+
+    def remove(self, link: str):
+        self.mangas.pop(link)
+        for gram in trigrams(self.names.pop(link)):
+            postings = self.postings[gram]
+            postings.discard(link)
+            if len(postings) == 0:
+                del self.postings[gram]
+        del self.gram_counts[link]
+
+    def score(self, query: str, query_grams: set[str], link: str, shared: int) -> float:
+        # dice coefficient over the trigrams, so typos still match,
+        # and a prefix of the name scores by how much of the name it covers
+        name = self.names[link]
+        score = 2 * shared / (len(query_grams) + self.gram_counts[link])
+        if name.startswith(query):
+            score = max(score, 0.5 + 0.5 * len(query) / len(name))
+        return score
+
+    def search(
+        self, query: str, limit: int = SEARCH_LIMIT
+    ) -> list[tuple[float, Manga]]:
+        query = normalize(query)
+        if query == "":
+            return []
+        query_grams = trigrams(query)
+        shared: Counter[str] = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        # most shared trigrams first, the best score a series can still reach
+        # only drops from there, so stop once it can't beat the current top
+        top: list[tuple[float, int, str]] = []
+        for link, count in shared.most_common():
+            if count >= len(query_grams) - 1:
+                best = 1.0  # could be a prefix of the name
+            else:
+                best = 2 * count / (len(query_grams) + count)
+            if len(top) == limit and best < top[0][0]:
+                break
+            # ties go to the shorter name
+            match = (
+                self.score(query, query_grams, link, count),
+                -len(self.names[link]),
+                link,
+            )
+            if len(top) < limit:
+                heapq.heappush(top, match)
+            elif match > top[0]:
+                heapq.heapreplace(top, match)
+        return [
+            (score, self.mangas[link]) for score, _, link in sorted(top, reverse=True)
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "series": len(self.mangas),
+            "trigrams": len(self.postings),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_index: Optional[SearchIndex] = None
+_lock = asyncio.Lock()
+register_collector(
+    "search_index", lambda: {} if _index is None else {"series": _index.stats()}
+)
+
+
+async def get_search_index() -> SearchIndex:
+    global _index
+    async with _lock:
+        if _index is None:
+            backend = await Backend.get_instance()
+            index = SearchIndex()
+            for series in await backend.load_series():
+                index.add(Manga(series["_id"], series["name"], series["cover"]))
+            _index = index
+        return _index
+
+
+async def index_mangas(mangas: list[Manga]):
+    index = await get_search_index()
+    changed = [manga for manga in mangas if index.add(manga)]
+    if len(changed) != 0:
+        backend = await Backend.get_instance()
+        await backend.save_series(changed)
+
+
+@instrumented("search_manga")
+async def search_manga(query: str) -> list[Manga]:
+    index = await get_search_index()
+    matches = index.search(query)
+    local = [manga for score, manga in matches if score >= SEARCH_RESULT_SCORE]
+    if len(matches) != 0 and matches[0][0] >= SEARCH_MIN_SCORE:
+        index.hits += 1
+        return local
+
+    index.misses += 1
+    try:
+        results = (await scraper.search_manga_links(query))[:SEARCH_LIMIT]
+    except UpstreamError:
+        if len(local) == 0:
+            raise
+        return local
+    if len(results) == 0:
+        # mangapark finds nothing for most typos, the fuzzy matches beat that
+        return local
+    await index_mangas(results)
+    return results
@@ -0,0 +1,46 @@
+import aiohttp
+from typing import Optional
+
+# connection pool settings, shared by the scraper and the image fetcher
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 16
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def new_connector() -> aiohttp.TCPConnector:
+    return aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+
+
+async def start_session() -> aiohttp.ClientSession:
+    # NOTE: this has to be called from inside the running event loop,
+    # the connector binds itself to it. nothing is cached at the http level,
+    # parsed results and processed images have stores of their own
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=new_connector(), timeout=REQUEST_TIMEOUT
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    assert (
+        _session is not None and not _session.closed
+    ), "HTTP session not started, call start_session() first."
+    return _session
@@ -0,0 +1,71 @@
+import os
+import socket
+import discord
+from dataclasses import dataclass
+from os import getenv
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ShardConfig:
+    # None lets discord.py pick the shard count, and runs every shard here
+    shard_count: Optional[int] = None
+    shard_ids: Optional[list[int]] = None
+    process_index: int = 0
+    process_count: int = 1
+
+    @property
+    def sharded(self) -> bool:
+        return self.shard_count is not None or self.shard_ids is not None
+
+    @property
+    def primary(self) -> bool:
+        # runs the work that only one process should do, like the refresher
+        return self.process_index == 0
+
+
+def parse_shard_ids(text: str) -> list[int]:
+    # "0-3", "4,5,7" or a mix of both
+    shard_ids: list[int] = []
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return shard_ids
+
+
+def split_shards(shard_count: int, process_count: int) -> list[list[int]]:
+    # contiguous ranges, the first processes take one more if it doesn't divide
+    size, extra = divmod(shard_count, process_count)
+    ranges = []
+    start = 0
+    for index in range(process_count):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def shard_config_from_env() -> ShardConfig:
+    shard_count = getenv("SHARD_COUNT")
+    shard_ids = getenv("SHARD_IDS")
+    return ShardConfig(
+        shard_count=int(shard_count) if shard_count else None,
+        shard_ids=parse_shard_ids(shard_ids) if shard_ids else None,
+        process_index=int(getenv("PROCESS_INDEX", "0")),
+        process_count=int(getenv("PROCESS_COUNT", "1")),
+    )
+
+
+# set per process by launcher.py, a bot started on its own runs unsharded
+# as the only process
+SHARD_CONFIG = shard_config_from_env()
+# identifies this process as the holder of a fetch lease, see utils/results.py
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def make_bot(config: ShardConfig = SHARD_CONFIG) -> discord.Bot:
+    if not config.sharded:
+        return discord.Bot()
+    return discord.AutoShardedBot(
+        shard_count=config.shard_count, shard_ids=config.shard_ids
+    )
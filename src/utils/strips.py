@@ -0,0 +1,110 @@
+import asyncio
+import discord
+from pathlib import Path
+from typing import Optional
+import utils.scraper as scraper  # type: ignore
+import utils.bot_util as bot_util  # type: ignore
+import utils.attachments as attachments  # type: ignore
+import utils.image_store as image_store  # type: ignore
+from utils.cache import TTLCache  # type: ignore
+from utils.executor import run_cpu  # type: ignore
+from utils.images import STRIP_SETTINGS, stitch_images  # type: ignore
+from utils.metrics import instrumented  # type: ignore
+
+# pages per step of the long strip mode, a message holds at most 10 embeds
+STRIP_PAGES = 10
+# (chapter link, batch) -> paths of the stitched strip in the image store
+STRIP_CACHE = TTLCache("strips", maxsize=256, ttl=60 * 60)
+STRIP_FLIGHTS = scraper.SingleFlight("strip")
+# the upload limit of servers without boosts, the lowest any server has
+STRIP_UPLOAD_LIMIT = 25 * 1024 * 1024
+
+
+def strip_count(pages: list[str]) -> int:
+    return max(1, -(-len(pages) // STRIP_PAGES))
+
+
+def strip_key(chapter_link: str, batch: int, part: int) -> str:
+    # stands in for a page url in the attachment index
+    return f"{chapter_link}#strip-{batch}-{part}"
+
+
+@instrumented("build_strip")
+async def build_strip(pages: list[str]) -> list[Path]:
+    # paths, so the pages are read where they're stitched, not copied into the pool
+    paths = await asyncio.gather(*(bot_util.fetch_image_path(url) for url in pages))
+    parts = await run_cpu(stitch_images, paths, STRIP_SETTINGS)
+    # written to the image store like the pages, only the paths are kept in memory
+    return [
+        await image_store.IMAGE_STORE.put(data, extension) for data, extension in parts
+    ]
+
+
+async def get_strip(chapter_link: str, pages: list[str], batch: int) -> list[Path]:
+    key = (chapter_link, batch)
+    strip = STRIP_CACHE.get(key)
+    if strip is None:
+        batch_pages = pages[batch * STRIP_PAGES : (batch + 1) * STRIP_PAGES]
+        strip = await STRIP_FLIGHTS.do(key, lambda: build_strip(batch_pages))
+        STRIP_CACHE.set(key, strip)
+    return strip
+
+
+def open_strip_files(strip: list[Path]) -> tuple[list[discord.File], int]:
+    # the parts that fit in one message together, and how many didn't
+    files: list[discord.File] = []
+    size = 0
+    try:
+        for part, path in enumerate(strip):
+            size += path.stat().st_size
+            if size > STRIP_UPLOAD_LIMIT:
+                break
+            files.append(discord.File(path, filename=f"strip_{part}{path.suffix}"))
+    except FileNotFoundError:
+        for file in files:
+            file.close()
+        raise
+    return files, len(strip) - len(files)
+
+
+async def get_strip_files(
+    chapter_link: str, pages: list[str], batch: int
+) -> tuple[list[discord.File], int]:
+    try:
+        return open_strip_files(await get_strip(chapter_link, pages, batch))
+    except FileNotFoundError:
+        # evicted from the image store since it was stitched
+        STRIP_CACHE.pop((chapter_link, batch))
+        return open_strip_files(await get_strip(chapter_link, pages, batch))
+
+
+async def find_strip_urls(chapter_link: str, batch: int) -> Optional[list[str]]:
+    # the parts of a strip are uploaded in one message, so they expire together
+    urls = []
+    for part in range(STRIP_PAGES):
+        url = await attachments.find_attachment_url(
+            strip_key(chapter_link, batch, part)
+        )
+        if url is None:
+            break
+        urls.append(url)
+    return urls if len(urls) != 0 else None
+
+
+async def load_strip(
+    chapter_link: str, pages: list[str], batch: int
+) -> tuple[list[str], list[discord.File], int]:
+    # the image urls of the parts, the files to attach for them,
+    # and how many parts were left out for going over the upload limit
+    cdn_urls = await find_strip_urls(chapter_link, batch)
+    if cdn_urls is not None:
+        return cdn_urls, [], 0
+    files, left_out = await get_strip_files(chapter_link, pages, batch)
+    # only whole strips go to the cache channel, a later reader couldn't tell
+    if left_out == 0 and len(attachments.CACHE_CHANNELS) != 0:
+        keys = [strip_key(chapter_link, batch, part) for part in range(len(files))]
+        cdn_urls = await attachments.upload(keys, files)
+        if cdn_urls is not None:
+            return cdn_urls, [], 0
+        files, left_out = await get_strip_files(chapter_link, pages, batch)
+    return [f"attachment://{file.filename}" for file in files], files, left_out
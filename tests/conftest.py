@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from utils.backend import Backend  # type: ignore
+
+# the saved MangaPark pages the benchmarks replay
+FIXTURES = ROOT / "benchmarks" / "fixtures"
+
+
+@pytest.fixture
+def backend():
+    # in memory mongo, Backend.get_instance() hands it out during the test
+    backend = Backend(AsyncMongoMockClient())
+    Backend._Backend__instance = backend  # type: ignore
+    yield backend
+    Backend._Backend__instance = None  # type: ignore
@@ -0,0 +1,223 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Any
+
+import discord
+import pytest
+
+from utils import attachments  # type: ignore
+from utils.chapter_store import ChapterList  # type: ignore
+from utils.scraper import Chapter  # type: ignore
+from cogs.manga_reader import MangaReaderView  # type: ignore
+
+PAGES = ["https://s01.mpfiles.org/media/1.jpg", "https://s01.mpfiles.org/media/2.jpg"]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    attachments.ATTACHMENT_CACHE.clear()
+    yield
+    attachments.ATTACHMENT_CACHE.clear()
+    attachments.CACHE_CHANNELS.clear()
+
+
+@pytest.fixture
+def cdn() -> "FakeCdn":
+    return FakeCdn()
+
+
+class FakeCdn:
+    # the urls of the attachments discord still serves
+    def __init__(self):
+        self.live: set[str] = set()
+        self.uploads = 0
+
+    def upload(self, kwargs: dict[str, Any]) -> "FakeMessage":
+        files = kwargs.get("files") or ([kwargs["file"]] if "file" in kwargs else [])
+        urls = []
+        for file in files:
+            self.uploads += 1
+            # discord hands back a signed cdn url for every uploaded file
+            urls.append(
+                f"https://cdn.example/{self.uploads}/{file.filename}?ex=7fffffff"
+            )
+        self.live.update(urls)
+        return FakeMessage(urls)
+
+
+class FakeAttachment:
+    def __init__(self, url: str):
+        self.url = url
+
+
+class FakeMessage:
+    def __init__(self, urls: list[str]):
+        self.attachments = [FakeAttachment(url) for url in urls]
+
+
+class FakeChannel:
+    def __init__(self, cdn: FakeCdn):
+        self.cdn = cdn
+
+    async def send(self, **kwargs: Any) -> FakeMessage:
+        return self.cdn.upload(kwargs)
+
+
+class FakeResponse:
+    async def defer(self):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, cdn: FakeCdn):
+        self.cdn = cdn
+        self.response = FakeResponse()
+        self.edits: list[dict[str, Any]] = []
+        self.message = FakeMessage([])
+
+    async def edit_original_response(self, **kwargs: Any) -> FakeMessage:
+        self.edits.append(kwargs)
+        # new files or an empty attachments list replace the message's
+        # attachments, and discord deletes the ones replaced
+        if any(name in kwargs for name in ("file", "files", "attachments")):
+            for attachment in self.message.attachments:
+                self.cdn.live.discard(attachment.url)
+            self.message = self.cdn.upload(kwargs)
+        return self.message
+
+
+class FakePrefetcher:
+    # hands out an in memory page instead of downloading it
+    def __init__(self):
+        self.requested: list[str] = []
+
+    async def get_file(self, url: str) -> discord.File:
+        self.requested.append(url)
+        return discord.File(BytesIO(b"page"), filename="image.jpg")
+
+    def prefetch(self, urls: list[str]):
+        pass
+
+    def cancel(self):
+        pass
+
+
+def reader_view(prefetcher: FakePrefetcher) -> MangaReaderView:
+    chapters = ChapterList("/title/1", [Chapter("/title/1/1", "Chapter 1")])
+    view = MangaReaderView("/title/1", 0, chapters)
+    view.name = "Chapter 1"
+    view.pages = PAGES
+    view.prefetcher = prefetcher
+    return view
+
+
+def test_cdn_url_expiry_reads_the_signed_timestamp():
+    expiry = attachments.cdn_url_expiry("https://cdn.example/a.jpg?ex=65f1a2b3&is=1")
+    assert expiry == datetime.fromtimestamp(0x65F1A2B3, timezone.utc)
+
+
+def test_cdn_url_expiry_falls_back_to_the_default_lifetime():
+    for cdn_url in ["https://cdn.example/a.jpg", "https://cdn.example/a.jpg?ex=zz"]:
+        expected = datetime.now(timezone.utc) + attachments.DEFAULT_LIFETIME
+        assert abs(attachments.cdn_url_expiry(cdn_url) - expected) < timedelta(
+            seconds=5
+        )
+
+
+def test_usable_drops_urls_within_the_margin():
+    now = datetime.now(timezone.utc)
+    margin = attachments.EXPIRY_MARGIN
+    assert attachments.usable(now + margin + timedelta(minutes=1))
+    assert not attachments.usable(now + margin - timedelta(minutes=1))
+    assert not attachments.usable(now - timedelta(days=1))
+    # mongo hands back naive datetimes, in utc
+    naive = (now + margin + timedelta(minutes=1)).replace(tzinfo=None)
+    assert attachments.usable(naive)
+
+
+def test_misses_are_cached_for_a_while(backend, monkeypatch):
+    lookups: list[str] = []
+    find_attachment = backend.find_attachment
+
+    async def counted(key: str):
+        lookups.append(key)
+        return await find_attachment(key)
+
+    monkeypatch.setattr(backend, "find_attachment", counted)
+    now = [0.0]
+    monkeypatch.setattr(attachments.ATTACHMENT_CACHE, "clock", lambda: now[0])
+
+    async def main():
+        assert await attachments.find_attachment_url(PAGES[0]) is None
+        assert await attachments.find_attachment_url(PAGES[0]) is None
+        assert len(lookups) == 1
+
+        now[0] += attachments.MISSING_TTL + 1
+        assert await attachments.find_attachment_url(PAGES[0]) is None
+        assert len(lookups) == 2
+
+    asyncio.run(main())
+
+
+def test_expired_urls_in_mongo_are_not_used(backend):
+    async def main():
+        key = attachments.attachment_key(PAGES[0])
+        expired = datetime.now(timezone.utc) - timedelta(minutes=1)
+        await backend.save_attachment(key, "https://cdn.example/old.jpg", expired)
+        assert await attachments.find_attachment_url(PAGES[0]) is None
+
+    asyncio.run(main())
+
+
+def test_a_page_is_uploaded_once_then_linked(backend, cdn):
+    attachments.CACHE_CHANNELS.append(FakeChannel(cdn))
+
+    async def main():
+        prefetcher = FakePrefetcher()
+        interaction = FakeInteraction(cdn)
+        view = reader_view(prefetcher)
+        await view.update_page(interaction, 0)
+        key = attachments.attachment_key(PAGES[0])
+        cdn_url = (await backend.find_attachment(key))["url"]
+        edit = interaction.edits[-1]
+        assert "file" not in edit and edit["embed"].image.url == cdn_url
+
+        # the uploader turning the page leaves the upload alone
+        await view.update_page(interaction, 1)
+        assert cdn_url in cdn.live
+
+        # another reader of the same page links the upload
+        interaction = FakeInteraction(cdn)
+        await reader_view(prefetcher).update_page(interaction, 0)
+        assert prefetcher.requested == [PAGES[0], PAGES[1]]
+        assert interaction.edits[-1]["embed"].image.url == cdn_url
+
+        # so does another process, from mongo
+        attachments.ATTACHMENT_CACHE.clear()
+        interaction = FakeInteraction(cdn)
+        await reader_view(prefetcher).update_page(interaction, 0)
+        assert prefetcher.requested == [PAGES[0], PAGES[1]]
+        assert interaction.edits[-1]["embed"].image.url == cdn_url
+
+    asyncio.run(main())
+
+
+def test_pages_attached_to_the_reader_message_are_not_linked(backend, cdn):
+    async def main():
+        prefetcher = FakePrefetcher()
+        interaction = FakeInteraction(cdn)
+        view = reader_view(prefetcher)
+        await view.update_page(interaction, 0)
+        assert "file" in interaction.edits[-1]
+        await view.update_page(interaction, 1)
+
+        # without a cache channel every reader gets the page attached again
+        key = attachments.attachment_key(PAGES[0])
+        assert await backend.find_attachment(key) is None
+        interaction = FakeInteraction(cdn)
+        await reader_view(prefetcher).update_page(interaction, 0)
+        assert "file" in interaction.edits[-1]
+        assert prefetcher.requested == [PAGES[0], PAGES[1], PAGES[0]]
+
+    asyncio.run(main())
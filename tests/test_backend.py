@@ -0,0 +1,40 @@
+import asyncio
+
+
+def test_migrate_user_bookmarks_moves_the_legacy_arrays(backend):
+    async def main():
+        await backend.setup()
+        await backend.add_new_bookmark(1, "/title/a", "/c/a2")
+        # read once, so the migration has to drop the cached bookmarks
+        assert list(await backend.load_bookmarks(1)) == ["/title/a"]
+        await backend.users.insert_many(
+            [
+                {
+                    "_id": 1,
+                    "bookmarks": [
+                        {"link": "/title/a", "chapter": 0},
+                        {"link": "/title/b", "chapter": 3},
+                    ],
+                },
+                {"_id": 2, "bookmarks": [{"link": "/title/a", "chapter": 5}]},
+                {"_id": 3, "bookmarks": []},
+            ]
+        )
+
+        await backend.migrate_user_bookmarks()
+        first = await backend.load_bookmarks(1)
+        # the bookmark that was already moved keeps its chapter link
+        assert first["/title/a"]["chapter_link"] == "/c/a2"
+        assert "chapter" not in first["/title/a"]
+        assert first["/title/b"]["chapter"] == 3
+        assert (await backend.load_bookmarks(2))["/title/a"]["chapter"] == 5
+        # only the empty array of user 3 is left
+        assert (
+            await backend.users.count_documents({"bookmarks": {"$exists": True}}) == 1
+        )
+
+        # a second run finds nothing left to move
+        await backend.migrate_user_bookmarks()
+        assert await backend.bookmarks.count_documents({}) == 3
+
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+import asyncio
+
+from utils import chapter_store, scraper  # type: ignore
+from utils.chapter_store import ChapterList, get_chapter_list  # type: ignore
+from utils.scraper import Chapter  # type: ignore
+
+
+def chapters(*numbers: int) -> list[Chapter]:
+    return [Chapter(f"/c/{number}", f"Chapter {number}") for number in numbers]
+
+
+def test_merge_adds_only_the_new_chapters():
+    chapter_list = ChapterList("/title/1", chapters(1, 2))
+    assert chapter_list.merge(chapters(1, 2, 3, 4)) == chapters(3, 4)
+    assert list(chapter_list) == chapters(1, 2, 3, 4)
+    assert chapter_list.version == 1
+
+    # merging the same list again changes nothing
+    assert chapter_list.merge(chapters(1, 2, 3, 4)) == []
+    assert chapter_list.version == 1
+
+
+def test_positions_stay_when_upstream_drops_a_chapter():
+    chapter_list = ChapterList("/title/1", chapters(1, 2, 3))
+    # chapter 2 was taken down, chapter 4 was released
+    assert chapter_list.merge(chapters(1, 3, 4)) == chapters(4)
+    assert [chapter_list.index_of(f"/c/{n}") for n in (1, 2, 3, 4)] == [0, 1, 2, 3]
+    assert chapter_list[1] == Chapter("/c/2", "Chapter 2")
+    # the scraped list is kept, made of the chapters held here
+    assert chapter_list.source == tuple(chapters(1, 3, 4))
+    assert all(chapter in chapter_list.chapters for chapter in chapter_list.source)
+
+
+def test_bookmark_index_finds_the_bookmarked_chapter():
+    chapter_list = ChapterList("/title/1", chapters(1, 2, 3))
+    chapter_list.merge(chapters(1, 3))
+    assert chapter_list.bookmark_index(None) is None
+    assert chapter_list.bookmark_index({"chapter_link": "/c/2"}) == 1
+    assert chapter_list.bookmark_index({"chapter_link": "/c/9"}) is None
+    # the link wins over a stale position
+    assert chapter_list.bookmark_index({"chapter_link": "/c/3", "chapter": 0}) == 2
+
+
+def test_bookmark_index_reads_legacy_positions():
+    chapter_list = ChapterList("/title/1", chapters(1, 2, 3))
+    assert chapter_list.bookmark_index({"chapter": 2}) == 2
+    assert chapter_list.bookmark_index({"chapter": "1"}) == 1
+    assert chapter_list.bookmark_index({"chapter": 3}) is None
+    assert chapter_list.bookmark_index({"chapter": -1}) is None
+    assert chapter_list.bookmark_index({}) is None
+
+
+def test_get_chapter_list_merges_into_the_stored_history(backend, monkeypatch):
+    link = "/title/1"
+    scraped = [chapters(1, 2)]
+
+    async def get_manga_chapters(manga_link: str):
+        return scraped[0]
+
+    monkeypatch.setattr(scraper, "get_manga_chapters", get_manga_chapters)
+
+    async def main():
+        await backend.setup()
+        await backend.append_chapters(link, chapter_store.to_documents(chapters(0)))
+        first = await get_chapter_list(link)
+        assert list(first) == chapters(0, 1, 2)
+
+        # a restart starts from mongo, where chapter 0 was kept
+        chapter_store.CHAPTER_LISTS.clear()
+        scraped[0] = chapters(2, 3)
+        second = await get_chapter_list(link)
+        assert list(second) == chapters(0, 1, 2, 3)
+        assert [c["link"] for c in await backend.load_chapters(link)] == [
+            f"/c/{n}" for n in range(4)
+        ]
+
+    chapter_store.CHAPTER_LISTS.clear()
+    try:
+        asyncio.run(main())
+    finally:
+        chapter_store.CHAPTER_LISTS.clear()
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiohttp import web
+from discord.ext import commands  # noqa: F401, the cogs find it loaded by the bot
+
+from cogs import download as download_cog  # type: ignore
+from utils import downloads, ratelimit, scraper  # type: ignore
+from utils import session as pooled  # type: ignore
+from utils.scraper import Chapter, Manga  # type: ignore
+
+PAGE = b"page" * 1000
+
+
+async def start_stand_in_cdn(requests: list[str]) -> tuple[web.AppRunner, str]:
+    async def media(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        return web.Response(body=PAGE, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/media/{tail:.*}", media)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def aged(path: Path, age: float, size: int = 0) -> Path:
+    if not path.is_dir():
+        path.write_bytes(b"x" * size)
+    os.utime(path, (time.time() - age, time.time() - age))
+    return path
+
+
+def test_a_download_resumes_from_the_staged_pages(tmp_path, monkeypatch):
+    chapters = [(0, Chapter("/c/1", "One")), (1, Chapter("/c/2", "Two"))]
+    archive = tmp_path / "archive.cbz"
+    stage = tmp_path / "archive.cbz.parts"
+    requests: list[str] = []
+
+    async def main():
+        runner, base_url = await start_stand_in_cdn(requests)
+
+        async def get_manga_chapter_images(link: str) -> list[str]:
+            return [f"{base_url}/media{link}/{page}.jpg" for page in range(3)]
+
+        monkeypatch.setattr(
+            scraper, "get_manga_chapter_images", get_manga_chapter_images
+        )
+        monkeypatch.setitem(
+            ratelimit.HOST_CONFIGS,
+            "127.0.0.1",
+            ratelimit.HostConfig(rate=1000, burst=1000, max_concurrency=8),
+        )
+        await pooled.start_session()
+        try:
+            await downloads.download_chapters(chapters, archive)
+        finally:
+            await pooled.close_session()
+            await runner.cleanup()
+
+    # an earlier download got the first chapter and half of a page of the second
+    (stage / "0001").mkdir(parents=True)
+    for page in range(3):
+        (stage / "0001" / f"{page + 1:03d}.jpg").write_bytes(PAGE)
+    (stage / "0002").mkdir()
+    (stage / "0002" / "001.jpg.part").write_bytes(PAGE[:10])
+
+    asyncio.run(main())
+    assert sorted(requests) == [f"/media/c/2/{page}.jpg" for page in range(3)]
+    with zipfile.ZipFile(archive) as zip_file:
+        assert zip_file.namelist() == [
+            f"{number:04d} {name}/{page:03d}.jpg"
+            for number, name in ((1, "One"), (2, "Two"))
+            for page in (1, 2, 3)
+        ]
+        assert zip_file.read("0002 Two/001.jpg") == PAGE
+    assert not stage.exists()
+
+
+def test_sweep_archives_removes_old_downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, "DOWNLOAD_DIR", tmp_path)
+    old = aged(tmp_path / "old.cbz", downloads.DOWNLOAD_MAX_AGE + 60)
+    fresh = aged(tmp_path / "fresh.cbz", 60)
+    failed = tmp_path / "failed.cbz.parts"
+    failed.mkdir()
+    aged(failed, downloads.DOWNLOAD_MAX_AGE + 60)
+    running = tmp_path / "running.cbz.parts"
+    running.mkdir()
+    aged(running, downloads.DOWNLOAD_MAX_AGE + 60)
+    monkeypatch.setitem(
+        downloads.DOWNLOAD_FLIGHTS.calls, tmp_path / "running.cbz", None
+    )
+
+    downloads.sweep_archives()
+    assert not old.exists() and not failed.exists()
+    assert fresh.exists() and running.exists()
+
+
+def test_sweep_archives_keeps_the_directory_under_its_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloads, "DOWNLOAD_DIR", tmp_path)
+    oldest = aged(tmp_path / "oldest.cbz", 300, 1000)
+    stage = tmp_path / "staged.cbz.parts"
+    (stage / "0001").mkdir(parents=True)
+    (stage / "0001" / "001.jpg").write_bytes(b"x" * 1000)
+    aged(stage, 200)
+    newest = aged(tmp_path / "newest.cbz", 100, 1000)
+
+    # staged pages count with their size
+    downloads.sweep_archives(max_bytes=1500)
+    assert not oldest.exists() and not stage.exists() and newest.exists()
+
+
+class FakeContext:
+    def __init__(self, guild):
+        self.guild = guild
+        self.responses: list[tuple[str, object]] = []
+
+    async def defer(self):
+        pass
+
+    async def respond(self, content: str, file=None):
+        self.responses.append((content, file))
+        if file is not None:
+            file.close()
+
+
+def run_download(tmp_path, monkeypatch, guild, size: int) -> tuple[FakeContext, Path]:
+    archive = tmp_path / "archive.cbz"
+    archive.write_bytes(b"x" * size)
+
+    async def search_manga(to_search: str):
+        return [Manga("/title/1", "Blue Lantern", "")]
+
+    async def get_chapter_list(link: str):
+        return [Chapter("/c/1", "One")]
+
+    async def get_archive(link, chapters, first, last):
+        return archive
+
+    monkeypatch.setattr(download_cog, "search_manga", search_manga)
+    monkeypatch.setattr(download_cog, "get_chapter_list", get_chapter_list)
+    monkeypatch.setattr(download_cog, "get_archive", get_archive)
+    ctx = FakeContext(guild)
+    cog = download_cog.Download(None)
+    asyncio.run(download_cog.Download.download.callback(cog, ctx, "blue", 1, None))
+    return ctx, archive
+
+
+def test_download_uses_the_upload_limit_of_the_server(tmp_path, monkeypatch):
+    boosted = SimpleNamespace(filesize_limit=50 * 1024 * 1024)
+    ctx, archive = run_download(
+        tmp_path, monkeypatch, boosted, download_cog.UPLOAD_LIMIT + 1
+    )
+    (content, file), *_ = ctx.responses
+    assert content == "Blue Lantern, chapters 1-1" and file is not None
+    assert archive.exists()
+
+
+def test_an_archive_too_big_to_send_is_removed(tmp_path, monkeypatch):
+    ctx, archive = run_download(
+        tmp_path, monkeypatch, None, download_cog.UPLOAD_LIMIT + 1
+    )
+    (content, file), *_ = ctx.responses
+    assert "too big for discord" in content and file is None
+    assert not archive.exists()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from utils import image_store  # type: ignore
+from utils.image_store import ImageStore, evict_oldest  # type: ignore
+
+
+def stored_file(store: ImageStore, data: bytes, age: float) -> Path:
+    path = store.path(image_store.hash_name(data, "jpg"))
+    image_store.write_file(path, data)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ImageStore(tmp_path, max_bytes=2500)
+    monkeypatch.setattr(image_store, "IMAGE_STORE", store)
+    image_store.IMAGE_INDEX.clear()
+    yield store
+    image_store.IMAGE_INDEX.clear()
+
+
+def test_evict_oldest_removes_the_least_recently_used(store):
+    old, used, new = (
+        stored_file(store, bytes([n]) * 1000, age) for n, age in enumerate((30, 20, 10))
+    )
+    assert evict_oldest(store.root, store.max_bytes) == (2, 2000, 1)
+    assert not old.exists() and used.exists() and new.exists()
+
+
+def test_evict_oldest_keeps_the_newest_file_over_the_cap(store):
+    stored_file(store, b"a" * 1000, 20)
+    newest = stored_file(store, b"b" * 5000, 10)
+    assert evict_oldest(store.root, store.max_bytes) == (1, 5000, 1)
+    assert newest.exists()
+
+
+def test_evict_oldest_removes_stale_partial_writes(store):
+    stored_file(store, b"a" * 100, 10)
+    stale = store.root / "aa" / "page.jpg.1.part"
+    fresh = store.root / "aa" / "page.jpg.2.part"
+    for path, age in ((stale, image_store.PARTIAL_MAX_AGE + 60), (fresh, 0)):
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"half")
+        os.utime(path, (time.time() - age, time.time() - age))
+    # partial writes don't count towards the size
+    assert evict_oldest(store.root, store.max_bytes) == (1, 100, 0)
+    assert not stale.exists() and fresh.exists()
+
+
+def test_the_same_page_can_be_put_twice_at_once(store):
+    async def main():
+        return await asyncio.gather(
+            *(store.put(b"page" * 100, "jpg") for _ in range(4))
+        )
+
+    paths = asyncio.run(main())
+    assert len(set(paths)) == 1 and paths[0].read_bytes() == b"page" * 100
+    assert list(paths[0].parent.glob("*.part")) == []
+
+
+def test_a_hit_marks_the_file_used(store):
+    old = stored_file(store, b"a" * 1000, 30)
+    stored_file(store, b"b" * 1000, 20)
+    assert asyncio.run(store.get(old.name)) == old
+    stored_file(store, b"c" * 1000, 10)
+    evict_oldest(store.root, store.max_bytes)
+    assert old.exists()
+
+
+def test_an_evicted_image_is_found_missing_and_stored_again(store, backend):
+    async def main():
+        path = await image_store.save_image("page-1", b"a" * 2000, "jpg")
+        assert await image_store.find_image("page-1") == path
+        await image_store.save_image("page-2", b"b" * 2000, "jpg")
+        os.utime(path, (time.time() - 60, time.time() - 60))
+        await store.sweep()
+        assert not path.exists()
+
+        # the index entry is dropped, the caller downloads and stores it again
+        assert await image_store.find_image("page-1") is None
+        assert "page-1" not in image_store.IMAGE_INDEX
+        assert await image_store.save_image("page-1", b"a" * 2000, "jpg") == path
+        assert await image_store.find_image("page-1") == path
+
+    asyncio.run(main())
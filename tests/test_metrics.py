@@ -0,0 +1,30 @@
+import asyncio
+import socket
+
+import aiohttp
+
+from utils import metrics  # type: ignore
+
+
+def test_metrics_are_served():
+    async def main():
+        await metrics.start_metrics_server("127.0.0.1", 0)
+        port = metrics._runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    assert response.status == 200
+        finally:
+            await metrics.stop_metrics_server()
+
+    asyncio.run(main())
+
+
+def test_a_port_in_use_does_not_stop_the_bot(capsys):
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        port = taken.getsockname()[1]
+        asyncio.run(metrics.start_metrics_server("127.0.0.1", port))
+    assert metrics._runner is None
+    assert f"Failed to serve metrics on 127.0.0.1:{port}" in capsys.readouterr().out
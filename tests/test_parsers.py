@@ -0,0 +1,38 @@
+import pytest
+
+from conftest import FIXTURES  # type: ignore
+from utils.parsers import PARSERS  # type: ignore
+
+METHODS = [
+    "parse_chapter_links",
+    "parse_page_images",
+    "parse_cover_images",
+    "parse_manga_description",
+    "parse_manga_page",
+]
+
+
+def parse(engine: str, method: str, html: str):
+    # a page without what's asked for fails the same way in both engines
+    try:
+        return getattr(PARSERS[engine](), method)(html)
+    except Exception as error:
+        return type(error)
+
+
+@pytest.mark.skipif("lxml" not in PARSERS, reason="lxml isn't installed")
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize(
+    "fixture", sorted(FIXTURES.glob("*.html")), ids=lambda path: path.stem
+)
+def test_lxml_parses_like_bs4(fixture, method):
+    html = fixture.read_text()
+    assert parse("lxml", method, html) == parse("bs4", method, html)
+
+
+def test_the_fixtures_hold_something_to_parse():
+    # so the comparison above isn't between two empty results
+    bs4 = PARSERS["bs4"]()
+    assert len(bs4.parse_chapter_links((FIXTURES / "manga.html").read_text())) != 0
+    assert len(bs4.parse_page_images((FIXTURES / "chapter.html").read_text())) != 0
+    assert len(bs4.parse_cover_images((FIXTURES / "search.html").read_text())) != 0
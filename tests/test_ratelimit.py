@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from utils import ratelimit  # type: ignore
+from utils.ratelimit import BACKGROUND, TokenBucket, UpstreamError  # type: ignore
+from utils.scraper import SingleFlight  # type: ignore
+
+
+def test_background_requests_leave_the_reserve():
+    async def main():
+        # the clock stands still, so no tokens come back
+        bucket = TokenBucket(rate=1, burst=3, clock=lambda: 0.0)
+        await bucket.acquire_spare(reserve=1)
+        await bucket.acquire_spare(reserve=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(bucket.acquire_spare(reserve=1), 0.05)
+        # the reserved token is still there for a regular request
+        await asyncio.wait_for(bucket.acquire(), 0.05)
+
+    asyncio.run(main())
+
+
+def test_background_requests_wait_for_queued_ones():
+    async def main():
+        bucket = TokenBucket(rate=50, burst=1)
+        await bucket.acquire()
+        order: list[str] = []
+
+        async def take(name: str, acquire):
+            await acquire()
+            order.append(name)
+
+        regular = asyncio.create_task(take("regular", bucket.acquire))
+        await asyncio.sleep(0)
+        background = asyncio.create_task(
+            take("background", lambda: bucket.acquire_spare(reserve=0))
+        )
+        await asyncio.gather(regular, background)
+        assert order == ["regular", "background"]
+
+    asyncio.run(main())
+
+
+def test_waiting_for_a_spare_token_leaves_it():
+    async def main():
+        bucket = TokenBucket(rate=1, burst=2, clock=lambda: 0.0)
+        await bucket.wait_spare(reserve=1)
+        await bucket.wait_spare(reserve=1)
+        assert bucket.tokens == 2
+
+    asyncio.run(main())
+
+
+def test_flights_run_at_the_priority_of_a_user():
+    async def main():
+        flight = SingleFlight("test")
+
+        async def background_priority() -> bool:
+            return BACKGROUND.get()
+
+        async def prefetch() -> bool:
+            BACKGROUND.set(True)
+            return await flight.do("key", background_priority)
+
+        # a user joining a flight a prefetch started doesn't wait behind the reserve
+        assert await asyncio.create_task(prefetch()) is False
+
+    asyncio.run(main())
+
+
+class FaultyServer:
+    # answers with the queued statuses in turn, then 200
+    def __init__(self, *responses: tuple[int, dict[str, str]]):
+        self.responses = list(responses)
+        self.requests = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if len(self.responses) == 0:
+            return web.Response(text="ok")
+        status, headers = self.responses.pop(0)
+        return web.Response(status=status, headers=headers)
+
+
+async def get_text(server: FaultyServer, config: ratelimit.HostConfig) -> str:
+    app = web.Application()
+    app.router.add_get("/", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/"
+    ratelimit.HOST_CONFIGS["127.0.0.1"] = config
+    try:
+        async with aiohttp.ClientSession() as session:
+            return await ratelimit.limited_get(
+                session, url, lambda response: response.text()
+            )
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    monkeypatch.setattr(ratelimit, "LIMITERS", {})
+    monkeypatch.setattr(ratelimit, "HOST_CONFIGS", dict(ratelimit.HOST_CONFIGS))
+    backoffs: list[int] = []
+
+    def backoff(attempt: int) -> float:
+        backoffs.append(attempt)
+        return 0.0
+
+    monkeypatch.setattr(ratelimit, "backoff", backoff)
+    return backoffs
+
+
+CONFIG = ratelimit.HostConfig(rate=1000, burst=1000, max_concurrency=8)
+
+
+def test_a_429_waits_for_its_retry_after(limiters):
+    server = FaultyServer((429, {"Retry-After": "0.2"}))
+    start = time.monotonic()
+    assert asyncio.run(get_text(server, CONFIG)) == "ok"
+    assert time.monotonic() - start >= 0.2
+    assert server.requests == 2
+    # the server's wait is used instead of the backoff
+    assert limiters == []
+
+
+def test_a_503_is_retried(limiters):
+    server = FaultyServer((503, {}))
+    assert asyncio.run(get_text(server, CONFIG)) == "ok"
+    assert server.requests == 2 and limiters == [0]
+    limiter = ratelimit.LIMITERS["127.0.0.1"]
+    assert limiter.retries == 1 and limiter.failures == 0
+
+
+def test_a_404_fails_without_retrying(limiters):
+    server = FaultyServer((404, {}))
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(get_text(server, CONFIG))
+    assert error.value.status == 404
+    assert server.requests == 1
+    assert ratelimit.LIMITERS["127.0.0.1"].retries == 0
+
+
+def test_giving_up_after_the_last_attempt(limiters):
+    server = FaultyServer(*[(503, {})] * ratelimit.RETRY_ATTEMPTS)
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(get_text(server, CONFIG))
+    assert error.value.status == 503
+    assert server.requests == ratelimit.RETRY_ATTEMPTS
+
+
+def test_the_concurrency_backs_off_on_errors(limiters):
+    server = FaultyServer((503, {}), (503, {}))
+    asyncio.run(get_text(server, CONFIG))
+    # halved on each error, then one success adds a fraction back
+    limit = ratelimit.LIMITERS["127.0.0.1"].concurrency.limit
+    assert 2 < limit < 3
+
+
+def test_the_concurrency_backs_off_on_slow_responses(limiters):
+    slow = ratelimit.HostConfig(
+        rate=1000, burst=1000, max_concurrency=8, latency_target=0.0
+    )
+    asyncio.run(get_text(FaultyServer(), slow))
+    assert ratelimit.LIMITERS["127.0.0.1"].concurrency.limit == 4
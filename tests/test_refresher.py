@@ -0,0 +1,210 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from conftest import FIXTURES  # type: ignore
+from utils import ratelimit, refresher, scraper  # type: ignore
+from utils import session as pooled  # type: ignore
+from utils.refresher import (  # type: ignore
+    REFRESH_AHEAD,
+    REFRESH_BATCH_SIZE,
+    REFRESH_RATE,
+    RefreshScheduler,
+)
+from utils.results import RESULT_TTLS  # type: ignore
+
+DAY = 24 * 60 * 60
+
+
+class FakeClock:
+    # sleeping moves the clock instead of waiting
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_scheduler(clock: FakeClock, series, expiries, refreshed, fail=()):
+    async def refresh(link: str):
+        refreshed.append(link)
+        if link in fail:
+            raise RuntimeError("upstream is down")
+        expiries[link] = clock.time() + DAY
+
+    async def get_series():
+        return series
+
+    async def get_expiries(links):
+        return {link: expiries[link] for link in links if link in expiries}
+
+    return RefreshScheduler(
+        refresh, get_series, get_expiries, clock.time, clock.sleep, lambda: 0.5
+    )
+
+
+def test_due_refreshes_most_bookmarked_first_and_skips_fresh_series():
+    clock = FakeClock()
+    series = [("/a", 1), ("/b", 5), ("/c", 3), ("/d", 2)]
+    expiries = {
+        "/a": clock.now + REFRESH_AHEAD - 1,
+        "/b": clock.now + 60,
+        "/c": clock.now + REFRESH_AHEAD + 60,
+    }
+    scheduler = make_scheduler(clock, series, expiries, [])
+    # /c isn't close to expiring, /d was never scraped
+    assert asyncio.run(scheduler.due(series)) == ["/b", "/d", "/a"]
+
+
+def test_due_is_capped_at_the_batch_size():
+    clock = FakeClock()
+    series = [(f"/{n}", n) for n in range(REFRESH_BATCH_SIZE + 10)]
+    scheduler = make_scheduler(clock, series, {}, [])
+    assert len(asyncio.run(scheduler.due(series))) == REFRESH_BATCH_SIZE
+
+
+def test_run_once_paces_the_refreshes():
+    clock = FakeClock()
+    series = [("/a", 2), ("/b", 1)]
+    refreshed: list[str] = []
+    scheduler = make_scheduler(clock, series, {}, refreshed)
+    asyncio.run(scheduler.run_once())
+    assert refreshed == ["/a", "/b"]
+    # the rng sits in the middle of the jitter range
+    assert clock.sleeps == [1 / REFRESH_RATE, 1 / REFRESH_RATE]
+    assert scheduler.stats() == {"due": 2, "refreshed": 2, "failed": 0}
+
+
+def test_a_restarted_scheduler_keeps_the_schedule():
+    clock = FakeClock()
+    series = [("/a", 2), ("/b", 1)]
+    expiries: dict[str, float] = {}
+    refreshed: list[str] = []
+    asyncio.run(make_scheduler(clock, series, expiries, refreshed).run_once())
+    assert refreshed == ["/a", "/b"]
+
+    # nothing is kept in memory, a new process reads the stored expiries
+    clock.now += 60
+    asyncio.run(make_scheduler(clock, series, expiries, refreshed).run_once())
+    assert refreshed == ["/a", "/b"]
+
+    clock.now += DAY - REFRESH_AHEAD
+    asyncio.run(make_scheduler(clock, series, expiries, refreshed).run_once())
+    assert refreshed == ["/a", "/b", "/a", "/b"]
+
+
+def test_a_failed_refresh_is_tried_again_on_the_next_scan():
+    clock = FakeClock()
+    series = [("/a", 2), ("/b", 1)]
+    refreshed: list[str] = []
+    scheduler = make_scheduler(clock, series, {}, refreshed, fail={"/a"})
+    asyncio.run(scheduler.run_once())
+    asyncio.run(scheduler.run_once())
+    assert refreshed == ["/a", "/b", "/a"]
+    assert scheduler.stats() == {"due": 1, "refreshed": 1, "failed": 2}
+
+
+def test_the_scheduler_task_refreshes_in_the_background(monkeypatch):
+    clock = FakeClock()
+    turns: list[str] = []
+    background: list[bool] = []
+
+    async def wait_turn(url: str):
+        turns.append(url)
+
+    async def refresh(link: str):
+        background.append(ratelimit.BACKGROUND.get())
+
+    async def get_series():
+        return [("/a", 1)]
+
+    async def get_expiries(links):
+        return {}
+
+    async def sleep(seconds: float):
+        if len(background) != 0:
+            raise asyncio.CancelledError()
+
+    monkeypatch.setattr(refresher, "wait_turn", wait_turn)
+
+    async def main():
+        scheduler = RefreshScheduler(
+            refresh, get_series, get_expiries, clock.time, sleep, lambda: 0.5
+        )
+        scheduler.start()
+        try:
+            await scheduler.task
+        except asyncio.CancelledError:
+            pass
+        # the readers keep their priority
+        assert not ratelimit.BACKGROUND.get()
+
+    asyncio.run(main())
+    assert background == [True]
+    # refreshes wait for a spare token before they join a flight
+    assert turns == [f"{scraper.MANGAPARK_BASE_URL}/a"]
+
+
+async def start_stand_in_server(requests: list[str]) -> tuple[web.AppRunner, str]:
+    html = (FIXTURES / "manga.html").read_text()
+
+    async def manga(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        return web.Response(text=html, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", manga)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def test_refreshes_against_a_stand_in_server(backend, monkeypatch):
+    link = "/title/1000-en-blue-lantern"
+
+    async def main():
+        await backend.setup()
+        requests: list[str] = []
+        runner, base_url = await start_stand_in_server(requests)
+        monkeypatch.setattr(scraper, "MANGAPARK_BASE_URL", base_url)
+        monkeypatch.setitem(
+            ratelimit.HOST_CONFIGS,
+            "127.0.0.1",
+            ratelimit.HostConfig(rate=1000, burst=1000, max_concurrency=8),
+        )
+        await pooled.start_session()
+        try:
+            # the stored results expire by the wall clock, the fake one starts there
+            clock = FakeClock(time.time())
+
+            async def get_series():
+                return [(link, 1)]
+
+            def scheduler():
+                return RefreshScheduler(
+                    get_series=get_series, clock=clock.time, sleep=clock.sleep
+                )
+
+            await scheduler().run_once()
+            assert requests == [link]
+
+            # a restart finds the stored result still fresh
+            await scheduler().run_once()
+            assert requests == [link]
+
+            clock.now += RESULT_TTLS["manga"].total_seconds() - REFRESH_AHEAD + 60
+            await scheduler().run_once()
+            assert requests == [link, link]
+        finally:
+            await pooled.close_session()
+            await runner.cleanup()
+
+    asyncio.run(main())
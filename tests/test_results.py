@@ -0,0 +1,73 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from utils import results  # type: ignore
+
+URL = "https://mangapark.com/title/1"
+
+
+class Scraper:
+    # counts the scrapes, each takes a while like a real one
+    def __init__(self, duration: float = 0.0, fail: bool = False):
+        self.duration = duration
+        self.fail = fail
+        self.calls = 0
+
+    async def __call__(self) -> dict[str, int]:
+        self.calls += 1
+        await asyncio.sleep(self.duration)
+        if self.fail:
+            raise RuntimeError("upstream is down")
+        return {"scrape": self.calls}
+
+
+def test_a_stored_result_is_read_back(backend):
+    scrape = Scraper()
+
+    async def main():
+        assert await results.shared_result("manga", URL, scrape) == {"scrape": 1}
+        assert await results.shared_result("manga", URL, scrape) == {"scrape": 1}
+        # a refresh goes upstream even with a fresh result stored
+        assert await results.shared_result("manga", URL, scrape, True) == {"scrape": 2}
+
+    asyncio.run(main())
+    assert scrape.calls == 2
+
+
+def test_waiters_read_the_result_of_the_lease_holder(backend):
+    scrape = Scraper(duration=0.3)
+
+    async def main():
+        return await asyncio.gather(
+            *(results.shared_result("manga", URL, scrape) for _ in range(3))
+        )
+
+    assert asyncio.run(main()) == [{"scrape": 1}] * 3
+    assert scrape.calls == 1
+
+
+def test_the_lease_is_released(backend):
+    async def main():
+        await results.shared_result("manga", URL, Scraper())
+        assert await backend.leases.count_documents({}) == 0
+        with pytest.raises(RuntimeError):
+            await results.shared_result("pages", URL, Scraper(fail=True))
+        assert await backend.leases.count_documents({}) == 0
+
+    asyncio.run(main())
+
+
+def test_a_scrape_longer_than_the_ttl_keeps_its_lease(backend, monkeypatch):
+    monkeypatch.setattr(results, "LEASE_TTL", timedelta(seconds=0.2))
+    scrape = Scraper(duration=0.8)
+
+    async def main():
+        first = asyncio.create_task(results.shared_result("manga", URL, scrape))
+        await asyncio.sleep(0.05)
+        second = await results.shared_result("manga", URL, scrape)
+        assert second == await first
+
+    asyncio.run(main())
+    assert scrape.calls == 1
@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+
+from utils import scraper, search_index  # type: ignore
+from utils.ratelimit import UpstreamError  # type: ignore
+from utils.scraper import Manga  # type: ignore
+from utils.search_index import (  # type: ignore
+    SEARCH_MIN_SCORE,
+    SearchIndex,
+    normalize,
+    search_manga,
+    trigrams,
+)
+
+
+def make_index(*names: str) -> SearchIndex:
+    index = SearchIndex()
+    for number, name in enumerate(names):
+        index.add(Manga(f"/title/{number}", name, ""))
+    return index
+
+
+def names(matches: list[tuple[float, Manga]]) -> list[str]:
+    return [manga.name for _, manga in matches]
+
+
+def every_score(
+    index: SearchIndex, query: str, limit: int
+) -> list[tuple[float, Manga]]:
+    # what search finds, scoring every series
+    query = normalize(query)
+    query_grams = trigrams(query)
+    matches = []
+    for link, name in index.names.items():
+        shared = len(query_grams & trigrams(name))
+        if shared != 0:
+            score = index.score(query, query_grams, link, shared)
+            matches.append((score, -len(name), link))
+    return [
+        (score, index.mangas[link])
+        for score, _, link in sorted(matches, reverse=True)[:limit]
+    ]
+
+
+def test_search_ranks_the_closest_names_first():
+    index = make_index("Blue Lagoon", "Red Lantern", "Blue Lantern", "One Piece")
+    matches = index.search("blue lanter", limit=3)
+    assert matches == every_score(index, "blue lanter", 3)
+    assert names(matches)[0] == "Blue Lantern" and "One Piece" not in names(matches)
+    assert matches[0][0] >= SEARCH_MIN_SCORE
+    # punctuation, case and accents don't count
+    assert names(index.search("BLUE-LÀNTERN!", limit=1)) == ["Blue Lantern"]
+    assert index.search("  ", limit=1) == []
+
+
+def test_typos_still_match():
+    index = make_index("Kimetsu no Yaiba", "Jujutsu Kaisen")
+    assert names(index.search("kimetsu no yiaba", limit=1)) == ["Kimetsu no Yaiba"]
+
+
+def test_a_prefix_scores_by_how_much_of_the_name_it_covers():
+    index = make_index("Blue Lantern", "Blue Lantern Side Stories", "Bluebird")
+    matches = index.search("blue lantern", limit=3)
+    assert names(matches) == ["Blue Lantern", "Blue Lantern Side Stories", "Bluebird"]
+    assert matches[0][0] == 1.0
+    # more than its trigrams alone would give it
+    side_stories = index.names["/title/1"]
+    query_grams = trigrams("blue lantern")
+    dice = (
+        2
+        * len(query_grams & trigrams(side_stories))
+        / (len(query_grams) + len(trigrams(side_stories)))
+    )
+    assert matches[1][0] == 0.5 + 0.5 * len("blue lantern") / len(side_stories)
+    assert matches[1][0] > dice
+
+
+def test_ties_go_to_the_shorter_name():
+    index = make_index("Blue Lantern Extra", "Blue Lantern Ex")
+    matches = index.search("lantern", limit=2)
+    assert names(matches) == ["Blue Lantern Ex", "Blue Lantern Extra"]
+
+
+def test_search_stops_once_nothing_can_beat_the_top(monkeypatch):
+    index = make_index(
+        "Blue Lantern",
+        "Blue Lantern Side Stories",
+        "Blue Lagoon",
+        *(f"Lane {number}" for number in range(200)),
+    )
+    scored: list[str] = []
+    score = index.score
+
+    def counted(query, query_grams, link, shared):
+        scored.append(link)
+        return score(query, query_grams, link, shared)
+
+    assert index.search("blue lantern", limit=3) == every_score(
+        index, "blue lantern", 3
+    )
+    monkeypatch.setattr(index, "score", counted)
+    index.search("blue lantern", limit=3)
+    # the series that only share "lan" are never scored
+    assert len(scored) < 10
+
+
+@pytest.fixture
+def empty_index(backend, monkeypatch):
+    monkeypatch.setattr(search_index, "_index", None)
+    return backend
+
+
+def upstream(monkeypatch, results=None, error=None) -> list[str]:
+    queries: list[str] = []
+
+    async def search_manga_links(query: str) -> list[Manga]:
+        queries.append(query)
+        if error is not None:
+            raise error
+        return results
+
+    monkeypatch.setattr(scraper, "search_manga_links", search_manga_links)
+    return queries
+
+
+def test_a_confident_match_is_answered_from_the_index(empty_index, monkeypatch):
+    queries = upstream(monkeypatch, [])
+
+    async def main():
+        await search_index.index_mangas([Manga("/title/1", "Blue Lantern", "")])
+        return await search_manga("blue lantern")
+
+    assert names([(1.0, manga) for manga in asyncio.run(main())]) == ["Blue Lantern"]
+    assert queries == []
+
+
+def test_a_weak_match_goes_upstream_and_is_indexed(empty_index, monkeypatch):
+    found = [Manga("/title/2", "Green Lantern Corps", "/cover.jpg")]
+    queries = upstream(monkeypatch, found)
+
+    async def main():
+        await search_index.index_mangas([Manga("/title/1", "Blue Lantern", "")])
+        assert await search_manga("green lantern corps") == found
+        # stored, a restart finds it in mongo
+        search_index._index = None
+        return await search_manga("green lantern corps")
+
+    assert asyncio.run(main())[0] == found[0]
+    assert queries == ["green lantern corps"]
+
+
+def test_the_fuzzy_matches_stand_in_when_upstream_fails(empty_index, monkeypatch):
+    queries = upstream(monkeypatch, error=UpstreamError("/search", 503))
+
+    async def main():
+        await search_index.index_mangas([Manga("/title/1", "Blue Lantern", "")])
+        assert [m.name for m in await search_manga("blu lanten")] == ["Blue Lantern"]
+        # nothing to fall back on
+        with pytest.raises(UpstreamError):
+            await search_manga("one piece")
+
+    asyncio.run(main())
+    assert queries == ["blu lanten", "one piece"]
+
+
+def test_the_fuzzy_matches_stand_in_when_upstream_finds_nothing(
+    empty_index, monkeypatch
+):
+    upstream(monkeypatch, [])
+
+    async def main():
+        await search_index.index_mangas([Manga("/title/1", "Blue Lantern", "")])
+        return await search_manga("blu lanten")
+
+    assert [manga.name for manga in asyncio.run(main())] == ["Blue Lantern"]
@@ -0,0 +1,60 @@
+import asyncio
+
+import discord
+import pytest
+
+from utils import shards  # type: ignore
+from utils.shards import ShardConfig  # type: ignore
+
+
+@pytest.mark.parametrize(
+    "text, shard_ids",
+    [
+        ("3", [3]),
+        ("0-3", [0, 1, 2, 3]),
+        ("4,5,7", [4, 5, 7]),
+        ("0-1, 6-7", [0, 1, 6, 7]),
+    ],
+)
+def test_parse_shard_ids(text, shard_ids):
+    assert shards.parse_shard_ids(text) == shard_ids
+
+
+def test_split_shards_hands_out_contiguous_ranges():
+    assert shards.split_shards(10, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert shards.split_shards(4, 4) == [[0], [1], [2], [3]]
+    # every shard is run by exactly one process
+    ranges = shards.split_shards(37, 5)
+    assert sum(ranges, []) == list(range(37))
+
+
+def test_shard_config_from_env(monkeypatch):
+    monkeypatch.setenv("SHARD_COUNT", "8")
+    monkeypatch.setenv("SHARD_IDS", "4-7")
+    monkeypatch.setenv("PROCESS_INDEX", "1")
+    monkeypatch.setenv("PROCESS_COUNT", "2")
+    config = shards.shard_config_from_env()
+    assert config == ShardConfig(8, [4, 5, 6, 7], 1, 2)
+    assert config.sharded and not config.primary
+
+
+def make_bot(config: ShardConfig) -> discord.Bot:
+    # the client binds to the running loop, it never connects here
+    async def main():
+        bot = shards.make_bot(config)
+        await bot.close()
+        return bot
+
+    return asyncio.run(main())
+
+
+def test_make_bot_runs_every_shard_when_unsharded():
+    bot = make_bot(ShardConfig())
+    assert not isinstance(bot, discord.AutoShardedBot)
+    assert ShardConfig().primary
+
+
+def test_make_bot_runs_the_given_shards():
+    bot = make_bot(ShardConfig(shard_count=8, shard_ids=[2, 3]))
+    assert isinstance(bot, discord.AutoShardedBot)
+    assert bot.shard_count == 8 and bot.shard_ids == [2, 3]
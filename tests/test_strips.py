@@ -0,0 +1,92 @@
+import asyncio
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+
+import pytest
+from PIL import Image
+
+from utils import attachments, bot_util, image_store, strips  # type: ignore
+
+CHAPTER = "/title/1/1"
+PAGES = [f"https://s01.mpfiles.org/media/{page}.jpg" for page in range(3)]
+
+
+class FakeMessage:
+    def __init__(self, files: list[Any]):
+        self.attachments = [
+            type("Attachment", (), {"url": f"https://cdn.example/{file.filename}"})
+            for file in files
+        ]
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent: list[list[str]] = []
+
+    async def send(self, files: list[Any]) -> FakeMessage:
+        self.sent.append([file.filename for file in files])
+        return FakeMessage(files)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # every page is a tall noisy jpeg, written once to the store
+    page_store = image_store.ImageStore(tmp_path / "pages", 1024**3)
+    monkeypatch.setattr(image_store, "IMAGE_STORE", page_store)
+
+    async def fetch_image_path(url: str) -> Path:
+        image = Image.effect_noise((400, 3500), 64).convert("RGB")
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=90)
+        return await page_store.put(output.getvalue(), "jpg")
+
+    monkeypatch.setattr(bot_util, "fetch_image_path", fetch_image_path)
+    strips.STRIP_CACHE.clear()
+    attachments.ATTACHMENT_CACHE.clear()
+    yield page_store
+    strips.STRIP_CACHE.clear()
+    attachments.ATTACHMENT_CACHE.clear()
+    attachments.CACHE_CHANNELS.clear()
+
+
+def test_strips_are_kept_on_disk(store):
+    strip = asyncio.run(strips.get_strip(CHAPTER, PAGES, 0))
+    # a 3500 px page each, only one fits under the strip height
+    assert len(strip) == 3
+    assert all(path.parent.parent == store.root for path in strip)
+    assert strips.STRIP_CACHE.get((CHAPTER, 0)) == strip
+
+
+def test_parts_over_the_upload_limit_are_left_out(store, backend, monkeypatch):
+    strip = asyncio.run(strips.get_strip(CHAPTER, PAGES, 0))
+    limit = sum(path.stat().st_size for path in strip[:2])
+    monkeypatch.setattr(strips, "STRIP_UPLOAD_LIMIT", limit)
+    image_urls, files, left_out = asyncio.run(strips.load_strip(CHAPTER, PAGES, 0))
+    assert len(files) == 2 and left_out == 1
+    assert image_urls == [f"attachment://{file.filename}" for file in files]
+
+
+def test_an_evicted_strip_is_stitched_again(store):
+    strip = asyncio.run(strips.get_strip(CHAPTER, PAGES, 0))
+    strip[1].unlink()
+    files, left_out = asyncio.run(strips.get_strip_files(CHAPTER, PAGES, 0))
+    assert len(files) == 3 and left_out == 0
+
+
+def test_whole_strips_are_uploaded_once_then_linked(store, backend):
+    channel = FakeChannel()
+    attachments.CACHE_CHANNELS.append(channel)
+
+    async def main():
+        image_urls, files, _ = await strips.load_strip(CHAPTER, PAGES, 0)
+        assert files == []
+        assert image_urls == [
+            f"https://cdn.example/strip_{part}.jpg" for part in range(3)
+        ]
+
+        attachments.ATTACHMENT_CACHE.clear()
+        assert (await strips.load_strip(CHAPTER, PAGES, 0))[0] == image_urls
+        assert len(channel.sent) == 1
+
+    asyncio.run(main())